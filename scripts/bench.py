@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+"""Reproducible retrieval and end-to-end benchmarks.
+
+    python3 scripts/bench.py run --sizes 1k,10k --out bench.json
+    python3 scripts/bench.py run --sizes 1k,10k --baseline bench.json --threshold 0.15
+    python3 scripts/bench.py http --spawn --concurrency 8 --duration 20 --out http.json
+    python3 scripts/bench.py compare old.json new.json --threshold 0.10
+
+`run` generates a synthetic finance-like corpus per size (1k, 10k, 100k, 1m
+chunks; fixed seed, so every run indexes the same text) and measures, each
+size in a fresh subprocess so peak RSS is its own: fit time, peak RSS, saved
+index size and load time, single-query and batched (query_many) latency
+percentiles and QPS, and LocalAnswerComposer.compose / evaluate_answer
+latency on the retrieved contexts. `http` drives POST /ask on a running
+rag_server (or one it spawns) from keep-alive client threads.
+
+Results are JSON. `compare` (or `run --baseline`) flags every timing, size
+or memory figure that got worse than the baseline by more than `threshold`
+(QPS: dropped by more than it) and exits with status 1 if any did.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT / "src"))
+
+from rag.chunker import chunk_bounds
+from rag.vector_store import DocumentStore
+from llm.local import LocalAnswerComposer
+from eval.metrics import evaluate_answer
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# --- synthetic corpus -------------------------------------------------------
+
+SECTORS = ["technology", "energy", "utilities", "healthcare", "financials", "industrials",
+           "consumer staples", "real estate", "materials", "telecommunications"]
+METRICS = ["revenue", "net income", "operating margin", "free cash flow", "EBITDA",
+           "earnings per share", "gross margin", "capital expenditure", "net interest income",
+           "operating cash flow", "return on equity", "book value per share"]
+RISKS = ["interest rate volatility", "foreign exchange exposure", "supply chain disruptions",
+         "cybersecurity incidents", "regulatory changes", "credit losses", "liquidity shortfalls",
+         "commodity price swings", "counterparty default", "litigation", "inflationary pressure",
+         "customer concentration", "pension obligations", "goodwill impairment"]
+MACRO = ["rising inflation", "tighter monetary policy", "a flattening yield curve", "slowing consumer demand",
+         "wage growth", "a stronger dollar", "easing credit spreads", "recession concerns",
+         "higher energy prices", "fiscal stimulus"]
+DRIVERS = ["pricing actions", "volume growth", "cost discipline", "new product launches", "acquisitions",
+           "share repurchases", "lower input costs", "higher deposit betas", "improved utilization"]
+INSTRUMENTS = ["Treasury bonds", "investment-grade credit", "high-yield bonds", "municipal bonds",
+               "dividend equities", "money market funds", "floating-rate notes", "covered calls"]
+UP = ["increased", "rose", "grew", "expanded", "improved"]
+DOWN = ["declined", "fell", "contracted", "narrowed", "weakened"]
+SYLLABLES = ["ar", "cor", "del", "fin", "gen", "hal", "in", "lum", "mer", "nor", "ob", "pra",
+             "quan", "ros", "sol", "ter", "ul", "ver", "west", "zen"]
+SUFFIXES = ["Holdings", "Capital", "Industries", "Group", "Energy", "Bancorp", "Systems", "Partners"]
+
+
+def _company(rng: random.Random) -> Tuple[str, str]:
+    name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+    return f"{name} {rng.choice(SUFFIXES)}", name[:4].upper()
+
+
+def _period(rng: random.Random) -> str:
+    return f"Q{rng.randint(1, 4)} {rng.randint(2015, 2024)}"
+
+
+def _sentence(rng: random.Random, company: str, ticker: str) -> str:
+    kind = rng.randrange(7)
+    if kind == 0:
+        up = rng.random() < 0.6
+        return (f"{company} ({ticker}) reported {rng.choice(METRICS)} of ${rng.uniform(5, 9000):,.1f} million "
+                f"for {_period(rng)}, {'up' if up else 'down'} {rng.uniform(0.2, 35):.1f}% year over year.")
+    if kind == 1:
+        return (f"Management expects {rng.choice(METRICS)} to {rng.choice(['improve', 'stabilize', 'moderate'])} "
+                f"as {rng.choice(DRIVERS)} offset {rng.choice(MACRO)}.")
+    if kind == 2:
+        a, b, c = rng.sample(RISKS, 3)
+        return f"Risk factors include {a}, {b} and {c}."
+    if kind == 3:
+        return (f"The {rng.choice(SECTORS)} sector {rng.choice(UP + DOWN)} {rng.uniform(0.1, 12):.1f}% "
+                f"amid {rng.choice(MACRO)}.")
+    if kind == 4:
+        return (f"The portfolio allocates {rng.randint(5, 60)}% to {rng.choice(INSTRUMENTS)} and "
+                f"{rng.randint(5, 40)}% to {rng.choice(INSTRUMENTS)} to manage {rng.choice(RISKS)}.")
+    if kind == 5:
+        return (f"{rng.choice(METRICS).capitalize()} {rng.choice(UP + DOWN)} to "
+                f"{rng.uniform(1, 60):.1f}% on {rng.choice(DRIVERS)}.")
+    return (f"We believe {rng.choice(MACRO)} will weigh on {rng.choice(SECTORS)} valuations "
+            f"through {_period(rng)}.")
+
+
+def synth_document(seed: int, n_words: int) -> str:
+    """One filing-like document of about `n_words` words; depends only on `seed`."""
+    rng = random.Random(seed)
+    company, ticker = _company(rng)
+    paragraphs, words = [], 0
+    while words < n_words:
+        para = " ".join(_sentence(rng, company, ticker) for _ in range(rng.randint(2, 6)))
+        paragraphs.append(para)
+        words += len(para.split())
+    return "\n".join(paragraphs)
+
+
+def synth_corpus(n_chunks: int, chunk_size: int, chunk_overlap: int, seed: int) -> Tuple[List[str], List[Dict]]:
+    """Documents that chunk into exactly `n_chunks` chunks. Document i depends only
+    on (seed, i), so a smaller corpus is a prefix of a larger one."""
+    docs, metas, total = [], [], 0
+    i = 0
+    while total < n_chunks:
+        rng = random.Random(seed * 1_000_003 + i)
+        doc = synth_document(rng.getrandbits(63), rng.randint(chunk_size // 2, chunk_size * 6))
+        n = sum(1 for _ in chunk_bounds(len(doc.split()), chunk_size, chunk_overlap))
+        if total + n > n_chunks:
+            # Trim the last document to land on the exact chunk count.
+            keep = max(1, n_chunks - total)
+            doc = " ".join(doc.split()[:chunk_size + (keep - 1) * (chunk_size - chunk_overlap)])
+            n = sum(1 for _ in chunk_bounds(len(doc.split()), chunk_size, chunk_overlap))
+        docs.append(doc)
+        metas.append({"source": f"synthetic/{seed}/{i:07d}.txt"})
+        total += n
+        i += 1
+    return docs, metas
+
+
+def synth_queries(n: int, seed: int) -> List[str]:
+    rng = random.Random(seed ^ 0x5EED)
+    templates = [
+        lambda: f"What was {rng.choice(METRICS)} in {_period(rng)}?",
+        lambda: f"Which risk factors mention {rng.choice(RISKS)}?",
+        lambda: f"How did the {rng.choice(SECTORS)} sector perform amid {rng.choice(MACRO)}?",
+        lambda: f"What is the outlook for {rng.choice(METRICS)} given {rng.choice(DRIVERS)}?",
+        lambda: f"How much of the portfolio is in {rng.choice(INSTRUMENTS)}?",
+    ]
+    return [rng.choice(templates)() for _ in range(n)]
+
+
+# --- measurement helpers ----------------------------------------------------
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def latency_stats(seconds: List[float], items: Optional[int] = None) -> Dict:
+    """p50/p95/p99/mean in ms and throughput (items, default one per sample, per second)."""
+    s = sorted(seconds)
+    total = sum(s)
+    return {
+        "samples": len(s),
+        "p50_ms": 1000 * percentile(s, 0.50),
+        "p95_ms": 1000 * percentile(s, 0.95),
+        "p99_ms": 1000 * percentile(s, 0.99),
+        "mean_ms": 1000 * total / len(s) if s else 0.0,
+        "qps": (items if items is not None else len(s)) / total if total else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS.
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def _timed(fn, *args) -> float:
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+# --- retrieval benchmark (one size per process) -----------------------------
+
+def bench_size(n_chunks: int, args) -> Dict:
+    t0 = time.perf_counter()
+    docs, metas = synth_corpus(n_chunks, args.chunk_size, args.chunk_overlap, args.seed)
+    gen_s = time.perf_counter() - t0
+    corpus_bytes = sum(len(d.encode("utf-8")) for d in docs)
+    rss_corpus = peak_rss_mb()
+
+    store = DocumentStore(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, backend=args.backend)
+    fit_s = _timed(store.fit, docs, metas)
+    del docs
+    out = {
+        "chunks": len(store.docs),
+        "corpus_bytes": corpus_bytes,
+        "generate_s": gen_s,
+        "fit_s": fit_s,
+        "fit_chunks_per_s": len(store.docs) / fit_s if fit_s else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_corpus_mb": rss_corpus,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.idx"
+        out["save_s"] = _timed(store.save, path)
+        out["index_bytes"] = path.stat().st_size
+        t0 = time.perf_counter()
+        DocumentStore.load(path, mmap=True)
+        out["load_s"] = time.perf_counter() - t0
+
+    queries = synth_queries(args.queries, args.seed)
+    for q in queries[:args.warmup]:
+        store.query(q, top_k=args.top_k)
+    single = [_timed(store.query, q, args.top_k) for q in queries]
+    out["query"] = latency_stats(single)
+
+    batches = [queries[i:i + args.batch] for i in range(0, len(queries), args.batch)]
+    batched = [_timed(store.query_many, b, args.top_k) for b in batches]
+    out["query_batch"] = {**latency_stats(batched, items=len(queries)), "batch": args.batch}
+
+    composer = LocalAnswerComposer()
+    compose_s, eval_s = [], []
+    for q in queries:
+        contexts = [{"score": s, "text": d["text"], "source": d["meta"].get("source", "unknown"),
+                     "sentences": d.get("sentences")} for s, d in store.query(q, top_k=args.top_k)]
+        t0 = time.perf_counter()
+        answer = composer.compose(q, contexts)["answer"]
+        t1 = time.perf_counter()
+        evaluate_answer(answer, [c["text"] for c in contexts])
+        compose_s.append(t1 - t0)
+        eval_s.append(time.perf_counter() - t1)
+    out["compose"] = latency_stats(compose_s)
+    out["evaluate"] = latency_stats(eval_s)
+    out["peak_rss_mb"] = peak_rss_mb()
+    return out
+
+
+def _settings(args) -> Dict:
+    return {k: getattr(args, k) for k in ("seed", "chunk_size", "chunk_overlap", "backend", "queries",
+                                          "warmup", "batch", "top_k")}
+
+
+def cmd_run(args) -> int:
+    sizes = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    report = {"kind": "retrieval", "env": environment(), "settings": _settings(args), "results": {}}
+    for size in sizes:
+        n = SIZES.get(size) or int(size)
+        print(f"[bench] {size}: {n} chunks…", file=sys.stderr)
+        cmd = [sys.executable, __file__, "_size", str(n)] + _passthrough(args)
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            report["results"][size] = {"error": proc.stderr.strip().splitlines()[-1:] or ["failed"]}
+            continue
+        report["results"][size] = json.loads(proc.stdout)
+        r = report["results"][size]
+        print(f"[bench] {size}: fit {r['fit_s']:.2f}s, rss {r['peak_rss_mb']:.0f} MB, "
+              f"query p50 {r['query']['p50_ms']:.2f} ms / p99 {r['query']['p99_ms']:.2f} ms, "
+              f"{r['query']['qps']:.0f} qps (batched {r['query_batch']['qps']:.0f})", file=sys.stderr)
+    return _emit(report, args)
+
+
+def _passthrough(args) -> List[str]:
+    return ["--seed", str(args.seed), "--chunk-size", str(args.chunk_size), "--chunk-overlap",
+            str(args.chunk_overlap), "--backend", args.backend, "--queries", str(args.queries),
+            "--warmup", str(args.warmup), "--batch", str(args.batch), "--top-k", str(args.top_k)]
+
+
+def cmd_size(args) -> int:
+    print(json.dumps(bench_size(args.chunks, args)))
+    return 0
+
+
+# --- HTTP load generator ----------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_healthy(host: str, port: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def load_test(host: str, port: int, queries: List[str], concurrency: int, duration: float,
+              repeat_queries: bool) -> Dict:
+    """POST /ask from `concurrency` keep-alive client threads for `duration` seconds.
+    Unless `repeat_queries`, every request gets a unique suffix so the server's
+    query cache does not answer it."""
+    latencies: List[List[float]] = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    deadline = time.monotonic() + duration
+
+    def client(n: int):
+        rng = random.Random(n)
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        i = 0
+        while time.monotonic() < deadline:
+            q = rng.choice(queries)
+            if not repeat_queries:
+                q = f"{q} r{n}x{i}"
+            i += 1
+            body = json.dumps({"query": q})
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", "/ask", body, {"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                resp.read()
+                ok = resp.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+            if ok:
+                latencies[n].append(time.perf_counter() - t0)
+            else:
+                errors[n] += 1
+        conn.close()
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    all_lat = [x for lat in latencies for x in lat]
+    stats = latency_stats(all_lat)
+    stats["qps"] = len(all_lat) / wall if wall else 0.0  # offered concurrency, so wall-clock throughput
+    return {**stats, "errors": sum(errors), "concurrency": concurrency, "duration_s": wall}
+
+
+def cmd_http(args) -> int:
+    server = None
+    if args.spawn:
+        port = _free_port()
+        server = subprocess.Popen([sys.executable, str(ROOT / "src" / "server" / "rag_server.py"),
+                                   "--host", "127.0.0.1", "--port", str(port)],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        host = "127.0.0.1"
+    else:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    try:
+        if not _wait_healthy(host, port, args.startup_timeout):
+            print(f"[bench] server at {host}:{port} did not become healthy", file=sys.stderr)
+            return 2
+        queries = synth_queries(max(args.queries, 1), args.seed)
+        report = {"kind": "http", "env": environment(),
+                  "settings": {"seed": args.seed, "concurrency": args.concurrency, "duration": args.duration,
+                               "repeat_queries": args.repeat_queries, "spawned": bool(server)},
+                  "results": {"ask": load_test(host, port, queries, args.concurrency, args.duration,
+                                               args.repeat_queries)}}
+        r = report["results"]["ask"]
+        print(f"[bench] /ask: {r['qps']:.0f} qps, p50 {r['p50_ms']:.2f} ms, p99 {r['p99_ms']:.2f} ms, "
+              f"{r['errors']} errors", file=sys.stderr)
+        return _emit(report, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+# --- regression check -------------------------------------------------------
+
+# Suffixes of compared figures; everything else (counts, settings) is informational.
+LOWER_IS_BETTER = ("_s", "_ms", "_mb", "_bytes")
+HIGHER_IS_BETTER = ("qps", "_per_s")
+# Harness bookkeeping, not properties of the code under test.
+INFORMATIONAL = {"generate_s", "peak_rss_corpus_mb", "duration_s"}
+
+
+def _flatten(obj, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for k, v in obj.items():
+        key = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            flat.update(_flatten(v, key))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            flat[key] = float(v)
+    return flat
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[Dict]:
+    """Figures in both reports that regressed by more than `threshold` (a fraction)."""
+    base, cur = _flatten(baseline.get("results", {})), _flatten(current.get("results", {}))
+    regressions = []
+    for key in sorted(base.keys() & cur.keys()):
+        b, c = base[key], cur[key]
+        name = key.rsplit(".", 1)[-1]
+        if name in INFORMATIONAL:
+            continue
+        if name.endswith(HIGHER_IS_BETTER):
+            worse = b > 0 and c < b * (1 - threshold)
+        elif name.endswith(LOWER_IS_BETTER):
+            worse = c > b * (1 + threshold) if b > 0 else c > 0
+        else:
+            continue
+        if worse:
+            regressions.append({"metric": key, "baseline": b, "current": c,
+                                "change": (c - b) / b if b else float("inf")})
+    return regressions
+
+
+def _report_regressions(regressions: List[Dict], threshold: float) -> int:
+    if not regressions:
+        print(f"[bench] no regressions beyond {threshold:.0%}", file=sys.stderr)
+        return 0
+    print(f"[bench] {len(regressions)} regression(s) beyond {threshold:.0%}:", file=sys.stderr)
+    for r in regressions:
+        print(f"  {r['metric']}: {r['baseline']:.6g} -> {r['current']:.6g} ({r['change']:+.1%})", file=sys.stderr)
+    return 1
+
+
+def _emit(report: Dict, args) -> int:
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if getattr(args, "baseline", None):
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        return _report_regressions(compare(baseline, report, args.threshold), args.threshold)
+    return 0
+
+
+def cmd_compare(args) -> int:
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    current = json.loads(Path(args.current).read_text(encoding="utf-8"))
+    return _report_regressions(compare(baseline, current, args.threshold), args.threshold)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def retrieval_opts(p):
+        p.add_argument("--seed", type=int, default=1234)
+        p.add_argument("--chunk-size", type=int, default=600)
+        p.add_argument("--chunk-overlap", type=int, default=80)
+        p.add_argument("--backend", default="dict", choices=("dict", "csr"))
+        p.add_argument("--queries", type=int, default=200, help="timed queries per size")
+        p.add_argument("--warmup", type=int, default=20)
+        p.add_argument("--batch", type=int, default=32, help="queries per query_many call")
+        p.add_argument("--top-k", type=int, default=4)
+
+    def output_opts(p):
+        p.add_argument("--out", help="write the JSON report here instead of stdout")
+        p.add_argument("--baseline", help="compare against this report; exit 1 on regressions")
+        p.add_argument("--threshold", type=float, default=0.10, help="allowed regression, e.g. 0.10 = 10%%")
+
+    p = sub.add_parser("run", help="retrieval benchmarks on synthetic corpora")
+    p.add_argument("--sizes", default="1k,10k",
+                   help="comma-separated: 1k,10k,100k,1m or chunk counts (1m at the default 600-token "
+                        "chunks is ~600M tokens; use a smaller --chunk-size for it)")
+    retrieval_opts(p)
+    output_opts(p)
+    p.set_defaults(fn=cmd_run)
+
+    p = sub.add_parser("_size")  # internal: one size in this process, JSON on stdout
+    p.add_argument("chunks", type=int)
+    retrieval_opts(p)
+    p.set_defaults(fn=cmd_size)
+
+    p = sub.add_parser("http", help="load-test POST /ask on rag_server")
+    p.add_argument("--url", default="http://127.0.0.1:4000")
+    p.add_argument("--spawn", action="store_true", help="start rag_server on a free port for the run")
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--duration", type=float, default=10.0, help="seconds")
+    p.add_argument("--queries", type=int, default=200, help="distinct query templates to draw from")
+    p.add_argument("--repeat-queries", action="store_true", help="let the server's query cache answer repeats")
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--startup-timeout", type=float, default=120.0)
+    output_opts(p)
+    p.set_defaults(fn=cmd_http)
+
+    p = sub.add_parser("compare", help="compare two reports; exit 1 on regressions")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=0.10)
+    p.set_defaults(fn=cmd_compare)
+
+    args = ap.parse_args(argv)
+    return args.fn(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
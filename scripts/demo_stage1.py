@@ -33,9 +33,10 @@ def main():
         "What market outlook was discussed regarding inflation?",
     ]
 
-    for q in queries:
+    # One batched retrieval pass; answers are composed on a thread pool.
+    results = rag.answer_many(queries, top_k=4)
+    for q, result in zip(queries, results):
         print("\n=== Query ===\n" + q)
-        result = rag.answer(q, top_k=4)
         print("\n--- Answer ---\n" + result["answer"]) 
         print("\n--- Citations ---")
         for c in result["citations"]:
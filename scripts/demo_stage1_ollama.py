@@ -52,6 +52,12 @@ def main():
         else:
             print("(no explicit [n] citations detected in model output)")
 
+        packing = result.get("packing")
+        if packing:
+            print(f"\n--- Prompt ---\n{packing['prompt_tokens']} tokens (~{packing['prompt_chars']} chars), "
+                  f"{packing['packed_chunks']}/{packing['candidates']} chunks packed, "
+                  f"{packing['truncated_chunks']} truncated, {packing['duplicate_chunks']} duplicate")
+
         metrics = evaluate_answer(result["answer"], [c["text"] for c in result["contexts"]])
         print("\n--- Evaluation ---")
         for k, v in metrics.items():
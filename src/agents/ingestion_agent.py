@@ -1,16 +1,46 @@
 from pathlib import Path
-from typing import List
-from data.loader import load_and_clean
+from typing import Dict, Optional
+from data.loader import load_changes
+from rag.ingest import ingest_files
+from rag.vector_store import DocumentStore
 
 
 class IngestionAgent:
-    """Stage 3: Pulls documents from a folder or source and refreshes the index."""
+    """Stage 3: Pulls documents from a folder or source and refreshes the index.
 
-    def __init__(self, raw_dir: Path, clean_dir: Path):
+    Only new, changed or deleted files (per the loader's manifest) are cleaned
+    and, when a live `store` is given, pushed into it; unchanged documents keep
+    their existing chunks and weights. With workers > 1 the changed files are
+    read, cleaned, chunked and tokenized in a process pool (see rag.ingest).
+    """
+
+    def __init__(self, raw_dir: Path, clean_dir: Path, store: Optional[DocumentStore] = None,
+                 workers: int = 1, batch_size: int = 16):
         self.raw_dir = raw_dir
         self.clean_dir = clean_dir
+        self.store = store
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def run(self) -> Dict:
+        """Returns the loader delta: added/changed docs, removed/unchanged paths.
 
-    def run(self) -> List[dict]:
-        docs = load_and_clean(self.raw_dir, self.clean_dir)
-        return docs
+        In parallel mode added/changed docs carry no "content"; it went straight
+        into the store.
+        """
+        parallel = self.store is not None and self.workers != 1
+        delta = load_changes(self.raw_dir, self.clean_dir, clean=not parallel)
+        if parallel:
+            for path in delta["removed"] + [d["path"] for d in delta["changed"]]:
+                self.store.remove_documents(path)
+            jobs = ((d["raw"], d["path"]) for d in delta["added"] + delta["changed"])
+            ingest_files(self.store, jobs, workers=self.workers, batch_size=self.batch_size)
+        elif self.store is not None:
+            self.apply(delta)
+        return delta
 
+    def apply(self, delta: Dict):
+        for path in delta["removed"]:
+            self.store.remove_documents(path)
+        for d in delta["added"] + delta["changed"]:
+            self.store.update_document(d["path"], d["content"], {"source": d["path"]})
@@ -1,15 +1,86 @@
+import hashlib
+import json
 from pathlib import Path
 from typing import List, Dict
 from utils.text import normalize_whitespace
 
 
-def load_and_clean(raw_dir: Path, clean_dir: Path) -> List[Dict]:
-    docs = []
+def manifest_path(clean_dir: Path) -> Path:
+    """The manifest lives next to the clean folder, e.g. data/clean.manifest.json."""
+    clean_dir = Path(clean_dir)
+    return clean_dir.with_name(clean_dir.name + ".manifest.json")
+
+
+def _read_manifest(path: Path) -> Dict[str, Dict]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(path: Path, manifest: Dict[str, Dict]):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def clean_text(raw: bytes) -> str:
+    # Same decoding and newline translation as read_text(), then whitespace cleanup.
+    text = raw.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+    return normalize_whitespace(text)
+
+
+def load_changes(raw_dir: Path, clean_dir: Path, clean: bool = True) -> Dict:
+    """Clean only new or modified raw files and report what changed.
+
+    Each raw file is recorded in the manifest with its size, mtime and SHA-256.
+    A file whose size and mtime match is skipped without being read; one whose
+    stat changed but whose hash did not is only re-stamped. Returns a delta:
+    {"added": [doc], "changed": [doc], "removed": [clean path], "unchanged": [clean path]},
+    where doc is {"path": clean path, "raw": raw path, "content": cleaned text}.
+    With clean=False, added/changed files are only detected; "content" is
+    omitted and writing the clean copy is left to the caller (see rag.ingest).
+    """
+    raw_dir, clean_dir = Path(raw_dir), Path(clean_dir)
+    mpath = manifest_path(clean_dir)
+    old = _read_manifest(mpath)
+    manifest = {}
+    delta = {"added": [], "changed": [], "removed": [], "unchanged": []}
     for path in sorted(raw_dir.glob("**/*.txt")):
-        text = path.read_text(encoding="utf-8", errors="ignore")
-        clean = normalize_whitespace(text)
+        key = path.relative_to(raw_dir).as_posix()
         out = clean_dir / path.name
-        out.write_text(clean, encoding="utf-8")
-        docs.append({"path": str(out), "content": clean})
-    return docs
+        st = path.stat()
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "clean": str(out)}
+        prev = old.get(key)
+        if prev and out.exists() and (prev["size"], prev["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+            manifest[key] = prev
+            delta["unchanged"].append(str(out))
+            continue
+        raw = path.read_bytes()
+        entry["sha256"] = hashlib.sha256(raw).hexdigest()
+        manifest[key] = entry
+        if prev and out.exists() and prev.get("sha256") == entry["sha256"]:
+            delta["unchanged"].append(str(out))
+            continue
+        doc = {"path": str(out), "raw": str(path)}
+        if clean:
+            doc["content"] = clean_text(raw)
+            out.write_text(doc["content"], encoding="utf-8")
+        delta["changed" if prev else "added"].append(doc)
+    live = {e["clean"] for e in manifest.values()}
+    for key, prev in old.items():
+        if key not in manifest:
+            if prev["clean"] not in live and Path(prev["clean"]).exists():
+                Path(prev["clean"]).unlink()
+            delta["removed"].append(prev["clean"])
+    _write_manifest(mpath, manifest)
+    return delta
 
+
+def load_and_clean(raw_dir: Path, clean_dir: Path) -> List[Dict]:
+    delta = load_changes(raw_dir, clean_dir)
+    docs = delta["added"] + delta["changed"]
+    for out in delta["unchanged"]:
+        docs.append({"path": out, "content": Path(out).read_text(encoding="utf-8")})
+    docs.sort(key=lambda d: d["path"])
+    return docs
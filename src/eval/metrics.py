@@ -1,45 +1,175 @@
+import itertools
+import json
+import os
+import queue
 import re
-from typing import Dict, List
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from utils.text import tokenize
 
+# Answer sentences sharing less than this fraction of their tokens with the sources are flagged.
+UNSUPPORTED_THRESHOLD = 0.35
 
-def _tokenize_simple(text: str) -> List[str]:
-    return re.findall(r"[A-Za-z0-9]+", text.lower())
 
+def _split_answer(answer: str) -> List[str]:
+    return re.split(r"(?<=[.!?])\s+", answer.strip())
 
-def support_coverage(answer: str, sources: List[str]) -> float:
-    """Fraction of answer tokens present in any source string."""
-    a_toks = set(_tokenize_simple(answer))
-    if not a_toks:
-        return 0.0
+
+def source_tokens(sources: Iterable[str]) -> Set[str]:
     s_toks = set()
     for s in sources:
-        s_toks.update(_tokenize_simple(s))
-    return len(a_toks & s_toks) / max(1, len(a_toks))
+        s_toks.update(tokenize(s))
+    return s_toks
 
 
-def unsupported_sentences(answer: str, sources: List[str]) -> List[str]:
-    """Return sentences with low lexical overlap to sources (likely hallucinations)."""
-    sentences = re.split(r"(?<=[.!?])\s+", answer.strip())
-    bad = []
+def context_tokens(contexts: Iterable[Dict]) -> Set[str]:
+    """Token set of retrieved contexts, built once per request. Contexts carrying
+    precomputed sentence data (rag.sentences.ChunkSentences, see
+    RagPipeline._contexts) reuse its per-chunk token set instead of re-tokenizing."""
     s_toks = set()
-    for s in sources:
-        s_toks.update(_tokenize_simple(s))
-    for sent in sentences:
-        a_toks = set(_tokenize_simple(sent))
+    for c in contexts:
+        sents = c.get("sentences")
+        s_toks.update(sents.tokens if sents is not None else tokenize(c["text"]))
+    return s_toks
+
+
+def grounding(answer: str, s_toks: Set[str]) -> Dict:
+    """evaluate_answer() against a prebuilt source token set; the answer is
+    tokenized once, sentence by sentence."""
+    bad = []
+    a_all = set()
+    for sent in _split_answer(answer):
+        a_toks = set(tokenize(sent))
         if not a_toks:
             continue
-        overlap = len(a_toks & s_toks) / max(1, len(a_toks))
-        if overlap < 0.35:  # heuristic threshold
+        a_all |= a_toks
+        if len(a_toks & s_toks) / len(a_toks) < UNSUPPORTED_THRESHOLD:
             bad.append(sent)
-    return bad
-
-
-def evaluate_answer(answer: str, sources: List[str]) -> Dict:
-    cov = support_coverage(answer, sources)
-    bad = unsupported_sentences(answer, sources)
     return {
-        "support_coverage": cov,
+        "support_coverage": len(a_all & s_toks) / len(a_all) if a_all else 0.0,
         "unsupported_sentence_count": len(bad),
         "unsupported_sentences": bad,
     }
 
+
+def support_coverage(answer: str, sources: List[str]) -> float:
+    """Fraction of answer tokens present in any source string."""
+    a_toks = set(tokenize(answer))
+    if not a_toks:
+        return 0.0
+    s_toks = source_tokens(sources)
+    return len(a_toks & s_toks) / max(1, len(a_toks))
+
+
+def unsupported_sentences(answer: str, sources: List[str]) -> List[str]:
+    """Return sentences with low lexical overlap to sources (likely hallucinations)."""
+    return grounding(answer, source_tokens(sources))["unsupported_sentences"]
+
+
+def evaluate_answer(answer: str, sources: List[str]) -> Dict:
+    return grounding(answer, source_tokens(sources))
+
+
+class GroundingEvaluator:
+    """Per-request grounding metrics for RagPipeline(evaluator=...)."""
+
+    def __call__(self, query: str, answer: str, contexts: List[Dict]) -> Dict:
+        return grounding(answer, context_tokens(contexts))
+
+    def close(self):
+        pass
+
+
+class AsyncEvaluator(GroundingEvaluator):
+    """Grounding metrics computed off the request path.
+
+    A call only queues the work and returns {"pending": True, "eval_id": ...};
+    a background thread computes the metrics and appends one JSON line per
+    request to `log_path` ({"eval_id", "ts", "query", "answer", "metrics"}),
+    which is where responses and their metrics are joined. When more than
+    `max_pending` evaluations are waiting, new ones are dropped and the
+    response says {"pending": False, "dropped": True}; drops are counted on
+    `metrics` as "eval.dropped". `on_result(record)` is also called per record.
+    An evaluation that raises (including in on_result) is counted as
+    "eval.failed" and the worker carries on with the next one.
+
+    The worker thread starts on first use in each process, so forked server
+    workers each get their own; eval ids carry the process id.
+    """
+
+    def __init__(self, log_path, max_pending: int = 1024, metrics=None,
+                 on_result: Optional[Callable[[Dict], None]] = None):
+        self.log_path = Path(log_path)
+        self.max_pending = max_pending
+        self.metrics = metrics
+        self.on_result = on_result
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _start(self) -> "queue.Queue[Optional[Tuple]]":
+        # A thread does not survive fork(): (re)start the worker, with a fresh
+        # queue and id sequence, whenever this runs in a new process.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue(maxsize=self.max_pending)
+                    self._ids = itertools.count(1)
+                    self._prefix = f"{int(time.time()):x}-{os.getpid()}"
+                    self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                    name="rag-eval", daemon=True)
+                    self._thread.start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def __call__(self, query: str, answer: str, contexts: List[Dict]) -> Dict:
+        pending = self._start()
+        eval_id = f"{self._prefix}-{next(self._ids)}"
+        # Keep only what evaluation needs; the sentence data is shared, not copied.
+        sources = [{"text": c["text"], "sentences": c.get("sentences")} for c in contexts]
+        try:
+            pending.put_nowait((eval_id, time.time(), query, answer, sources))
+        except queue.Full:
+            if self.metrics is not None:
+                self.metrics.inc("eval.dropped")
+            return {"pending": False, "dropped": True}
+        return {"pending": True, "eval_id": eval_id}
+
+    def _run(self, pending: "queue.Queue[Optional[Tuple]]"):
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, "a", encoding="utf-8") as log:
+            while True:
+                item = pending.get()
+                try:
+                    if item is None:
+                        return
+                    eval_id, ts, query, answer, sources = item
+                    record = {"eval_id": eval_id, "ts": ts, "query": query, "answer": answer,
+                              "metrics": grounding(answer, context_tokens(sources))}
+                    log.write(json.dumps(record) + "\n")
+                    log.flush()
+                    if self.on_result is not None:
+                        self.on_result(record)
+                    if self.metrics is not None:
+                        self.metrics.inc("eval.completed")
+                except Exception as exc:
+                    # One bad evaluation must not stop the worker for the rest.
+                    if self.metrics is not None:
+                        self.metrics.inc("eval.failed")
+                    print(f"[warn] Evaluation {item[0]} failed: {exc!r}")
+                finally:
+                    pending.task_done()
+
+    def flush(self):
+        """Block until every queued evaluation has been logged."""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Finish the queued evaluations and stop the worker."""
+        with self._lock:
+            if self._pid == os.getpid():
+                self._queue.put(None)
+                self._thread.join()
+                self._pid = None
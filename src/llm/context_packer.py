@@ -0,0 +1,91 @@
+from typing import Callable, Dict, List, Tuple
+from utils.text import split_sentences
+
+# Rough BPE rate for English prose; good enough to size a prompt without the model's tokenizer.
+CHARS_PER_TOKEN = 4.0
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN + 0.999) if text else 0
+
+
+def _cut_words(text: str, budget: int, count_tokens: Callable[[str], int]) -> str:
+    """Longest word prefix of `text` (plus an ellipsis) that fits in `budget` tokens."""
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]) + "…") <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + "…" if lo else ""
+
+
+def pack_contexts(contexts: List[Dict], budget: int,
+                  count_tokens: Callable[[str], int] = estimate_tokens) -> Tuple[List[Dict], Dict]:
+    """Fill a token budget with retrieved contexts, best score first.
+
+    Contexts are split with split_sentences(); a sentence already packed, or
+    contained in text packed from the same source (chunk overlap), is skipped,
+    and a chunk left with nothing new is dropped as a duplicate. Each chunk
+    keeps whole sentences until the next one would overflow the budget; only a
+    chunk whose first sentence alone does not fit is cut mid-sentence. The
+    "[n] (source)" header each context gets in the prompt counts too.
+
+    Returns (packed contexts in prompt order, stats).
+    """
+    stats = {
+        "budget_tokens": budget,
+        "context_tokens": 0,
+        "candidates": len(contexts),
+        "packed_chunks": 0,
+        "truncated_chunks": 0,
+        "duplicate_chunks": 0,
+        "over_budget_chunks": 0,
+        "duplicate_sentences": 0,
+    }
+    packed: List[Dict] = []
+    seen = set()
+    by_source: Dict[str, List[str]] = {}
+    left = budget
+    for ctx in sorted(contexts, key=lambda c: -c.get("score", 0.0)):
+        source = ctx.get("source", "unknown")
+        prior = by_source.get(source, [])
+        fresh = []
+        for sent in split_sentences(ctx["text"]):
+            norm = " ".join(sent.split())
+            if norm in seen or any(norm in p for p in prior):
+                stats["duplicate_sentences"] += 1
+                continue
+            fresh.append(norm)
+        if not fresh:
+            stats["duplicate_chunks"] += 1
+            continue
+        header = count_tokens(f"[{len(packed) + 1}] ({source})\n")
+        room = left - header
+        kept = []
+        used = 0
+        for sent in fresh:
+            cost = count_tokens(sent) + (1 if kept else 0)
+            if used + cost > room:
+                break
+            kept.append(sent)
+            used += cost
+        truncated = len(kept) < len(fresh)
+        if not kept:
+            cut = _cut_words(fresh[0], room, count_tokens)
+            if not cut:
+                stats["over_budget_chunks"] += 1
+                continue
+            kept, used = [cut], count_tokens(cut)
+        if truncated:
+            stats["truncated_chunks"] += 1
+        text = " ".join(kept)
+        seen.update(kept)
+        by_source.setdefault(source, []).append(text)
+        packed.append({**ctx, "text": text})
+        left -= header + used
+    stats["packed_chunks"] = len(packed)
+    stats["context_tokens"] = budget - left
+    return packed, stats
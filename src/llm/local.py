@@ -1,5 +1,7 @@
+import heapq
 from typing import Dict, List
-from utils.text import split_sentences
+from utils.text import tokenize
+from rag.sentences import MIN_TERM_LEN, ChunkSentences
 
 
 class LocalAnswerComposer:
@@ -7,31 +9,32 @@ class LocalAnswerComposer:
     A deterministic, citation-focused answer composer that selects
     sentences from retrieved context and lightly summarizes to reduce
     hallucinations. It prefers quoting directly, with source markers.
+
+    Sentence boundaries, term sets and source line numbers come precomputed
+    with each context ("sentences", see rag.sentences); contexts without
+    them are split on the fly and cite sentence ordinals instead of lines.
     """
 
     def compose(self, query: str, contexts: List[Dict]) -> Dict:
         # Rank sentences by overlap with query terms, pick top few.
-        q_terms = set(w.lower() for w in query.split() if len(w) > 2)
-        scored = []
-        for ctx in contexts:
-            for i, sent in enumerate(split_sentences(ctx["text"])):
-                terms = set(w.lower() for w in sent.split() if len(w) > 2)
-                score = len(q_terms & terms) + 1e-6 * (len(terms))
-                if score > 0:
-                    scored.append((score, sent.strip(), ctx["source"], i + 1))
-
-        scored.sort(key=lambda x: x[0], reverse=True)
-        picked = scored[:4] if scored else []
-
-        if not picked and contexts:
+        q_terms = set(w for w in tokenize(query) if len(w) >= MIN_TERM_LEN)
+        sentences = [ctx.get("sentences") or ChunkSentences.from_text(ctx["text"]) for ctx in contexts]
+        # Candidates in context then sentence order; nlargest keeps that order among ties.
+        scored = (
+            (score, c, n)
+            for c, sents in enumerate(sentences)
+            for score, n in sents.top(q_terms, 4)
+        )
+        picked = [(sentences[c].sentence(n), contexts[c]["source"], sentences[c].lines[n])
+                  for _, c, n in heapq.nlargest(4, scored, key=lambda x: x[0])]
+
+        if not picked and contexts and len(sentences[0]):
             # Fallback: take the first sentence of the top context
-            top_ctx = contexts[0]
-            first = split_sentences(top_ctx["text"])[:1]
-            picked = [(0.0, first[0], top_ctx["source"], 1)] if first else []
+            picked = [(sentences[0].sentence(0), contexts[0]["source"], sentences[0].lines[0])]
 
         lines = []
         citations = []
-        for _, s, src, line_no in picked:
+        for s, src, line_no in picked:
             lines.append(s)
             citations.append({"source": src, "line": line_no})
 
@@ -46,4 +49,3 @@ class LocalAnswerComposer:
         )
 
         return {"answer": answer, "citations": citations}
-
@@ -1,39 +1,239 @@
+import http.client
 import json
 import os
 import re
-from typing import Dict, List, Optional
-from urllib import request, error
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from rag.cache import normalize_query
+from .context_packer import estimate_tokens, pack_contexts
+from .response_cache import ResponseCache, digest
+
+_CITE_RE = re.compile(r"\[(\d+)\]")
+_PARTIAL_CITE_RE = re.compile(r"\[\d*")
+
+# Failures worth retrying on a fresh connection (RemoteDisconnected is a ConnectionResetError).
+_RETRYABLE = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+
+class ConnectionPool:
+    """Persistent keep-alive http.client connections to one host.
+
+    At most `maxsize` requests are in flight at once; further callers block
+    until a slot frees up. Connection resets (typically a keep-alive socket
+    the server already closed) are retried on a new connection with
+    exponential backoff.
+    """
+
+    def __init__(self, base_url: str, maxsize: int = 8, retries: int = 3, backoff: float = 0.1):
+        u = urlparse(base_url)
+        self._cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+        self._host = u.hostname
+        self._port = u.port
+        self.base_path = u.path.rstrip("/")
+        self.maxsize = maxsize
+        self.retries = retries
+        self.backoff = backoff
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+
+    def _get(self, timeout: float) -> http.client.HTTPConnection:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._cls(self._host, self._port, timeout=timeout)
+            conn.connect()
+            # Small request/response pairs on a reused socket stall on Nagle + delayed ACK.
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return conn
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def open(self, method: str, path: str, body: bytes = None, headers: Dict = None,
+             timeout: float = 120) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """Send a request and return (connection, response) with its headers read.
+        The caller must hand both back through release()."""
+        self._slots.acquire()
+        attempt = 0
+        while True:
+            conn = None
+            try:
+                conn = self._get(timeout)
+                conn.request(method, self.base_path + path, body=body, headers=headers or {})
+                return conn, conn.getresponse()
+            except _RETRYABLE:
+                if conn is not None:
+                    conn.close()
+                if attempt >= self.retries:
+                    self._slots.release()
+                    raise
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+            except BaseException:
+                if conn is not None:
+                    conn.close()
+                self._slots.release()
+                raise
+
+    def release(self, conn: http.client.HTTPConnection, resp: http.client.HTTPResponse, reuse: bool = True):
+        if reuse and not resp.will_close and resp.isclosed():
+            with self._lock:
+                self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def request(self, method: str, path: str, body: bytes = None, headers: Dict = None,
+                timeout: float = 120) -> Tuple[int, bytes]:
+        conn, resp = self.open(method, path, body, headers, timeout)
+        try:
+            data = resp.read()
+        except BaseException:
+            self.release(conn, resp, reuse=False)
+            raise
+        self.release(conn, resp)
+        return resp.status, data
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
 
 
 class OllamaClient:
-    def __init__(self, host: str = None):
+    def __init__(self, host: str = None, max_connections: int = 8, retries: int = 3, backoff: float = 0.1):
         self.host = host or os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+        self.pool = ConnectionPool(self.host, maxsize=max_connections, retries=retries, backoff=backoff)
 
-    def generate(self, model: str, prompt: str, options: Optional[Dict] = None, timeout: int = 120) -> str:
-        url = f"{self.host}/api/generate"
+    def _body(self, model: str, prompt: str, options: Optional[Dict], stream: bool) -> bytes:
         payload = {
             "model": model,
             "prompt": prompt,
-            "stream": False,
+            "stream": stream,
         }
         if options:
             payload["options"] = options
-        data = json.dumps(payload).encode("utf-8")
-        req = request.Request(url, data=data, headers={"Content-Type": "application/json"})
+        return json.dumps(payload).encode("utf-8")
+
+    def generate(self, model: str, prompt: str, options: Optional[Dict] = None, timeout: int = 120) -> str:
+        url = f"{self.host}/api/generate"
+        data = self._body(model, prompt, options, stream=False)
         try:
-            with request.urlopen(req, timeout=timeout) as resp:
-                body = resp.read()
-                obj = json.loads(body.decode("utf-8"))
-                return obj.get("response", "")
-        except error.URLError as e:
+            status, body = self.pool.request("POST", "/api/generate", data, {"Content-Type": "application/json"}, timeout)
+        except OSError as e:
             raise RuntimeError(f"Failed to reach Ollama at {url}: {e}")
+        if status >= 400:
+            raise RuntimeError(f"Ollama returned HTTP {status} for {url}: {body[:200]!r}")
+        obj = json.loads(body.decode("utf-8"))
+        return obj.get("response", "")
+
+    def generate_many(self, model: str, prompts: List[str], options: Optional[Dict] = None,
+                      timeout: int = 120) -> List[str]:
+        """Generate for every prompt concurrently through the pool; results keep input order."""
+        with ThreadPoolExecutor(max_workers=self.pool.maxsize) as ex:
+            return list(ex.map(lambda p: self.generate(model, p, options, timeout), prompts))
+
+    def generate_stream(self, model: str, prompt: str, options: Optional[Dict] = None, timeout: int = 120) -> Iterator[str]:
+        """Yield response fragments as Ollama streams them (one NDJSON object per line)."""
+        url = f"{self.host}/api/generate"
+        data = self._body(model, prompt, options, stream=True)
+        try:
+            conn, resp = self.pool.open("POST", "/api/generate", data, {"Content-Type": "application/json"}, timeout)
+        except OSError as e:
+            raise RuntimeError(f"Failed to reach Ollama at {url}: {e}")
+        finished = False
+        try:
+            if resp.status >= 400:
+                raise RuntimeError(f"Ollama returned HTTP {resp.status} for {url}: {resp.read()[:200]!r}")
+            for line in resp:
+                if not line.strip():
+                    continue
+                obj = json.loads(line.decode("utf-8"))
+                if "error" in obj:
+                    raise RuntimeError(f"Ollama error: {obj['error']}")
+                if obj.get("response"):
+                    yield obj["response"]
+                if obj.get("done"):
+                    resp.read()  # drain the end of the body so the connection can be reused
+                    finished = True
+                    return
+        except OSError as e:
+            raise RuntimeError(f"Failed to reach Ollama at {url}: {e}")
+        finally:
+            self.pool.release(conn, resp, reuse=finished)
 
 
 class OllamaAnswerer:
-    def __init__(self, model: str = None, temperature: float = 0.1):
+    """Answers from retrieved contexts with a local Ollama model.
+
+    Contexts are packed into `context_tokens` prompt tokens (OLLAMA_CONTEXT_TOKENS,
+    default 1536, leaving room for instructions and the answer in a 2k window)
+    by llm.context_packer; the packing stats come back under "packing".
+
+    With a `cache` (llm.response_cache.ResponseCache) answers are reused across
+    prompts that differ only in question case/whitespace or context order;
+    "llm_cache" reports "hit", "near" or "miss".
+    """
+
+    def __init__(self, model: str = None, temperature: float = 0.1, context_tokens: int = None,
+                 cache: Optional[ResponseCache] = None):
         self.model = model or os.environ.get("OLLAMA_MODEL", "llama3")
         self.client = OllamaClient()
         self.temperature = temperature
+        self.context_tokens = context_tokens or int(os.environ.get("OLLAMA_CONTEXT_TOKENS", 1536))
+        self.cache = cache
+
+    def _cache_keys(self, query: str, contexts: List[Dict], options: Dict) -> Tuple[str, str, Dict[int, int]]:
+        """(key, group, prompt position -> canonical position) for the packed contexts.
+
+        The canonical prompt sorts contexts by source and text and normalizes
+        whitespace and query case; the group is the canonical prompt without
+        the question. Cached answers store [n] markers in canonical numbering.
+        """
+        texts = [" ".join(c["text"].split()) for c in contexts]
+        order = sorted(range(len(contexts)), key=lambda i: (contexts[i]["source"], texts[i]))
+        canon = [{"source": contexts[i]["source"], "text": texts[i]} for i in order]
+        head = json.dumps([self.model, options], sort_keys=True)
+        group = digest(head, self._build_prompt("", canon))
+        key = digest(head, self._build_prompt(normalize_query(query), canon))
+        return key, group, {i + 1: r + 1 for r, i in enumerate(order)}
+
+    @staticmethod
+    def _renumber(text: str, mapping: Dict[int, int]) -> str:
+        return _CITE_RE.sub(lambda m: f"[{mapping.get(int(m.group(1)), m.group(1))}]", text)
+
+    def _cached(self, query: str, contexts: List[Dict], options: Dict) -> Tuple[Optional[str], str, tuple]:
+        """(cached answer renumbered for this prompt or None, cache status, keys for _store)."""
+        if self.cache is None:
+            return None, "off", ()
+        key, group, to_canon = self._cache_keys(query, contexts, options)
+        found = self.cache.get(key, group, query)
+        if found is None:
+            return None, "miss", (key, group, to_canon)
+        answer, kind = found
+        from_canon = {c: p for p, c in to_canon.items()}
+        return self._renumber(answer, from_canon), "hit" if kind == "exact" else "near", ()
+
+    def _store(self, keys: tuple, query: str, text: str):
+        if keys:
+            key, group, to_canon = keys
+            self.cache.put(key, group, query, self._renumber(text, to_canon))
+
+    def _prepare(self, query: str, contexts: List[Dict]) -> Tuple[str, List[Dict], Dict]:
+        """(prompt, packed contexts, packing stats) for one request."""
+        packed, stats = pack_contexts(contexts, self.context_tokens)
+        prompt = self._build_prompt(query, packed)
+        stats["prompt_chars"] = len(prompt)
+        stats["prompt_tokens"] = estimate_tokens(prompt)
+        return prompt, packed, stats
 
     def _build_prompt(self, query: str, contexts: List[Dict]) -> str:
         lines = [
@@ -46,20 +246,16 @@ class OllamaAnswerer:
             "\nSources:",
         ]
         for i, c in enumerate(contexts, 1):
-            # Truncate overly long contexts
-            txt = c["text"]
-            if len(txt) > 1200:
-                txt = txt[:1200] + "…"
-            lines.append(f"[{i}] ({c['source']})\n{txt}")
+            lines.append(f"[{i}] ({c['source']})\n{c['text']}")
         lines.append("\nAnswer (with citations):")
         return "\n".join(lines)
 
     def _extract_citations(self, answer: str, contexts: List[Dict]) -> List[Dict]:
         cited = []
-        for m in re.finditer(r"\[(\d+)\]", answer):
+        for m in _CITE_RE.finditer(answer):
             idx = int(m.group(1))
             if 1 <= idx <= len(contexts):
-                cited.append({"source": contexts[idx - 1]["source"], "line": 1})
+                cited.append({"source": contexts[idx - 1]["source"], "line": contexts[idx - 1].get("line", 1)})
         # Deduplicate while preserving order
         seen = set()
         uniq = []
@@ -71,9 +267,47 @@ class OllamaAnswerer:
         return uniq
 
     def compose(self, query: str, contexts: List[Dict]) -> Dict:
-        prompt = self._build_prompt(query, contexts)
+        prompt, contexts, packing = self._prepare(query, contexts)
         options = {"temperature": self.temperature}
-        text = self.client.generate(self.model, prompt, options=options)
+        text, status, keys = self._cached(query, contexts, options)
+        if text is None:
+            text = self.client.generate(self.model, prompt, options=options)
+            self._store(keys, query, text)
         citations = self._extract_citations(text, contexts)
-        return {"answer": text, "citations": citations}
+        return {"answer": text, "citations": citations, "packing": packing, "llm_cache": status}
 
+    def compose_stream(self, query: str, contexts: List[Dict]) -> Iterator[Tuple[str, Dict]]:
+        """Stream ("token", {"text"}) events, a ("citation", {...}) event the first time
+        each [n] marker completes, and a final ("done", {"answer", "citations", "packing", "llm_cache"}).
+        A cached answer arrives as a single token."""
+        prompt, contexts, packing = self._prepare(query, contexts)
+        options = {"temperature": self.temperature}
+        cached, status, keys = self._cached(query, contexts, options)
+        if cached is not None:
+            citations = self._extract_citations(cached, contexts)
+            yield "token", {"text": cached}
+            for c in citations:
+                yield "citation", c
+            yield "done", {"answer": cached, "citations": citations, "packing": packing, "llm_cache": status}
+            return
+        text = ""
+        scan = 0  # citations before this offset have been reported
+        seen = set()
+        for piece in self.client.generate_stream(self.model, prompt, options=options):
+            text += piece
+            yield "token", {"text": piece}
+            for m in _CITE_RE.finditer(text, scan):
+                scan = m.end()
+                idx = int(m.group(1))
+                if 1 <= idx <= len(contexts):
+                    cite = {"source": contexts[idx - 1]["source"], "line": contexts[idx - 1].get("line", 1)}
+                    key = (cite["source"], cite["line"])
+                    if key not in seen:
+                        seen.add(key)
+                        yield "citation", cite
+            # Rescan a trailing, possibly incomplete "[12" once the next fragment arrives.
+            open_at = text.rfind("[", scan)
+            scan = open_at if open_at >= 0 and _PARTIAL_CITE_RE.fullmatch(text, open_at) else len(text)
+        self._store(keys, query, text)
+        yield "done", {"answer": text, "citations": self._extract_citations(text, contexts), "packing": packing,
+                       "llm_cache": status}
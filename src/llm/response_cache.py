@@ -0,0 +1,148 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.text import tokenize
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    grp TEXT NOT NULL,
+    qvec TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_grp ON responses (grp, used);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+"""
+
+
+def digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _term_counts(text: str) -> Dict[str, float]:
+    counts: Dict[str, float] = {}
+    for t in tokenize(text):
+        counts[t] = counts.get(t, 0.0) + 1.0
+    return counts
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(v * b.get(t, 0.0) for t, v in a.items())
+    na = math.sqrt(sum(v * v for v in a.values()))
+    nb = math.sqrt(sum(v * v for v in b.values()))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+class ResponseCache:
+    """Persistent LLM response cache in a SQLite file.
+
+    Entries are looked up by `key` (a hash of the canonical prompt) and belong
+    to a `group` (the same prompt minus the question: model, options, template
+    and context set). When the total stored answer size exceeds `max_bytes`
+    the least recently used entries are evicted.
+
+    With `near_threshold` set, a miss falls back to the most similar cached
+    query in the same group whose vector (from `vectorize`, e.g. the store's
+    TF-IDF weights; raw term counts by default) has cosine >= near_threshold.
+    Hits, near hits, misses and evictions are counted on `metrics` when given.
+    Safe to share between threads; forked processes open their own connection.
+    """
+
+    def __init__(self, path, max_bytes: int = 64 << 20, near_threshold: Optional[float] = None,
+                 vectorize: Optional[Callable[[str], Dict[str, float]]] = None,
+                 metrics=None, prefix: str = "llm_cache", near_candidates: int = 64):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.near_threshold = near_threshold
+        self.vectorize = vectorize or _term_counts
+        self.metrics = metrics
+        self.prefix = prefix
+        self.near_candidates = near_candidates
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _count(self, event: str):
+        if self.metrics is not None:
+            self.metrics.inc(f"{self.prefix}.{event}")
+
+    def _db(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key: str, group: str = None, query: str = None) -> Optional[Tuple[str, str]]:
+        """(answer, "exact" | "near") or None."""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT answer FROM responses WHERE key = ?", (key,)).fetchone()
+            kind = "exact"
+            if row is None and self.near_threshold is not None and group is not None and query is not None:
+                qvec = self.vectorize(query)
+                best, best_key = self.near_threshold, None
+                rows = db.execute("SELECT key, qvec FROM responses WHERE grp = ? ORDER BY used DESC LIMIT ?",
+                                  (group, self.near_candidates))
+                for k, vec in rows:
+                    sim = _cosine(qvec, json.loads(vec))
+                    if sim >= best:
+                        best, best_key = sim, k
+                if best_key is not None:
+                    key, kind = best_key, "near"
+                    row = db.execute("SELECT answer FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count("miss")
+                return None
+            db.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+            self._count("hit" if kind == "exact" else "near_hit")
+            return row[0], kind
+
+    def put(self, key: str, group: str, query: str, answer: str):
+        qvec = json.dumps(self.vectorize(query)) if self.near_threshold is not None else "{}"
+        size = len(answer.encode("utf-8")) + len(qvec)
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO responses (key, grp, qvec, answer, size, used) VALUES (?, ?, ?, ?, ?, ?)",
+                       (key, group, qvec, answer, size, time.time()))
+            self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for k, size in db.execute("SELECT key, size FROM responses ORDER BY used").fetchall():
+            if total <= self.max_bytes:
+                break
+            victims.append((k,))
+            total -= size
+        db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        for _ in victims:
+            self._count("eviction")
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
@@ -1,23 +1,282 @@
-from time import time
-from typing import Dict
+import re
+import threading
+from functools import wraps
+from math import ceil, log2
+from time import perf_counter
+from typing import Dict, List, Tuple
 
+# Histogram bucket upper bounds in seconds: 1 µs to ~95 s, a factor of sqrt(2)
+# apart, so an interpolated percentile is within ~20% of the true value.
+BUCKETS = [1e-6 * 2 ** (i / 2) for i in range(54)]
+_INF = len(BUCKETS)
 
-class MetricsStub:
-    """Stage 4: Minimal in-process metrics collector."""
+
+def _bucket(seconds: float) -> int:
+    """Index of the first bucket whose bound is >= seconds (_INF past the last)."""
+    if seconds <= 1e-6:
+        return 0
+    i = ceil(2 * log2(seconds * 1e6))
+    return i if i < _INF else _INF
+
+
+class _Shard:
+    """One thread's counters and histograms; only that thread writes to it."""
+
+    __slots__ = ("counters", "hists", "spans")
 
     def __init__(self):
         self.counters: Dict[str, int] = {}
-        self.timings: Dict[str, float] = {}
+        # key -> per-bucket counts (last slot is +Inf) followed by the sum of observations
+        self.hists: Dict[str, List[float]] = {}
+        self.spans: Dict[str, "_Span"] = {}  # one reusable span per key, see MetricsStub.span
+
+    def copy(self) -> "_Shard":
+        shard = _Shard()
+        shard.counters = self.counters.copy()
+        shard.hists = {k: list(h) for k, h in self.hists.copy().items()}
+        return shard
+
+    def add(self, other: "_Shard"):
+        for k, v in other.counters.copy().items():
+            self.counters[k] = self.counters.get(k, 0) + v
+        for k, h in other.hists.copy().items():
+            mine = self.hists.get(k)
+            self.hists[k] = list(h) if mine is None else [a + b for a, b in zip(mine, h)]
+
+
+class _Span:
+    # Holds the calling thread's histogram list, so closing a span touches nothing shared.
+    # t0 is 0.0 while the span is not running.
+    __slots__ = ("hist", "t0")
+
+    def __init__(self, hist: List[float]):
+        self.hist = hist
+        self.t0 = 0.0
+
+    def __enter__(self, _now=perf_counter):
+        self.t0 = _now()
+        return self
+
+    def __exit__(self, *exc, _now=perf_counter, _ceil=ceil, _log2=log2):
+        seconds = _now() - self.t0
+        self.t0 = 0.0
+        h = self.hist
+        if seconds <= 1e-6:
+            h[0] += 1
+        else:
+            i = _ceil(2 * _log2(seconds * 1e6))  # _bucket(), inlined
+            h[i if i < _INF else _INF] += 1
+        h[-1] += seconds
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    """Stand-in tracer for code running without metrics; spans cost one call."""
+
+    def span(self, key: str) -> _NullSpan:
+        return _NULL_SPAN
+
+
+NULL_TRACER = NullTracer()
+
+
+def _quantile(counts: List[float], total: int, q: float) -> float:
+    """Percentile from bucket counts, interpolating linearly inside the bucket."""
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(counts):
+        if n and seen + n >= rank:
+            if i == _INF:
+                return BUCKETS[-1]
+            lo = BUCKETS[i - 1] if i else 0.0
+            return lo + (BUCKETS[i] - lo) * (rank - seen) / n
+        seen += n
+    return 0.0
+
+
+def _prom_name(key: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", key)
+
+
+def _prom_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _braces(labels: str) -> str:
+    return "{" + labels + "}" if labels else ""
+
+
+class MetricsStub:
+    """Stage 4: in-process counters, latency histograms and a span tracer.
+
+    Every thread updates its own shard, so the hot path takes no lock; reads
+    (snapshot(), prometheus()) merge the shards. The shards of threads that
+    have exited are folded into one base shard when a new thread registers
+    and on every read, so short-lived threads (per-call pools) do not pile
+    up. Latencies land in fixed log-spaced buckets (BUCKETS), from which
+    p50/p95/p99 are interpolated.
+
+        with metrics.span("stage.score"): ...
+        @metrics.traced("stage.compose")
+        def compose(...): ...
+    """
+
+    def __init__(self, namespace: str = "rag"):
+        self.namespace = namespace
+        self._local = threading.local()
+        self._base = _Shard()  # totals of threads that have exited
+        self._shards: List[Tuple[threading.Thread, _Shard]] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._reap()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _reap(self):
+        # Caller holds _lock. A thread that has exited never writes its shard again.
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._base.add(shard)
+        self._shards = live
+
+    def _merged(self) -> _Shard:
+        # The base is copied under the lock with the shard list, so a shard folded
+        # into it by a concurrent read is never counted twice.
+        with self._lock:
+            self._reap()
+            merged = self._base.copy()
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            merged.add(shard)
+        return merged
 
     def inc(self, key: str, n: int = 1):
-        self.counters[key] = self.counters.get(key, 0) + n
+        counters = self._shard().counters
+        counters[key] = counters.get(key, 0) + n
+
+    def _hist(self, key: str) -> List[float]:
+        hists = self._shard().hists
+        h = hists.get(key)
+        if h is None:
+            h = hists[key] = [0] * (_INF + 1) + [0.0]
+        return h
+
+    def observe(self, key: str, seconds: float):
+        h = self._hist(key)
+        h[_bucket(seconds)] += 1
+        h[-1] += seconds
+
+    def span(self, key: str) -> _Span:
+        """Context manager timing its block into histogram `key`.
+
+        A thread reuses one span object per key; only a span nested inside a
+        running one on the same key is allocated afresh.
+        """
+        try:
+            span = self._local.shard.spans[key]
+        except (AttributeError, KeyError):
+            span = self._shard().spans[key] = _Span(self._hist(key))
+        return _Span(span.hist) if span.t0 else span
+
+    def traced(self, key: str):
+        """Decorator timing every call of the wrapped function into histogram `key`."""
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                t0 = perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(key, perf_counter() - t0)
+            return wrapper
+        return deco
 
     def time(self, key: str):
-        start = time()
+        start = perf_counter()
         def stop():
-            self.timings[key] = self.timings.get(key, 0.0) + (time() - start)
+            self.observe(key, perf_counter() - start)
         return stop
 
+    @property
+    def counters(self) -> Dict[str, int]:
+        return self._merged().counters
+
+    def histograms(self) -> Dict[str, List[float]]:
+        """Merged bucket counts (+Inf last) followed by the sum, per key."""
+        return self._merged().hists
+
     def snapshot(self) -> Dict:
-        return {"counters": dict(self.counters), "timings": dict(self.timings)}
+        hists = {}
+        for k, h in self.histograms().items():
+            counts, total = h[:-1], int(sum(h[:-1]))
+            hists[k] = {
+                "count": total,
+                "sum": h[-1],
+                "p50": _quantile(counts, total, 0.50),
+                "p95": _quantile(counts, total, 0.95),
+                "p99": _quantile(counts, total, 0.99),
+            }
+        return {
+            "counters": self.counters,
+            "timings": {k: v["sum"] for k, v in hists.items()},
+            "histograms": hists,
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format (0.0.4).
+
+        A key "family.name" becomes <namespace>_<family>_total{event="name"} for
+        counters and <namespace>_<family>_seconds{op="name"} for histograms;
+        a key without a dot has no label.
+        """
+        def split(key: str, label: str):
+            family, _, name = key.partition(".")
+            return _prom_name(family), (f'{label}="{_prom_label(name)}"' if name else "")
 
+        ns = self.namespace
+        lines: List[str] = []
+        families: Dict[str, List[str]] = {}
+        for key, value in sorted(self.counters.items()):
+            family, labels = split(key, "event")
+            families.setdefault(family, []).append(f"{ns}_{family}_total{_braces(labels)} {value}")
+        for family, samples in families.items():
+            lines.append(f"# TYPE {ns}_{family}_total counter")
+            lines.extend(samples)
+        families = {}
+        for key, h in sorted(self.histograms().items()):
+            family, labels = split(key, "op")
+            sep = "," if labels else ""
+            name = f"{ns}_{family}_seconds"
+            samples = families.setdefault(family, [])
+            cumulative = 0
+            for bound, n in zip(BUCKETS + [float("inf")], h[:-1]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+                samples.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+            samples.append(f"{name}_sum{_braces(labels)} {h[-1]:.9g}")
+            samples.append(f"{name}_count{_braces(labels)} {cumulative}")
+        for family, samples in families.items():
+            lines.append(f"# TYPE {ns}_{family}_seconds histogram")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Hashable, Optional
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form; retrieval and composition ignore both."""
+    return " ".join(query.lower().split())
+
+
+class QueryCache:
+    """Bounded LRU cache with a per-entry TTL, tagged with an index version.
+
+    An entry stored under one index version is a miss for any other version,
+    so refitting or incrementally updating the store invalidates it without
+    an explicit flush. Hits, misses, evictions, expirations and
+    invalidations are counted on `metrics` (a MetricsStub) when given.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0, metrics=None, prefix: str = "query_cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.metrics = metrics
+        self.prefix = prefix
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, event: str):
+        if self.metrics is not None:
+            self.metrics.inc(f"{self.prefix}.{event}")
+
+    def get(self, key: Hashable, version: int) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count("miss")
+                return None
+            value, entry_version, expires = entry
+            if entry_version != version or monotonic() >= expires:
+                del self._entries[key]
+                self._count("invalidation" if entry_version != version else "expired")
+                self._count("miss")
+                return None
+            self._entries.move_to_end(key)
+            self._count("hit")
+            return value
+
+    def put(self, key: Hashable, version: int, value: str):
+        with self._lock:
+            self._entries[key] = (value, version, monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._count("eviction")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
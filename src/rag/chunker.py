@@ -1,20 +1,157 @@
-from typing import List, Dict
+"""Chunking engine.
 
+iter_spans() yields each chunk lazily as (start, end) character offsets into
+the source text, so no token list or chunk string is built:
 
-def make_chunks(text: str, size: int = 600, overlap: int = 80) -> List[Dict]:
-    tokens = text.split()
-    chunks = []
+- mode="words": fixed windows of `size` whitespace tokens, `overlap` shared
+  between neighbours. One compiled regex matches a whole window per call and
+  marks where the next window starts, so the scan runs in the regex engine.
+- mode="sentence" / "paragraph" / "section": chunks end on a boundary of
+  that kind. Whole units are packed greedily up to `size` tokens, and
+  neighbours share whole trailing units of at most `overlap` tokens. A unit
+  larger than `size` is split on the next weaker boundary, down to word
+  windows. A sentence ends at . ! or ? before a capital or an opening
+  bracket (as utils.text.split_sentences), a line break ends a paragraph
+  (clean_text collapses blank lines), and a line opening with a 10-K style
+  header ("Item 1A.", "ITEM 7.", "PART II") starts a section.
+"""
+import bisect
+import functools
+import re
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+MODES = ("words", "sentence", "paragraph", "section")
+_LEVELS = {"sentence": 1, "paragraph": 2, "section": 3}
+
+_FIRST = re.compile(r"\S")
+_LAST = re.compile(r"\S\s*\Z")
+
+# One match per token or boundary; m.lastgroup says which.
+_SCAN = re.compile(r"""
+    (?P<section>(?<![^\n])[ \t]*+(?=(?:Item|ITEM)\s+\d{1,2}[A-Za-z]?\b|(?:Part|PART)\s+[IVX]{1,4}\b))
+  | (?P<paragraph>\n)
+  | (?P<sentence>(?<=[.!?])[ \t\r\f\v]++(?=[A-Z(\[]))
+  | (?P<token>\S++)
+""", re.X)
+
+
+def chunk_bounds(n_tokens: int, size: int = 600, overlap: int = 80) -> Iterator[Tuple[int, int]]:
+    """(start_token, end_token) of each chunk of an `n_tokens`-token text."""
     start = 0
-    while start < len(tokens):
-        end = min(len(tokens), start + size)
-        chunk_tokens = tokens[start:end]
-        chunk = " ".join(chunk_tokens).strip()
-        if chunk:
-            chunks.append({"text": chunk, "start_token": start, "end_token": end})
-        if end == len(tokens):
+    while start < n_tokens:
+        end = min(n_tokens, start + size)
+        yield start, end
+        if end == n_tokens:
             break
         start = end - overlap
         if start < 0:
             start = 0
-    return chunks
 
+
+@functools.lru_cache(maxsize=32)
+def _window(size: int, step: int):
+    # A full window of `size` tokens from a token start; group 1 is empty and
+    # sits where token `step` (the next window's first token) begins.
+    if step == size:
+        return re.compile(r"(?:\S++\s++){%d}\S++()" % (size - 1))
+    return re.compile(r"(?:\S++\s++){%d}()(?:\S++\s++){%d}\S++" % (step, size - step - 1))
+
+
+def _word_spans(text: str, size: int, overlap: int) -> Iterator[Tuple[int, int]]:
+    first = _FIRST.search(text)
+    if first is None:
+        return
+    window = _window(size, size - overlap)
+    pos = first.start()
+    while True:
+        m = window.match(text, pos)
+        if m is None:
+            break
+        yield pos, m.end()
+        nxt = _FIRST.search(text, m.end())
+        if nxt is None:
+            return
+        pos = m.start(1) if overlap else nxt.start()
+    yield pos, _LAST.search(text, pos).start() + 1
+
+
+def _scan(text: str) -> Tuple[array, array, List[List[int]]]:
+    """Token start/end offsets, plus per level (1-3) the ids of tokens that open a unit."""
+    starts, ends = array("i"), array("i")
+    opens: List[List[int]] = [[], [], [], []]
+    level = 0
+    for m in _SCAN.finditer(text):
+        kind = m.lastgroup
+        if kind == "token":
+            n = len(starts)
+            if level:
+                for lv in range(1, level + 1):
+                    opens[lv].append(n)
+                level = 0
+            starts.append(m.start())
+            ends.append(m.end())
+        else:
+            level = max(level, _LEVELS[kind])
+    return starts, ends, opens
+
+
+def _pack(opens: List[List[int]], lo: int, hi: int, level: int, size: int, overlap: int) -> Iterator[Tuple[int, int]]:
+    """Token ranges of the chunks of tokens [lo, hi) packed from level-`level` units."""
+    if level == 0:
+        for a, b in chunk_bounds(hi - lo, size, overlap):
+            yield lo + a, lo + b
+        return
+    cuts = opens[level]
+    inner = cuts[bisect.bisect_right(cuts, lo):bisect.bisect_left(cuts, hi)]
+    units = list(zip([lo] + inner, inner + [hi]))
+    i = 0
+    while i < len(units):
+        a, b = units[i]
+        if b - a > size:
+            yield from _pack(opens, a, b, level - 1, size, overlap)
+            i += 1
+            continue
+        j = i
+        while j + 1 < len(units) and units[j + 1][1] - a <= size:
+            j += 1
+        yield a, units[j][1]
+        if j + 1 == len(units):
+            return
+        # Carry whole trailing units (at most `overlap` tokens, never the whole
+        # chunk) into the next chunk, as long as the next unit still fits.
+        k = j + 1
+        while k - 1 > i and units[j][1] - units[k - 1][0] <= overlap:
+            k -= 1
+        while k <= j and units[j + 1][1] - units[k][0] > size:
+            k += 1
+        i = k
+
+
+def iter_spans(text: str, size: int = 600, overlap: int = 80, mode: str = "words") -> Iterator[Tuple[int, int]]:
+    """Lazily yield (start, end) character offsets of each chunk of `text`;
+    text[start:end] runs from a chunk's first token to the end of its last."""
+    if mode not in MODES:
+        raise ValueError(f"unknown chunk mode {mode!r}; expected one of {MODES}")
+    if not 0 <= overlap < size:
+        raise ValueError("chunk overlap must be >= 0 and smaller than the chunk size")
+    if mode == "words":
+        yield from _word_spans(text, size, overlap)
+        return
+    starts, ends, opens = _scan(text)
+    if not starts:
+        return
+    for a, b in _pack(opens, 0, len(starts), _LEVELS[mode], size, overlap):
+        yield starts[a], ends[b - 1]
+
+
+def make_chunks(text: str, size: int = 600, overlap: int = 80) -> List[Dict]:
+    """Word-window chunks as whitespace-normalised strings (for callers that want
+    text, e.g. rag.dense); DocumentStore chunks via iter_spans()."""
+    tokens = text.split()
+    chunks = []
+    for start, end in chunk_bounds(len(tokens), size, overlap):
+        chunk = " ".join(tokens[start:end]).strip()
+        if chunk:
+            chunks.append({"text": chunk, "start_token": start, "end_token": end})
+    return chunks
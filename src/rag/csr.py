@@ -0,0 +1,114 @@
+import math
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only the "csr" backend needs it
+    np = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+class CsrMatrix:
+    """Chunk x term matrix of L2-normalised TF-IDF weights in CSR layout.
+
+    Uses scipy.sparse for the mat-vec when it is installed and a plain
+    NumPy segment sum otherwise.
+    """
+
+    def __init__(self, vocab: Dict[str, int], indptr, indices, data):
+        if np is None:
+            raise ImportError("CsrMatrix requires numpy (pip install numpy)")
+        self.vocab = vocab
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.shape = (len(self.indptr) - 1, len(vocab))
+        self._matrix = None
+        if sparse is not None:
+            self._matrix = sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    @classmethod
+    def from_vectors(cls, vectors: Iterable[Dict[str, float]]) -> "CsrMatrix":
+        """Build from sparse tf-idf dicts, one per chunk, streaming into flat arrays."""
+        vocab: Dict[str, int] = {}
+        indptr = array("q", [0])
+        indices = array("i")
+        data = array("d")
+        for v in vectors:
+            norm = math.sqrt(sum(w * w for w in v.values())) or 1e-12
+            for t, w in v.items():
+                j = vocab.get(t)
+                if j is None:
+                    j = vocab[t] = len(vocab)
+                indices.append(j)
+                data.append(w / norm)
+            indptr.append(len(indices))
+        return cls(vocab, np.frombuffer(indptr, dtype=np.int64), np.frombuffer(indices, dtype=np.int32),
+                   np.frombuffer(data, dtype=np.float64))
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+
+    def _query_vector(self, q_vec: Dict[str, float]):
+        # Normalise over every query term (known or not) so scores equal the dict path's cosine.
+        q_norm = math.sqrt(sum(a * a for a in q_vec.values())) or 1e-12
+        x = np.zeros(self.shape[1], dtype=np.float64)
+        for t, a in q_vec.items():
+            j = self.vocab.get(t)
+            if j is not None:
+                x[j] = a / q_norm
+        return x
+
+    def matvec(self, x):
+        if self._matrix is not None:
+            return self._matrix @ x
+        scores = np.zeros(self.shape[0], dtype=np.float64)
+        prod = self.data * x[self.indices]
+        starts = self.indptr[:-1]
+        nonempty = starts < self.indptr[1:]
+        if prod.size:
+            scores[nonempty] = np.add.reduceat(prod, starts[nonempty])
+        return scores
+
+    def search(self, q_vec: Dict[str, float], top_k: int) -> List[Tuple[float, int]]:
+        scores = self.matvec(self._query_vector(q_vec))
+        return top_k_indices(scores, top_k)
+
+    def search_many(self, q_vecs: List[Dict[str, float]], top_k: int,
+                    block: int = 32) -> List[List[Tuple[float, int]]]:
+        """search() for a batch: chunk matrix x query matrix, `block` queries at a time
+        so the dense chunks x queries score block stays bounded."""
+        out = []
+        for start in range(0, len(q_vecs), block):
+            x = np.stack([self._query_vector(q) for q in q_vecs[start:start + block]], axis=1)
+            if self._matrix is not None:
+                scores = self._matrix @ x
+            else:
+                scores = np.stack([self.matvec(x[:, j]) for j in range(x.shape[1])], axis=1)
+            out.extend(top_k_indices(scores[:, j], top_k) for j in range(scores.shape[1]))
+        return out
+
+
+def top_k_indices(scores, top_k: int) -> List[Tuple[float, int]]:
+    """Top-k (score, row) pairs by score, ties broken by row order."""
+    n = scores.shape[0]
+    k = min(top_k, n)
+    if k <= 0:
+        return []
+    if k < n:
+        part = np.argpartition(-scores, k - 1)[:k]
+        kth = scores[part].min()
+        # argpartition picks arbitrary rows among ties at the cut; take the lowest ids instead.
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[: k - above.size]
+        cand = np.concatenate([above, ties])
+    else:
+        cand = np.arange(n)
+    cand = cand[np.lexsort((cand, -scores[cand]))]
+    return [(float(scores[i]), int(i)) for i in cand]
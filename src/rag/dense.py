@@ -0,0 +1,314 @@
+"""Dense-vector chunk index with exact and approximate (IVF/HNSW) search.
+
+Chunk embeddings live in one contiguous float32 matrix. Search uses faiss
+(flat, IVF or HNSW) when it is installed and NumPy otherwise: brute force
+for method="flat", an inverted-file index over spherical k-means centroids
+for "ivf" (and "hnsw", which needs faiss). Embeddings come from
+HashingEmbedder, a deterministic hashed n-gram projection, so the index
+builds and queries offline. DenseIndex.query() has the DocumentStore
+signature, metadata filters included, so RagPipeline can retrieve from
+either.
+"""
+import json
+import math
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only dense retrieval needs it
+    np = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+from utils.text import tokenize_many
+from .chunker import make_chunks
+from .csr import top_k_indices
+from .metadata import MetaIndex
+from .vector_store import _VERSIONS
+
+METHODS = ("flat", "ivf", "hnsw")
+FORMAT_VERSION = 1
+
+
+class HashingEmbedder:
+    """Signed feature hashing of word unigrams, word bigrams and character
+    n-grams into `dim` buckets (a sparse random projection of the n-gram
+    space), sublinear tf weighting, L2-normalised float32 rows. Stable
+    across processes and runs: buckets come from crc32, not hash()."""
+
+    def __init__(self, dim: int = 256, char_ngrams: Tuple[int, int] = (3, 4), seed: int = 0):
+        if np is None:
+            raise ImportError("HashingEmbedder requires numpy (pip install numpy)")
+        self.dim = dim
+        self.char_ngrams = tuple(char_ngrams)
+        self.seed = seed
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+
+    def config(self) -> Dict:
+        return {"dim": self.dim, "char_ngrams": list(self.char_ngrams), "seed": self.seed}
+
+    def _features(self, tokens: List[str]) -> Counter:
+        feats = Counter(tokens)
+        feats.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        lo, hi = self.char_ngrams
+        for t, n in Counter(tokens).items():
+            w = f"<{t}>"
+            for size in range(lo, hi + 1):
+                for i in range(len(w) - size + 1):
+                    feats["#" + w[i:i + size]] += n
+        return feats
+
+    def _bucket(self, feat: str) -> Tuple[int, float]:
+        b = self._buckets.get(feat)
+        if b is None:
+            h = zlib.crc32(feat.encode("utf-8"), self.seed)
+            b = self._buckets[feat] = (h % self.dim, 1.0 if h >> 31 else -1.0)
+        return b
+
+    def embed(self, texts: Sequence[str]):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        bucket = self._bucket
+        for row, tokens in enumerate(tokenize_many(texts)):
+            feats = self._features(tokens)
+            if not feats:
+                continue
+            idx = np.empty(len(feats), dtype=np.int64)
+            val = np.empty(len(feats), dtype=np.float64)
+            for j, (f, n) in enumerate(feats.items()):
+                idx[j], sign = bucket(f)
+                val[j] = sign * (1.0 + math.log(n))
+            vec = np.bincount(idx, weights=val, minlength=self.dim)
+            norm = np.linalg.norm(vec)
+            if norm:
+                out[row] = vec / norm
+        return out
+
+
+def _kmeans(x, k: int, iters: int = 10, seed: int = 0):
+    """Spherical k-means (inner product on unit vectors); returns (centroids, assignment)."""
+    rng = np.random.RandomState(seed)
+    centroids = x[rng.choice(x.shape[0], k, replace=False)].copy()
+    assign = np.zeros(x.shape[0], dtype=np.int64)
+    for _ in range(iters):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                v = members.sum(axis=0)
+                n = np.linalg.norm(v)
+                if n:
+                    centroids[c] = v / n
+    return centroids.astype(np.float32), assign
+
+
+class DenseIndex:
+    """Chunk embeddings in a contiguous float32 matrix plus an ANN structure.
+
+    method: "flat" (exact), "ivf" (nlist clusters, nprobe searched per query)
+    or "hnsw" (faiss only; NumPy falls back to IVF). Scores are inner
+    products of unit vectors, i.e. cosine similarity. exact=True on a
+    search always scans every vector. With `filters` (see rag.metadata) a
+    search scans exactly the vectors of the matching chunks, found through
+    `meta_index`, which is built on first use.
+    """
+
+    def __init__(self, chunk_size: int = 600, chunk_overlap: int = 80, embedder: HashingEmbedder = None,
+                 method: str = "ivf", nlist: Optional[int] = None, nprobe: int = 8,
+                 use_faiss: bool = True):
+        if np is None:
+            raise ImportError("DenseIndex requires numpy (pip install numpy)")
+        if method not in METHODS:
+            raise ValueError(f"unknown method {method!r}; expected one of {METHODS}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embedder = embedder or HashingEmbedder()
+        self.method = method
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.use_faiss = use_faiss and faiss is not None
+        self.docs: List[Dict] = []
+        self.vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._meta_index: Optional[MetaIndex] = None
+        self._reset_ann()
+        self.version = next(_VERSIONS)
+
+    def _reset_ann(self):
+        self.centroids = None  # NumPy IVF: (nlist, dim) unit centroids
+        self.list_ptr = None  # list c holds list_ids[list_ptr[c]:list_ptr[c + 1]]
+        self.list_ids = None
+        self._faiss = None
+
+    @property
+    def dim(self) -> int:
+        return self.embedder.dim
+
+    def fit(self, documents: List[str], meta: List[Dict] = None):
+        """Chunk and embed `documents` (like DocumentStore.fit) and build the ANN index."""
+        self.docs = []
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._meta_index = None
+        meta = meta or [{} for _ in documents]
+        texts, metas = [], []
+        for doc, m in zip(documents, meta):
+            for ch in make_chunks(doc, self.chunk_size, self.chunk_overlap):
+                texts.append(ch["text"])
+                metas.append(m)
+        self.add_chunks(texts, metas)
+
+    @classmethod
+    def from_store(cls, store, **kwargs) -> "DenseIndex":
+        """Embed the live chunks of a fitted DocumentStore (same chunk ids after compaction)."""
+        index = cls(chunk_size=store.chunk_size, chunk_overlap=store.chunk_overlap, **kwargs)
+        docs = [d for d in store.docs if d is not None]
+        index.add_chunks([d["text"] for d in docs], [d["meta"] for d in docs])
+        return index
+
+    def add_chunks(self, texts: List[str], metas: List[Dict]):
+        """Append chunks and rebuild the ANN structure."""
+        if texts:
+            start = len(self.docs)
+            self.docs.extend({"text": t, "meta": m} for t, m in zip(texts, metas))
+            if self._meta_index is not None:
+                for i, m in enumerate(metas, start):
+                    self._meta_index.add(i, m)
+            self.vectors = np.ascontiguousarray(np.vstack([self.vectors, self.embedder.embed(texts)]))
+        self.build()
+
+    def build(self):
+        self._reset_ann()
+        self.version = next(_VERSIONS)
+        n = len(self.docs)
+        if n == 0 or self.method == "flat" and not self.use_faiss:
+            return
+        nlist = min(self.nlist or max(1, int(math.sqrt(n))), n)
+        if self.use_faiss:
+            if self.method == "flat":
+                index = faiss.IndexFlatIP(self.dim)
+            elif self.method == "hnsw":
+                index = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+            else:
+                index = faiss.IndexIVFFlat(faiss.IndexFlatIP(self.dim), self.dim, nlist, faiss.METRIC_INNER_PRODUCT)
+                index.train(self.vectors)
+                index.nprobe = self.nprobe
+            index.add(self.vectors)
+            self._faiss = index
+            return
+        self.centroids, assign = _kmeans(self.vectors, nlist)
+        order = np.argsort(assign, kind="stable")
+        self.list_ids = order.astype(np.int32)
+        self.list_ptr = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+
+    def _search_vectors(self, q, top_k: int, exact: bool) -> List[List[Tuple[float, int]]]:
+        if not self.docs or top_k <= 0:
+            return [[] for _ in range(len(q))]
+        if exact or (self.centroids is None and self._faiss is None):
+            scores = q @ self.vectors.T
+            return [top_k_indices(row, top_k) for row in scores]
+        if self._faiss is not None:
+            k = min(top_k, len(self.docs))
+            dist, ids = self._faiss.search(q, k)
+            return [[(float(s), int(i)) for s, i in zip(ds, row) if i >= 0] for ds, row in zip(dist, ids)]
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argsort(-(q @ self.centroids.T), axis=1, kind="stable")[:, :nprobe]
+        out = []
+        for qi, lists in enumerate(probes):
+            cand = np.sort(np.concatenate([self.list_ids[self.list_ptr[c]:self.list_ptr[c + 1]] for c in lists]))
+            hits = top_k_indices(self.vectors[cand] @ q[qi], top_k)
+            out.append([(s, int(cand[j])) for s, j in hits])
+        return out
+
+    @property
+    def meta_index(self) -> MetaIndex:
+        """Chunk ids per metadata value; built on first use, then kept up to date."""
+        if self._meta_index is None:
+            self._meta_index = MetaIndex.build((i, d["meta"]) for i, d in enumerate(self.docs))
+        return self._meta_index
+
+    def _search_allowed(self, q, top_k: int, allowed) -> List[List[Tuple[float, int]]]:
+        # The ANN structures cover every chunk, so a filtered search scans its subset exactly.
+        if not len(allowed) or top_k <= 0:
+            return [[] for _ in range(len(q))]
+        scores = q @ self.vectors[allowed].T
+        return [[(s, int(allowed[j])) for s, j in top_k_indices(row, top_k)] for row in scores]
+
+    def search(self, queries: Sequence[str], top_k: int = 4, exact: bool = False,
+               filters: Dict = None) -> List[List[Tuple[float, int]]]:
+        """Batch search: one list of (score, chunk id) per query, best first."""
+        q = self.embedder.embed(list(queries))
+        if filters:
+            allowed = np.asarray(self.meta_index.select(filters), dtype=np.int64)
+            return self._search_allowed(q, top_k, allowed)
+        return self._search_vectors(q, top_k, exact)
+
+    def query(self, text: str, top_k: int = 4, exact: bool = False,
+              filters: Dict = None) -> List[Tuple[float, Dict]]:
+        return [(score, self.docs[i]) for score, i in self.search([text], top_k, exact, filters)[0]]
+
+    def query_many(self, texts: Sequence[str], top_k: int = 4, exact: bool = False,
+                   filters: Dict = None) -> List[List[Tuple[float, Dict]]]:
+        return [[(score, self.docs[i]) for score, i in hits] for hits in self.search(texts, top_k, exact, filters)]
+
+    def save(self, path) -> None:
+        """Write to directory `path`: vectors.f32 (and IVF arrays) as raw np.memmap files
+        plus meta.json with settings, chunk texts and metadata."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        arrays = {"vectors": self.vectors}
+        if self.centroids is not None:
+            arrays.update(centroids=self.centroids, list_ptr=self.list_ptr, list_ids=self.list_ids)
+        shapes = {}
+        for name, arr in arrays.items():
+            shapes[name] = [arr.dtype.str, list(arr.shape)]
+            if arr.size == 0:  # np.memmap cannot map an empty file
+                continue
+            mm = np.memmap(path / f"{name}.bin", dtype=arr.dtype, mode="w+", shape=arr.shape)
+            mm[...] = arr
+            mm.flush()
+        meta = {
+            "format": FORMAT_VERSION,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "method": self.method,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "embedder": self.embedder.config(),
+            "arrays": shapes,
+            "docs": self.docs,
+        }
+        (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path, use_faiss: bool = True) -> "DenseIndex":
+        """Open a saved index; the vector matrix stays memory-mapped read-only.
+        A faiss structure is rebuilt from the vectors when faiss is in use."""
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"unsupported dense index format {meta.get('format')} in {path}")
+        emb = meta["embedder"]
+        index = cls(meta["chunk_size"], meta["chunk_overlap"],
+                    HashingEmbedder(emb["dim"], tuple(emb["char_ngrams"]), emb["seed"]),
+                    method=meta["method"], nlist=meta["nlist"], nprobe=meta["nprobe"], use_faiss=use_faiss)
+        arrays = {}
+        for name, (dtype, shape) in meta["arrays"].items():
+            if 0 in shape:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path / f"{name}.bin", dtype=np.dtype(dtype), mode="r", shape=tuple(shape))
+        index.docs = meta["docs"]
+        index.vectors = arrays["vectors"]
+        if index.use_faiss:
+            index.build()
+        elif "centroids" in arrays:
+            index.centroids = arrays["centroids"]
+            index.list_ptr = arrays["list_ptr"]
+            index.list_ids = arrays["list_ids"]
+        elif index.method != "flat":
+            index.build()
+        return index
@@ -0,0 +1,309 @@
+"""Versioned binary format for a fitted DocumentStore.
+
+Layout (native byte order, recorded in the header; sections 8-byte aligned):
+
+    magic "FRAGIDX\\0" | version u32 | reserved u32 | header_len u64 | JSON header | sections
+
+The JSON header holds the store settings, the distinct chunk metadata dicts
+and a section table of name -> [offset, length, typecode]. Sections are flat
+arrays (sorted term blob + offsets, df, term-major (chunk id, tf) postings, chunk norms,
+chunk token counts, chunk metadata ids, chunk text offsets + UTF-8 text blob, per-chunk
+sentence (start, end, source line) rows), so loading only
+parses the header and wraps the rest in memoryviews; with mmap=True several
+processes share the same page-cache pages.
+"""
+import bisect
+import functools
+import json
+import math
+import mmap as _mmap
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils.text import tokenize
+from .records import Chunk
+
+MAGIC = b"FRAGIDX\0"
+VERSION = 5  # 5: sentence rows index the whitespace-normalised chunk text
+_PREFIX = struct.Struct("<8sIIQ")
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class TermTable:
+    """Sorted UTF-8 term list; lookups binary-search the blob without decoding it all."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _key(self, i: int) -> bytes:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def term(self, i: int) -> str:
+        return self._key(i).decode("utf-8")
+
+    def find(self, term: str) -> int:
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._key(lo) == key:
+            return lo
+        return -1
+
+
+class PostingsView:
+    """Read-only term -> [(chunk id, tf)] mapping over the postings sections."""
+
+    def __init__(self, terms: TermTable, ptr, ids, weights):
+        self.terms = terms
+        self.ptr = ptr
+        self.ids = ids
+        self.weights = weights
+
+    def _row(self, i: int):
+        a, b = self.ptr[i], self.ptr[i + 1]
+        return zip(self.ids[a:b], self.weights[a:b])
+
+    def get(self, term: str, default=None):
+        i = self.terms.find(term)
+        return default if i < 0 else self._row(i)
+
+    def restrict(self, term: str, allowed: List[int]) -> Optional[List[Tuple[int, float]]]:
+        """The postings of `term` whose chunk id is in the sorted `allowed` (None for
+        an unknown term); a few ids are binary-searched in the id-sorted row."""
+        i = self.terms.find(term)
+        if i < 0:
+            return None
+        a, b = self.ptr[i], self.ptr[i + 1]
+        ids, weights = self.ids, self.weights
+        if len(allowed) * 8 >= b - a:
+            keep = set(allowed)
+            return [(c, w) for c, w in zip(ids[a:b], weights[a:b]) if c in keep]
+        out = []
+        for c in allowed:
+            j = bisect.bisect_left(ids, c, a, b)
+            if j < b and ids[j] == c:
+                out.append((c, weights[j]))
+        return out
+
+    def __contains__(self, term: str) -> bool:
+        return self.terms.find(term) >= 0
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def items(self):
+        for i in range(len(self.terms)):
+            yield self.terms.term(i), list(self._row(i))
+
+
+class DfView:
+    """Read-only term -> document frequency mapping."""
+
+    def __init__(self, terms: TermTable, df):
+        self.terms = terms
+        self.df = df
+
+    def get(self, term: str, default=None):
+        i = self.terms.find(term)
+        return default if i < 0 else self.df[i]
+
+    def __getitem__(self, term: str) -> int:
+        i = self.terms.find(term)
+        if i < 0:
+            raise KeyError(term)
+        return self.df[i]
+
+    def __contains__(self, term: str) -> bool:
+        return self.terms.find(term) >= 0
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+
+class DocsView(Sequence):
+    """Chunk records decoded lazily from the text blob.
+
+    Recently used Chunks are memoised, so hot chunks are decoded (and their
+    sentences tokenized) once.
+    """
+
+    def __init__(self, text_offsets, text_blob, chunk_meta, metas: List[Dict], sent_ptr, sent_rows):
+        self.text_offsets = text_offsets
+        self.text_blob = text_blob
+        self.chunk_meta = chunk_meta
+        self.metas = metas
+        self.sent_ptr = sent_ptr
+        self.sent_rows = sent_rows
+        self._chunk = functools.lru_cache(maxsize=1024)(self._load_chunk)
+
+    def _load_chunk(self, i: int) -> Chunk:
+        rows = self.sent_rows[3 * self.sent_ptr[i]:3 * self.sent_ptr[i + 1]]
+        return Chunk(self.text_blob, self.text_offsets[i], self.text_offsets[i + 1], self.metas[self.chunk_meta[i]], rows)
+
+    def __len__(self) -> int:
+        return len(self.text_offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        return self._chunk(i)
+
+
+def _term_major(store) -> Tuple[Dict[str, List[Tuple[int, float]]], List[float]]:
+    """Term -> [(chunk id, tf)] postings plus tf-idf chunk norms, whichever backend the store uses."""
+    if store.csr is None:
+        return store.postings, list(store.norms)
+    # The csr backend keeps only normalised weights, so recover tf from the chunk text.
+    postings: Dict[str, List[Tuple[int, float]]] = {}
+    norms = []
+    for i, d in enumerate(store.docs):
+        tf = store._tf(tokenize(d["text"]))
+        for t, w in tf.items():
+            postings.setdefault(t, []).append((i, w))
+        norms.append(math.sqrt(sum(w * w for w in (v * store._idf(t) for t, v in tf.items()))) or 1e-12)
+    return postings, norms
+
+
+def save_store(store, path) -> None:
+    postings, norms = _term_major(store)
+    items = sorted(postings.items(), key=lambda kv: kv[0].encode("utf-8"))
+
+    term_offsets = array("q", [0])
+    term_blob = bytearray()
+    df = array("i")
+    post_ptr = array("q", [0])
+    post_ids = array("i")
+    post_weights = array("d")
+    for t, plist in items:
+        term_blob += t.encode("utf-8")
+        term_offsets.append(len(term_blob))
+        df.append(store.vocab_df.get(t, 0))
+        for i, w in plist:
+            post_ids.append(i)
+            post_weights.append(w)
+        post_ptr.append(len(post_ids))
+
+    metas: List[Dict] = []
+    meta_ids: Dict[str, int] = {}
+    chunk_meta = array("i")
+    text_offsets = array("q", [0])
+    text_blob = bytearray()
+    sent_ptr = array("q", [0])
+    sent_rows = array("i")
+    for d in store.docs:
+        key = json.dumps(d["meta"], sort_keys=True)
+        if key not in meta_ids:
+            meta_ids[key] = len(metas)
+            metas.append(d["meta"])
+        chunk_meta.append(meta_ids[key])
+        text_blob += d.arena[d.start:d.end]
+        text_offsets.append(len(text_blob))
+        sent_rows.extend(d.rows)
+        sent_ptr.append(len(sent_rows) // 3)
+
+    sections = [
+        ("term_offsets", term_offsets),
+        ("term_blob", bytes(term_blob)),
+        ("df", df),
+        ("post_ptr", post_ptr),
+        ("post_ids", post_ids),
+        ("post_weights", post_weights),
+        ("norms", array("d", norms)),
+        ("lengths", array("i", store.lengths)),
+        ("chunk_meta", chunk_meta),
+        ("text_offsets", text_offsets),
+        ("text_blob", bytes(text_blob)),
+        ("sent_ptr", sent_ptr),
+        ("sent_rows", sent_rows),
+    ]
+    table = {}
+    offset = 0
+    for name, data in sections:
+        typecode = data.typecode if isinstance(data, array) else "B"
+        nbytes = len(data) * (data.itemsize if isinstance(data, array) else 1)
+        table[name] = [offset, nbytes, typecode]
+        offset = _align(offset + nbytes)
+
+    header = json.dumps({
+        "byteorder": sys.byteorder,
+        "chunk_size": store.chunk_size,
+        "chunk_overlap": store.chunk_overlap,
+        "chunk_mode": store.chunk_mode,
+        "num_docs": store.num_docs,
+        "metas": metas,
+        "sections": table,
+    }).encode("utf-8")
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, 0, len(header)))
+        f.write(header)
+        base = _align(_PREFIX.size + len(header))
+        for name, data in sections:
+            f.write(b"\0" * (base + table[name][0] - f.tell()))
+            f.write(data.tobytes() if isinstance(data, array) else data)
+    tmp.replace(path)
+
+
+def load_store(store, path, mmap: bool = True):
+    """Populate an empty DocumentStore from a file written by save_store."""
+    path = Path(path)
+    if mmap:
+        with open(path, "rb") as f:
+            buf = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+    else:
+        buf = path.read_bytes()
+    mv = memoryview(buf)
+
+    magic, version, _, header_len = _PREFIX.unpack_from(mv, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a DocumentStore index")
+    if version != VERSION:
+        raise ValueError(f"unsupported index version {version} in {path} (expected {VERSION})")
+    header = json.loads(bytes(mv[_PREFIX.size:_PREFIX.size + header_len]))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError(f"{path} was written on a {header['byteorder']}-endian machine")
+    base = _align(_PREFIX.size + header_len)
+
+    def section(name):
+        offset, nbytes, typecode = header["sections"][name]
+        view = mv[base + offset:base + offset + nbytes]
+        return view if typecode == "B" else view.cast(typecode)
+
+    terms = TermTable(section("term_offsets"), section("term_blob"))
+    store.chunk_size = header["chunk_size"]
+    store.chunk_overlap = header["chunk_overlap"]
+    store.chunk_mode = header.get("chunk_mode", "words")
+    store.num_docs = header["num_docs"]
+    store.vocab_df = DfView(terms, section("df"))
+    store.postings = PostingsView(terms, section("post_ptr"), section("post_ids"), section("post_weights"))
+    store.norms = section("norms")
+    store.lengths = section("lengths")
+    store.docs = DocsView(section("text_offsets"), section("text_blob"), section("chunk_meta"), header["metas"],
+                          section("sent_ptr"), section("sent_rows"))
+    store.vectors = []
+    store.csr = None
+    store._buffer = buf
+    return store
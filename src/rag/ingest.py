@@ -0,0 +1,105 @@
+"""Streaming, process-parallel ingestion.
+
+Each batch of files flows through generator stages
+read -> clean_text -> chunk_document -> tokenize_many -> per-batch df counts
+inside a worker process. The parent keeps at most a few batches in flight,
+merges each batch's df table into the store and indexes its chunks, so
+memory held by the pipeline stays flat however large the corpus is.
+"""
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from data.loader import clean_text
+from utils.text import tokenize_many
+from .records import Chunk, chunk_document
+from .vector_store import DocumentStore, _term_frequencies
+
+Job = Tuple[str, str]  # (raw path, clean path)
+Record = Tuple[str, Chunk, Dict[str, float], int]  # (source, chunk, tf, token count)
+
+
+def read_files(jobs: Iterable[Job]) -> Iterator[Tuple[str, bytes]]:
+    for raw, out in jobs:
+        yield out, Path(raw).read_bytes()
+
+
+def normalize(items: Iterable[Tuple[str, bytes]]) -> Iterator[Tuple[str, str]]:
+    for out, raw in items:
+        text = clean_text(raw)
+        Path(out).write_text(text, encoding="utf-8")
+        yield out, text
+
+
+def chunk(items: Iterable[Tuple[str, str]], size: int, overlap: int,
+          mode: str = "words") -> Iterator[Tuple[str, List[Chunk]]]:
+    for source, text in items:
+        yield source, list(chunk_document(text, size, overlap, {"source": source}, mode))
+
+
+def tokenize(items: Iterable[Tuple[str, List[Chunk]]]) -> Iterator[Record]:
+    for source, chunks in items:
+        for ch, tokens in zip(chunks, tokenize_many(ch.text for ch in chunks)):
+            yield source, ch, _term_frequencies(tokens), len(tokens)
+
+
+def count_df(records: Iterable[Record]) -> Tuple[List[Record], Counter]:
+    out = []
+    df = Counter()
+    for rec in records:
+        out.append(rec)
+        df.update(rec[2].keys())
+    return out, df
+
+
+def process_batch(jobs: List[Job], chunk_size: int, chunk_overlap: int,
+                  chunk_mode: str = "words") -> Tuple[List[Record], Counter]:
+    """Run one batch through every stage; this is what each worker executes."""
+    return count_df(tokenize(chunk(normalize(read_files(jobs)), chunk_size, chunk_overlap, chunk_mode)))
+
+
+def _batched(items: Iterable, n: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+def stream_batches(jobs: Iterable[Job], chunk_size: int = 600, chunk_overlap: int = 80,
+                   workers: Optional[int] = None, batch_size: int = 16,
+                   chunk_mode: str = "words") -> Iterator[Tuple[List[Record], Counter]]:
+    """Yield (records, df) per batch, in input order.
+
+    workers=1 runs in-process; otherwise batches fan out to a process pool
+    with at most 2 * workers batches pending at any time.
+    """
+    batches = _batched(jobs, batch_size)
+    if workers == 1:
+        for batch in batches:
+            yield process_batch(batch, chunk_size, chunk_overlap, chunk_mode)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        limit = 2 * workers
+        pending = deque()
+        for batch in batches:
+            pending.append(ex.submit(process_batch, batch, chunk_size, chunk_overlap, chunk_mode))
+            if len(pending) >= limit:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def ingest_files(store: DocumentStore, jobs: Iterable[Job], workers: Optional[int] = None,
+                 batch_size: int = 16) -> int:
+    """Stream files into `store`. Returns the number of chunks added."""
+    added = 0
+    for records, df in stream_batches(jobs, store.chunk_size, store.chunk_overlap, workers, batch_size,
+                                      store.chunk_mode):
+        added += store.add_chunks(((ch, tf, n) for _, ch, tf, n in records), df)
+    return added
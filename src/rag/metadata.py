@@ -0,0 +1,128 @@
+"""Metadata index for query-time filters.
+
+MetaIndex maps every (field, value) of the chunk meta dicts to the sorted
+array of chunk ids carrying it (list-valued fields index each element), and
+keeps each field's distinct values sorted for range conditions. A filter is
+a dict of field -> condition, all of which must hold:
+
+    {"source": "data/clean/10k.txt"}                      equal to
+    {"doc_type": ["10-K", "10-Q"]}                        any of
+    {"date": {"gte": "2023-01-01", "lt": "2024-01-01"}}   range (gt/gte/lt/lte)
+
+Dates are compared as ISO-8601 strings, so keep them in that form; numbers
+compare numerically. A range only matches values of its bounds' kind.
+"""
+import bisect
+from array import array
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+RANGE_OPS = ("gt", "gte", "lt", "lte")
+_SCALARS = (str, int, float, bool)
+
+
+def _pairs(meta: Dict) -> Iterator[Tuple[str, Hashable]]:
+    for field, value in meta.items():
+        if isinstance(value, (list, tuple)):
+            for v in value:
+                if isinstance(v, _SCALARS):
+                    yield field, v
+        elif isinstance(value, _SCALARS):
+            yield field, value
+
+
+def _kind(value) -> type:
+    return str if isinstance(value, str) else float
+
+
+def validate_filters(filters) -> Dict:
+    """Return `filters` if it is a well-formed filter dict, else raise ValueError."""
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object of field -> condition")
+    for field, cond in filters.items():
+        if isinstance(cond, dict):
+            unknown = set(cond) - set(RANGE_OPS)
+            if unknown or not cond:
+                raise ValueError(f"filter on {field!r}: range keys must be among {list(RANGE_OPS)}")
+            bounds = list(cond.values())
+            if not all(isinstance(b, _SCALARS) and not isinstance(b, bool) for b in bounds) \
+                    or len({_kind(b) for b in bounds}) > 1:
+                raise ValueError(f"filter on {field!r}: range bounds must be all strings or all numbers")
+        elif isinstance(cond, list):
+            if not all(isinstance(v, _SCALARS) for v in cond):
+                raise ValueError(f"filter on {field!r}: values must be strings, numbers or booleans")
+        elif not isinstance(cond, _SCALARS):
+            raise ValueError(f"filter on {field!r}: expected a value, a list of values or a range")
+    return filters
+
+
+class MetaIndex:
+    """(field, value) -> sorted chunk ids, plus sorted distinct values per field."""
+
+    def __init__(self):
+        self.values: Dict[str, Dict[Hashable, array]] = {}
+        self._sorted: Dict[Tuple[str, type], List] = {}  # (field, kind) -> sorted distinct values
+        self._last: Tuple[Optional[Dict], List] = (None, [])
+
+    @classmethod
+    def build(cls, metas: Iterable[Tuple[int, Dict]]) -> "MetaIndex":
+        """Index (chunk id, meta) pairs given in increasing id order."""
+        index = cls()
+        for i, meta in metas:
+            index.add(i, meta)
+        return index
+
+    def add(self, i: int, meta: Dict):
+        """Index chunk `i`; ids must arrive in increasing order."""
+        last, pairs = self._last
+        if meta is not last:  # chunks of one source share one meta dict
+            pairs = list(_pairs(meta))
+            self._last = (meta, pairs)
+        for field, value in pairs:
+            by_value = self.values.setdefault(field, {})
+            ids = by_value.get(value)
+            if ids is None:
+                ids = by_value[value] = array("i")
+                self._sorted.pop((field, _kind(value)), None)
+            ids.append(i)
+
+    def _range(self, field: str, cond: Dict) -> Iterator[Hashable]:
+        kind = _kind(next(iter(cond.values())))
+        keys = self._sorted.get((field, kind))
+        if keys is None:
+            keys = self._sorted[(field, kind)] = sorted(
+                v for v in self.values.get(field, ()) if _kind(v) is kind and not isinstance(v, bool))
+        lo, hi = 0, len(keys)
+        if "gte" in cond:
+            lo = max(lo, bisect.bisect_left(keys, cond["gte"]))
+        if "gt" in cond:
+            lo = max(lo, bisect.bisect_right(keys, cond["gt"]))
+        if "lte" in cond:
+            hi = min(hi, bisect.bisect_right(keys, cond["lte"]))
+        if "lt" in cond:
+            hi = min(hi, bisect.bisect_left(keys, cond["lt"]))
+        return iter(keys[lo:hi])
+
+    def _match(self, field: str, cond) -> Set[int]:
+        by_value = self.values.get(field, {})
+        if isinstance(cond, dict):
+            values = self._range(field, cond)
+        elif isinstance(cond, list):
+            values = cond
+        else:
+            values = (cond,)
+        out: Set[int] = set()
+        for v in values:
+            ids = by_value.get(v)
+            if ids is not None:
+                out.update(ids)
+        return out
+
+    def select(self, filters: Dict) -> List[int]:
+        """Sorted ids of the chunks matching every condition in `filters`."""
+        result: Optional[Set[int]] = None
+        for field, cond in validate_filters(filters).items():
+            ids = self._match(field, cond)
+            result = ids if result is None else result & ids
+            if not result:
+                return []
+        return sorted(result) if result is not None else []
@@ -1,27 +1,138 @@
-from typing import Dict, List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from .vector_store import DocumentStore
 from llm.local import LocalAnswerComposer
+from monitoring.metrics_stub import NULL_TRACER
 
 
 class RagPipeline:
-    def __init__(self, store: DocumentStore, answerer: LocalAnswerComposer):
+    """Retrieve then compose. `store` is a DocumentStore or any retriever with the
+    same query(text, top_k) -> [(score, {"text", "meta"})] method, e.g. rag.dense.DenseIndex.
+
+    With an `evaluator` (e.g. eval.metrics.GroundingEvaluator), results also carry
+    "metrics" = evaluator(query, answer, contexts), computed from the internal
+    contexts so precomputed sentence data is reused. Composition and evaluation
+    are timed as "stage.compose" / "stage.evaluate" spans on `tracer`.
+
+    answer_many() composes inline by default; with `workers` > 1 it composes on
+    one long-lived pool of that many threads, which pays off for answerers that
+    wait on I/O (an LLM server) rather than for the CPU-bound local composer."""
+
+    def __init__(self, store: DocumentStore, answerer: LocalAnswerComposer,
+                 evaluator: Optional[Callable[[str, str, List[Dict]], Dict]] = None, tracer=None,
+                 workers: int = 0):
         self.store = store
         self.answerer = answerer
+        self.evaluator = evaluator
+        self.tracer = tracer or NULL_TRACER
+        self.workers = workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rag-compose")
+        return self._pool
 
-    def answer(self, query: str, top_k: int = 4) -> Dict:
-        hits = self.store.query(query, top_k=top_k)
+    def _compose(self, query: str, contexts: List[Dict]) -> Dict:
+        with self.tracer.span("stage.compose"):
+            return self.answerer.compose(query, contexts)
+
+    def _evaluate(self, query: str, answer: str, contexts: List[Dict]) -> Dict:
+        with self.tracer.span("stage.evaluate"):
+            return self.evaluator(query, answer, contexts)
+
+    @staticmethod
+    def _contexts(hits: List[Tuple[float, Dict]]) -> List[Dict]:
+        """Context dicts for the answerer. Chunks indexed with sentence data also get
+        "line" (where the chunk starts in its source document) and "sentences",
+        which stays internal (see _public)."""
         contexts = []
         for score, doc in hits:
-            contexts.append({
+            ctx = {
                 "score": score,
                 "text": doc["text"],
                 "source": doc["meta"].get("source", "unknown")
-            })
-        composed = self.answerer.compose(query, contexts)
-        return {
+            }
+            sents = doc.get("sentences")
+            if sents is not None:
+                ctx["line"] = sents.lines[0] if len(sents) else 1
+                ctx["sentences"] = sents
+            contexts.append(ctx)
+        return contexts
+
+    @staticmethod
+    def _public(contexts: List[Dict]) -> List[Dict]:
+        return [{k: v for k, v in c.items() if k != "sentences"} for c in contexts]
+
+    def retrieve(self, query: str, top_k: int = 4, filters: Optional[Dict] = None) -> List[Dict]:
+        """Top contexts, among chunks whose metadata matches `filters` (see
+        rag.metadata; only passed on to the store when given)."""
+        if filters:
+            return self._contexts(self.store.query(query, top_k=top_k, filters=filters))
+        return self._contexts(self.store.query(query, top_k=top_k))
+
+    def retrieve_many(self, queries: List[str], top_k: int = 4, filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """retrieve() for a batch; one scoring pass when the store has query_many."""
+        if hasattr(self.store, "query_many"):
+            kwargs = {"filters": filters} if filters else {}
+            return [self._contexts(hits) for hits in self.store.query_many(queries, top_k=top_k, **kwargs)]
+        return [self.retrieve(q, top_k=top_k, filters=filters) for q in queries]
+
+    def answer(self, query: str, top_k: int = 4, filters: Optional[Dict] = None) -> Dict:
+        contexts = self.retrieve(query, top_k=top_k, filters=filters)
+        return self._result(query, contexts, self._compose(query, contexts))
+
+    def answer_many(self, queries: List[str], top_k: int = 4, filters: Optional[Dict] = None) -> List[Dict]:
+        """answer() for every query, results in input order. Retrieval is batched
+        (retrieve_many); composition runs inline or on the pipeline's pool."""
+        batch = self.retrieve_many(queries, top_k=top_k, filters=filters)
+
+        def compose(i: int) -> Dict:
+            return self._result(queries[i], batch[i], self._compose(queries[i], batch[i]))
+
+        if self.workers > 1 and len(queries) > 1:
+            return list(self._executor().map(compose, range(len(queries))))
+        return [compose(i) for i in range(len(queries))]
+
+    def close(self):
+        """Stop the composition pool, if one was started."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _result(self, query: str, contexts: List[Dict], composed: Dict) -> Dict:
+        out = {
             "query": query,
             "answer": composed["answer"],
             "citations": composed["citations"],
-            "contexts": contexts,
+            "contexts": RagPipeline._public(contexts),
         }
+        for extra in ("packing", "llm_cache"):
+            if extra in composed:
+                out[extra] = composed[extra]
+        if self.evaluator is not None:
+            out["metrics"] = self._evaluate(query, composed["answer"], contexts)
+        return out
 
+    def answer_stream(self, query: str, top_k: int = 4, filters: Optional[Dict] = None) -> Iterator[Tuple[str, Dict]]:
+        """Yield ("contexts", ...) first, then the answerer's token/citation events and
+        ("done", {"answer", "citations"}, plus "metrics" with an evaluator).
+        Answerers without compose_stream emit the whole answer as one token."""
+        contexts = self.retrieve(query, top_k=top_k, filters=filters)
+        yield "contexts", {"query": query, "contexts": self._public(contexts)}
+        if hasattr(self.answerer, "compose_stream"):
+            events = self.answerer.compose_stream(query, contexts)
+        else:
+            composed = self._compose(query, contexts)
+            events = [("token", {"text": composed["answer"]})]
+            events += [("citation", c) for c in composed["citations"]]
+            events.append(("done", {"answer": composed["answer"], "citations": composed["citations"]}))
+        for event, data in events:
+            if event == "done" and self.evaluator is not None:
+                data["metrics"] = self._evaluate(query, data["answer"], contexts)
+            yield event, data
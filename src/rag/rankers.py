@@ -0,0 +1,187 @@
+"""Pluggable chunk scorers for the dict backend of DocumentStore.
+
+A Ranker maps query tokens to {chunk id: score} for the chunks that share
+at least one term with the query; the store drops tombstoned chunks and
+takes the top k. Per-chunk statistics (cosine norms, BM25 length
+normalisers) are computed once per store version, so a query only walks
+the postings of its own terms. scores_many() scores a batch of queries
+reading each distinct term's postings list once. With `allowed` (a set of
+chunk ids, from a metadata filter) only those chunks compete: scorers may
+still return others, which the store drops, but rank- or max-based scorers
+(FusionRanker) must leave them out of their ranks and maxima.
+"""
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Set
+
+
+class SharedPostings:
+    """Memoising view of store.postings: each term's list is read (and, for a
+    memory-mapped store, decoded) once however many queries use it."""
+
+    def __init__(self, postings):
+        self.postings = postings
+        self._lists: Dict[str, Optional[list]] = {}
+
+    def get(self, term: str, default=None):
+        try:
+            plist = self._lists[term]
+        except KeyError:
+            plist = self.postings.get(term)
+            self._lists[term] = plist = list(plist) if plist is not None else None
+        return default if plist is None else plist
+
+
+class Ranker:
+    name = "ranker"
+
+    def scores(self, store, tokens: List[str], postings=None,
+               allowed: Optional[Set[int]] = None) -> Dict[int, float]:
+        """{chunk id: score}; `postings` overrides store.postings (see SharedPostings)."""
+        raise NotImplementedError
+
+    def scores_many(self, store, token_lists: Sequence[List[str]],
+                    allowed: Optional[Set[int]] = None) -> List[Dict[int, float]]:
+        postings = SharedPostings(store.postings)
+        return [self.scores(store, tokens, postings, allowed) for tokens in token_lists]
+
+
+class CosineRanker(Ranker):
+    """Cosine similarity of smoothed TF-IDF vectors (the store's original scorer)."""
+
+    name = "cosine"
+
+    def scores(self, store, tokens: List[str], postings=None,
+               allowed: Optional[Set[int]] = None) -> Dict[int, float]:
+        if store._norms_stale:
+            store._refresh_norms()
+        postings = postings or store.postings
+        q_vec = store._tfidf(tokens)
+        # Accumulation follows q_vec order so scores match DocumentStore._sim bit for bit.
+        acc: Dict[int, float] = {}
+        for t, a in q_vec.items():
+            idf = store._idf(t)
+            for i, tf in postings.get(t, ()):
+                acc[i] = acc.get(i, 0.0) + a * (tf * idf)
+        q_norm = math.sqrt(sum(a * a for a in q_vec.values())) or 1e-12
+        norms = store.norms
+        return {i: dot / (q_norm * norms[i]) for i, dot in acc.items()}
+
+
+class BM25Ranker(Ranker):
+    """Okapi BM25; delta > 0 gives BM25+ (a floor for matches in long chunks)."""
+
+    name = "bm25"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, delta: float = 0.0):
+        self.k1 = k1
+        self.b = b
+        self.delta = delta
+        self._prepared = (None, None)
+
+    def _length_norms(self, store) -> List[float]:
+        """k1 * (1 - b + b * len / avgdl) per chunk, cached per store version."""
+        version, norms = self._prepared
+        if version != store.version:
+            avgdl = store.avgdl
+            k1, b = self.k1, self.b
+            norms = [k1 * (1.0 - b + b * n / avgdl) for n in store.lengths]
+            self._prepared = (store.version, norms)
+        return norms
+
+    def __getstate__(self):
+        # The norm cache belongs to this process's store; don't ship it (rag.sharded).
+        return dict(self.__dict__, _prepared=(None, None))
+
+    def idf(self, store, term: str) -> float:
+        df = store.vocab_df.get(term, 0)
+        return math.log(1.0 + (store.num_docs - df + 0.5) / (df + 0.5))
+
+    def scores(self, store, tokens: List[str], postings=None,
+               allowed: Optional[Set[int]] = None) -> Dict[int, float]:
+        norms = self._length_norms(store)
+        postings = postings or store.postings
+        lengths = store.lengths
+        k1p1, delta = self.k1 + 1.0, self.delta
+        acc: Dict[int, float] = {}
+        for t, qtf in Counter(tokens).items():
+            plist = postings.get(t)
+            if plist is None:
+                continue
+            w = qtf * self.idf(store, t)
+            for i, tf in plist:
+                c = tf * lengths[i]  # postings hold tf = count / chunk length
+                acc[i] = acc.get(i, 0.0) + w * (c * k1p1 / (c + norms[i]) + delta)
+        return acc
+
+
+class BM25PlusRanker(BM25Ranker):
+    name = "bm25+"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, delta: float = 1.0):
+        super().__init__(k1, b, delta)
+
+
+class FusionRanker(Ranker):
+    """Combine several rankers.
+
+    method="rrf" sums weight / (k + rank) over each ranker's ordering;
+    method="weighted" sums weight * score / max score, so rankers on
+    different scales contribute comparably.
+    """
+
+    name = "fusion"
+    METHODS = ("rrf", "weighted")
+
+    def __init__(self, rankers: Sequence[Ranker], weights: Optional[Sequence[float]] = None,
+                 method: str = "rrf", k: int = 60):
+        if method not in self.METHODS:
+            raise ValueError(f"unknown fusion method {method!r}; expected one of {self.METHODS}")
+        if weights is not None and len(weights) != len(rankers):
+            raise ValueError("need one weight per ranker")
+        self.rankers = list(rankers)
+        self.weights = list(weights) if weights is not None else [1.0] * len(self.rankers)
+        self.method = method
+        self.k = k
+
+    def scores(self, store, tokens: List[str], postings=None,
+               allowed: Optional[Set[int]] = None) -> Dict[int, float]:
+        deleted = store._deleted
+        acc: Dict[int, float] = {}
+        for ranker, weight in zip(self.rankers, self.weights):
+            run = ranker.scores(store, tokens, postings, allowed)
+            # Ranks and maxima only count live (and allowed) chunks.
+            live = [i for i in run if i not in deleted and (allowed is None or i in allowed)]
+            if self.method == "rrf":
+                live.sort(key=lambda i: (-run[i], i))
+                for rank, i in enumerate(live, 1):
+                    acc[i] = acc.get(i, 0.0) + weight / (self.k + rank)
+            else:
+                top = max((run[i] for i in live), default=0.0) or 1.0
+                for i in live:
+                    acc[i] = acc.get(i, 0.0) + weight * run[i] / top
+        return acc
+
+
+RANKERS = {
+    "cosine": CosineRanker,
+    "bm25": BM25Ranker,
+    "bm25+": BM25PlusRanker,
+}
+
+
+def make_ranker(spec: str) -> Ranker:
+    """Ranker from a name ("cosine", "bm25", "bm25+") or a fusion spec like
+    "rrf:bm25,cosine" / "weighted:bm25=0.7,cosine=0.3"."""
+    method, sep, rest = spec.partition(":")
+    if not sep:
+        try:
+            return RANKERS[spec]()
+        except KeyError:
+            raise ValueError(f"unknown ranker {spec!r}; expected one of {sorted(RANKERS)}") from None
+    rankers, weights = [], []
+    for part in rest.split(","):
+        name, _, weight = part.partition("=")
+        rankers.append(make_ranker(name.strip()))
+        weights.append(float(weight) if weight else 1.0)
+    return FusionRanker(rankers, weights, method=method)
@@ -0,0 +1,118 @@
+"""Compact chunk records.
+
+Chunks are spans of their source document (see rag.chunker.iter_spans).
+The document is UTF-8 encoded once into an arena shared by all of its
+chunks; a Chunk keeps only the arena, its [start, end) byte offsets, the
+per-source meta dict and its sentence rows, and decodes the text on
+access, whitespace-normalised (tokens joined by single spaces, as chunk
+text has always read). Overlap regions are not stored twice, one
+non-Latin-1 character does not widen a whole document to 2-4 bytes per
+character, and the per-chunk cost is a few small objects instead of a
+dict, a string and a prepared ChunkSentences.
+"""
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+from .chunker import iter_spans
+from .sentences import ChunkSentences
+
+
+class _SentenceCache:
+    """Bounded LRU of prepared ChunkSentences, so hot chunks are tokenized once.
+
+    Keyed on weak references: an entry never keeps its Chunk (or the arena
+    behind it, possibly an mmap) alive once the store dropped it; the dead
+    entry can no longer match and ages out.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[weakref.ref, ChunkSentences]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, chunk: "Chunk") -> ChunkSentences:
+        ref = weakref.ref(chunk)
+        with self._lock:
+            sents = self._entries.get(ref)
+            if sents is not None:
+                self._entries.move_to_end(ref)
+                return sents
+        sents = ChunkSentences.from_rows(chunk.text, chunk.rows)
+        with self._lock:
+            self._entries[ref] = sents
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return sents
+
+
+_sentences = _SentenceCache()
+
+
+class Chunk:
+    """One chunk: UTF-8 arena[start:end] (raw document text) plus its meta and
+    sentence rows (offsets into the normalised text). `arena` is any
+    bytes-like object, e.g. a memoryview of a memory-mapped index.
+
+    Reads like the {"text", "meta", "sentences"} dict chunk records used to
+    be (chunk["text"], chunk.get("sentences")), so retrievers returning plain
+    dicts stay interchangeable.
+    """
+
+    __slots__ = ("arena", "start", "end", "meta", "rows", "__weakref__")
+    _FIELDS = ("text", "meta", "sentences")
+
+    def __init__(self, arena, start: int, end: int, meta: Dict, rows: array):
+        self.arena = arena
+        self.start = start
+        self.end = end
+        self.meta = meta
+        self.rows = rows
+
+    @property
+    def text(self) -> str:
+        return " ".join(str(self.arena[self.start:self.end], "utf-8").split())
+
+    @property
+    def sentences(self) -> ChunkSentences:
+        return _sentences(self)
+
+    def __getitem__(self, key: str):
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self._FIELDS else default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._FIELDS
+
+    def keys(self):
+        return self._FIELDS
+
+    def __repr__(self) -> str:
+        return f"Chunk({self.text[:40]!r}..., meta={self.meta!r})"
+
+
+def chunk_document(text: str, size: int, overlap: int, meta: Optional[Dict] = None,
+                   mode: str = "words") -> Iterator[Chunk]:
+    """iter_spans() chunks of `text` as Chunks over one shared arena, with sentence rows."""
+    arena = text.encode("utf-8")
+    ascii_only = len(arena) == len(text)
+    meta = {} if meta is None else meta
+    line, pos = 1, 0
+    # Character -> byte offset cursors; chunk starts and ends both only move forward.
+    char_a = byte_a = char_b = byte_b = 0
+    for a, b in iter_spans(text, size, overlap, mode):
+        line += text.count("\n", pos, a)
+        pos = a
+        rows = ChunkSentences.from_chunk(text[a:b], line).rows()
+        if not ascii_only:
+            byte_a += len(text[char_a:a].encode("utf-8"))
+            byte_b += len(text[char_b:b].encode("utf-8"))
+            char_a, char_b = a, b
+            a, b = byte_a, byte_b
+        yield Chunk(arena, a, b, meta, rows)
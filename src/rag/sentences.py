@@ -0,0 +1,133 @@
+"""Per-chunk sentence data.
+
+Extractive composition scores sentences by query-term overlap. Splitting
+every retrieved chunk on every request makes that cost grow with chunk
+size, so sentence spans into the chunk text and the source-document line
+each sentence starts on are computed once at index time (stored as flat
+(start, end, line) rows, see rag.records). A ChunkSentences built from them
+adds per-sentence term sets, a term -> sentences index and the chunk's full
+token set (for grounding evaluation) on first use.
+"""
+import heapq
+from array import array
+from typing import Dict, FrozenSet, List, Sequence, Set, Tuple
+
+from utils.text import split_sentences, tokenize_many
+
+# Shorter terms (articles, "of", "to", ...) carry little signal for sentence selection.
+MIN_TERM_LEN = 3
+
+
+class ChunkSentences:
+    """Sentences of one chunk: (start, end) spans into `text`, source line numbers,
+    and (after prepare()) term sets, a term index, a size-ordered list and the
+    set of every token in the chunk."""
+
+    __slots__ = ("text", "spans", "lines", "_terms", "_index", "_by_size", "_tokens")
+
+    def __init__(self, text: str, spans: Sequence[Tuple[int, int]], lines: Sequence[int]):
+        self.text = text
+        self.spans = spans
+        self.lines = lines
+        self._terms = None
+        self._index = None
+        self._by_size = None
+        self._tokens = None
+
+    @classmethod
+    def from_chunk(cls, text: str, line: int) -> "ChunkSentences":
+        """Sentences of a chunk whose raw text (a slice of its document) starts on
+        line `line`; spans index the whitespace-normalised text (Chunk.text)."""
+        flat = " ".join(text.split())
+        spans, lines = [], []
+        pos = flat_pos = 0
+        for sent in split_sentences(text):
+            a = text.find(sent, pos)
+            line += text.count("\n", pos, a)
+            pos = a + len(sent)
+            sent = " ".join(sent.split())
+            flat_a = flat.find(sent, flat_pos)
+            flat_pos = flat_a + len(sent)
+            spans.append((flat_a, flat_pos))
+            lines.append(line)
+            line += text.count("\n", a, pos)
+        return cls(flat, spans, lines)
+
+    @classmethod
+    def from_text(cls, text: str) -> "ChunkSentences":
+        """For text with no known source position; "lines" are sentence ordinals."""
+        spans, pos = [], 0
+        for sent in split_sentences(text):
+            a = text.find(sent, pos)
+            pos = a + len(sent)
+            spans.append((a, pos))
+        return cls(text, spans, range(1, len(spans) + 1))
+
+    @classmethod
+    def from_rows(cls, text: str, rows: Sequence[int]) -> "ChunkSentences":
+        """Inverse of rows()."""
+        return cls(text, list(zip(rows[0::3], rows[1::3])), rows[2::3])
+
+    def rows(self) -> array:
+        """Flat (start, end, line) triples, the stored form of the sentence data."""
+        out = array("i")
+        for (a, b), line in zip(self.spans, self.lines):
+            out.extend((a, b, line))
+        return out
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def sentence(self, n: int) -> str:
+        a, b = self.spans[n]
+        return self.text[a:b]
+
+    def prepare(self) -> "ChunkSentences":
+        """Tokenize the sentences and build the term index (idempotent)."""
+        if self._terms is None:
+            texts = [self.sentence(n) for n in range(len(self.spans))]
+            tokens = set()
+            terms = []
+            for toks in tokenize_many(texts):
+                tokens.update(toks)
+                terms.append(frozenset(w for w in toks if len(w) >= MIN_TERM_LEN))
+            index: Dict[str, List[int]] = {}
+            for n, ts in enumerate(terms):
+                for t in ts:
+                    index.setdefault(t, []).append(n)
+            self._by_size = sorted(range(len(terms)), key=lambda n: -len(terms[n]))
+            self._index = index
+            self._tokens = frozenset(tokens)
+            self._terms = terms
+        return self
+
+    @property
+    def terms(self) -> List[FrozenSet[str]]:
+        return self.prepare()._terms
+
+    @property
+    def tokens(self) -> FrozenSet[str]:
+        """Every token of the chunk (sentences cover all of its non-space text)."""
+        return self.prepare()._tokens
+
+    def top(self, q_terms: Set[str], n: int) -> List[Tuple[float, int]]:
+        """Best `n` (score, sentence) pairs in sentence order, score = shared query
+        terms + 1e-6 * sentence terms; sentences with no terms never qualify.
+        Only sentences sharing a query term, plus the longest others as filler,
+        are looked at."""
+        self.prepare()
+        terms = self._terms
+        hits: Dict[int, int] = {}
+        for t in q_terms:
+            for s in self._index.get(t, ()):
+                hits[s] = hits.get(s, 0) + 1
+        cand = [(c + 1e-6 * len(terms[s]), s) for s, c in hits.items()]
+        if len(cand) < n:
+            for s in self._by_size:
+                if len(cand) >= n or not terms[s]:
+                    break
+                if s not in hits:
+                    cand.append((1e-6 * len(terms[s]), s))
+        best = heapq.nlargest(n, cand, key=lambda x: (x[0], -x[1]))
+        return sorted(best, key=lambda x: x[1])
+
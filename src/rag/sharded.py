@@ -0,0 +1,343 @@
+"""Scatter-gather DocumentStore over worker processes.
+
+ShardedDocumentStore partitions chunks across N worker processes, each
+holding a dict-backend DocumentStore over its share of the documents
+(placed by crc32 of meta["source"], round-robin without one). Scores stay
+globally consistent: every shard's df table, chunk count and total chunk
+length cover the whole collection. A shard updates them for its own
+chunks as DocumentStore always does, and every change is answered with a
+delta from the other shards (their df / count / length changes), so IDF,
+cosine norms and BM25's avgdl match a single store over the same chunks.
+
+A query is sent to every shard before any reply is read, so shards score
+in parallel; each returns its local top-k and the parent merges them with
+a heap. query()/query_many() keep the DocumentStore signatures, so
+RagPipeline(store=ShardedDocumentStore(...)) works unchanged.
+
+FusionRanker fuses per-shard ranks, so its scores are only approximately
+those of a single store.
+"""
+import heapq
+import multiprocessing
+import pickle
+import threading
+import weakref
+import zlib
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from monitoring.metrics_stub import NULL_TRACER
+from .metadata import validate_filters
+from .rankers import Ranker
+from .records import Chunk
+from .vector_store import _VERSIONS, DocumentStore
+
+# (df changes, chunk count change, token count change) of one mutation
+Delta = Tuple[Dict[str, int], int, int]
+
+
+class _ShardStore(DocumentStore):
+    """A shard's DocumentStore; vocab_df / num_docs hold collection-wide values."""
+
+    def _reset(self):
+        super()._reset()
+        self.other_length = 0  # token count of the chunks held by other shards
+
+    @property
+    def avgdl(self) -> float:
+        return (sum(self.lengths) + self.other_length) / self.num_docs if self.num_docs else 1.0
+
+    # compact() and _materialize() rebuild the store through _reset(); keep the
+    # other shards' length across it, as they keep vocab_df and num_docs.
+    def compact(self):
+        other_length = self.other_length
+        super().compact()
+        self.other_length = other_length
+
+    def _materialize(self):
+        other_length = self.other_length
+        super()._materialize()
+        self.other_length = other_length
+
+    def _delta(self, ids, sign: int = 1) -> Delta:
+        df = Counter()
+        for i in ids:
+            df.update(self.vectors[i].keys())
+        return ({t: sign * n for t, n in df.items()}, sign * len(ids),
+                sign * sum(self.lengths[i] for i in ids))
+
+    def rpc_fit(self, documents: List[str], meta: List[Dict]) -> Delta:
+        self.fit(documents, meta)
+        return self._delta(range(len(self.docs)))
+
+    def rpc_add(self, documents: List[str], meta: List[Dict]) -> Delta:
+        start = len(self.docs)
+        self.add_documents(documents, meta)
+        return self._delta(range(start, len(self.docs)))
+
+    def rpc_remove(self, source: str) -> Delta:
+        delta = self._delta(list(self._by_source.get(source, ())), -1)
+        self.remove_documents(source)
+        return delta
+
+    def rpc_apply(self, delta: Delta) -> None:
+        """Fold in the other shards' changes."""
+        df, n, length = delta
+        vocab_df = self.vocab_df
+        for t, d in df.items():
+            vocab_df[t] += d
+            if vocab_df[t] <= 0:
+                del vocab_df[t]
+        self.num_docs += n
+        self.other_length += length
+        self._norms_stale = True
+        self._bump_version()
+
+    def rpc_query(self, texts: List[str], top_k: int, ranker: Optional[Ranker], filters: Optional[Dict]):
+        rows = self._search_many(texts, top_k, ranker or self.ranker, filters)
+        return self.version, [[(score, i, _portable(self.docs[i])) for score, i in row] for row in rows]
+
+    def rpc_vectorize(self, text: str) -> Dict[str, float]:
+        return self.vectorize(text)
+
+
+def _portable(ch: Chunk) -> Chunk:
+    # Ship the chunk's own bytes, not the whole document arena it points into.
+    return Chunk(bytes(ch.arena[ch.start:ch.end]), 0, ch.end - ch.start, ch.meta, ch.rows)
+
+
+def _serve(conn, chunk_size: int, chunk_overlap: int, ranker: Optional[Ranker], chunk_mode: str):
+    """Worker loop: (command, args) in, (ok, result or error text) out; None stops."""
+    store = _ShardStore(chunk_size, chunk_overlap, ranker=ranker, chunk_mode=chunk_mode)
+    rankers: Dict[bytes, Ranker] = {}  # per-query ranker overrides, kept for their caches
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        cmd, args = msg
+        try:
+            if cmd == "query" and args[2] is not None:
+                blob = args[2]
+                if blob not in rankers:
+                    rankers[blob] = pickle.loads(blob)
+                args = (args[0], args[1], rankers[blob], args[3])
+            conn.send((True, getattr(store, "rpc_" + cmd)(*args)))
+        except Exception as exc:
+            conn.send((False, f"{type(exc).__name__}: {exc}"))
+
+
+def _shutdown(conns, procs):
+    for conn in conns:
+        try:
+            conn.send(None)
+            conn.close()
+        except (OSError, ValueError):
+            pass
+    for p in procs:
+        p.join(timeout=5)
+        if p.is_alive():
+            p.terminate()
+
+
+def _sum_deltas(deltas: List[Delta]) -> Delta:
+    df: Dict[str, int] = {}
+    n = length = 0
+    for d_df, d_n, d_len in deltas:
+        for t, v in d_df.items():
+            df[t] = df.get(t, 0) + v
+        n += d_n
+        length += d_len
+    return df, n, length
+
+
+def _minus(total: Delta, own: Delta) -> Delta:
+    df = dict(total[0])
+    for t, v in own[0].items():
+        left = df[t] - v
+        if left:
+            df[t] = left
+        else:
+            del df[t]
+    return df, total[1] - own[1], total[2] - own[2]
+
+
+class ShardedDocumentStore:
+    """DocumentStore-compatible index partitioned over `shards` worker processes.
+
+    Workers are started by multiprocessing (`start_method`: "fork", "spawn",
+    ... or the platform default) and stopped by close(), on garbage
+    collection or at interpreter exit. Safe to query from several threads.
+    Queries are timed as "stage.score" (scatter-gather) and "stage.topk"
+    (merge) spans on `tracer`.
+    """
+
+    tracer = NULL_TRACER
+    # Merged-result chunks kept so hot chunks reuse their parsed sentence data.
+    chunk_cache_size = 4096
+
+    def __init__(self, shards: int = 2, chunk_size: int = 600, chunk_overlap: int = 80,
+                 ranker: Ranker = None, start_method: Optional[str] = None, chunk_mode: str = "words"):
+        if shards < 1:
+            raise ValueError("shards must be >= 1")
+        ctx = multiprocessing.get_context(start_method)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_mode = chunk_mode
+        self.ranker = ranker
+        self._conns = []
+        self._procs = []
+        for n in range(shards):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_serve, args=(child, chunk_size, chunk_overlap, ranker, chunk_mode),
+                               name=f"rag-shard-{n}", daemon=True)
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._finalizer = weakref.finalize(self, _shutdown, self._conns, self._procs)
+        self._cache: "OrderedDict[Tuple[int, int, int], Chunk]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._next_shard = 0
+        self.num_docs = 0
+        self.version = next(_VERSIONS)
+
+    @property
+    def shards(self) -> int:
+        return len(self._conns)
+
+    def close(self):
+        """Stop the worker processes."""
+        self._finalizer()
+
+    def __enter__(self) -> "ShardedDocumentStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _call(self, requests: Dict[int, Tuple]) -> Dict[int, object]:
+        """Send {shard: (command, *args)} to every shard, then collect the replies.
+
+        Locks are taken in shard order and each is held from send to receive,
+        so concurrent callers never interleave on a pipe or deadlock.
+        """
+        order = sorted(requests)
+        replies = {}
+        sent = []
+        try:
+            for n in order:
+                self._locks[n].acquire()
+                sent.append(n)
+                cmd, *args = requests[n]
+                self._conns[n].send((cmd, tuple(args)))
+            for n in order:
+                replies[n] = self._conns[n].recv()
+        except (EOFError, OSError) as exc:
+            raise RuntimeError(f"shard {n} is not running ({type(exc).__name__})") from exc
+        finally:
+            for n in sent:
+                self._locks[n].release()
+        out = {}
+        for n in order:
+            ok, result = replies[n]
+            if not ok:
+                raise RuntimeError(f"shard {n}: {result}")
+            out[n] = result
+        return out
+
+    def _broadcast(self, *request) -> Dict[int, object]:
+        return self._call({n: request for n in range(self.shards)})
+
+    def _shard_of(self, meta: Dict) -> int:
+        source = meta.get("source")
+        if source is None:
+            self._next_shard = (self._next_shard + 1) % self.shards
+            return self._next_shard
+        return zlib.crc32(str(source).encode("utf-8")) % self.shards
+
+    def _partition(self, documents: List[str], meta: Optional[List[Dict]]):
+        meta = meta or [{} for _ in documents]
+        parts = {n: ([], []) for n in range(self.shards)}
+        for doc, m in zip(documents, meta):
+            docs, metas = parts[self._shard_of(m)]
+            docs.append(doc)
+            metas.append(m)
+        return parts
+
+    def _share(self, deltas: Dict[int, Delta]):
+        """Send each shard the other shards' changes and update the global count."""
+        total = _sum_deltas(list(deltas.values()))
+        empty: Delta = ({}, 0, 0)
+        self._call({n: ("apply", _minus(total, deltas.get(n, empty))) for n in range(self.shards)})
+        self.num_docs += total[1]
+        self.version = next(_VERSIONS)
+
+    def fit(self, documents: List[str], meta: List[Dict] = None):
+        self.num_docs = 0
+        self._next_shard = 0
+        parts = self._partition(documents, meta)
+        self._share(self._call({n: ("fit", docs, metas) for n, (docs, metas) in parts.items()}))
+
+    def add_documents(self, documents: List[str], meta: List[Dict] = None) -> int:
+        """Index more documents on their shards. Returns chunks added."""
+        parts = {n: p for n, p in self._partition(documents, meta).items() if p[0]}
+        deltas = self._call({n: ("add", docs, metas) for n, (docs, metas) in parts.items()})
+        self._share(deltas)
+        return sum(d[1] for d in deltas.values())
+
+    def remove_documents(self, source: str) -> int:
+        """Drop every chunk whose meta["source"] equals `source`. Returns chunks removed."""
+        n = self._shard_of({"source": source})
+        deltas = self._call({n: ("remove", source)})
+        self._share(deltas)
+        return -deltas[n][1]
+
+    def update_document(self, source: str, text: str, meta: Dict = None) -> int:
+        """Replace the chunks of `source` with a re-chunked `text`. Returns chunks added."""
+        self.remove_documents(source)
+        return self.add_documents([text], [meta or {"source": source}])
+
+    def vectorize(self, text: str) -> Dict[str, float]:
+        """TF-IDF weights of `text` under the collection-wide vocabulary."""
+        return self._call({0: ("vectorize", text)})[0]
+
+    def _chunk(self, n: int, version: int, i: int, shipped: Chunk) -> Chunk:
+        key = (n, version, i)
+        with self._cache_lock:
+            ch = self._cache.get(key)
+            if ch is None:
+                ch = self._cache[key] = shipped
+                if len(self._cache) > self.chunk_cache_size:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end(key)
+        return ch
+
+    def query(self, text: str, top_k: int = 4, ranker: Ranker = None,
+              filters: Dict = None) -> List[Tuple[float, Dict]]:
+        """Top `top_k` (score, chunk) pairs over all shards; `filters` as DocumentStore.query."""
+        return self.query_many([text], top_k, ranker, filters)[0]
+
+    def query_many(self, texts: List[str], top_k: int = 4, ranker: Ranker = None,
+                   filters: Dict = None) -> List[List[Tuple[float, Dict]]]:
+        """query() for a batch: one round trip per shard for the whole batch."""
+        span = self.tracer.span
+        blob = pickle.dumps(ranker) if ranker is not None else None
+        if filters:
+            validate_filters(filters)  # fail here rather than once per shard
+        with span("stage.score"):
+            replies = self._broadcast("query", texts, top_k, blob, filters or None)
+        with span("stage.topk"):
+            out = []
+            for q in range(len(texts)):
+                hits = [(score, n, version, i, ch)
+                        for n, (version, rows) in replies.items()
+                        for score, i, ch in rows[q]]
+                # Ties break on (shard, chunk id), as a single store breaks them on chunk id.
+                best = heapq.nlargest(top_k, hits, key=lambda h: (h[0], -h[1], -h[3]))
+                out.append([(score, self._chunk(n, version, i, ch)) for score, n, version, i, ch in best])
+        return out
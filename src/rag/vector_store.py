@@ -1,71 +1,318 @@
+import bisect
+import heapq
+import itertools
 import math
-from typing import List, Dict, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from collections import Counter, defaultdict
-from .chunker import make_chunks
+from monitoring.metrics_stub import NULL_TRACER
+from utils.text import tokenize as _tokenize, tokenize_many
+from .chunker import MODES as CHUNK_MODES
+from .metadata import MetaIndex
+from .records import Chunk, chunk_document
+from . import csr as csr_backend
+from . import index_file
+from .rankers import CosineRanker, Ranker
 
 
-def _tokenize(text: str) -> List[str]:
-    # Lowercase alphanumerics; minimal tokenizer
-    out = []
-    w = []
-    for ch in text.lower():
-        if ch.isalnum():
-            w.append(ch)
-        else:
-            if w:
-                out.append("".join(w))
-                w = []
-    if w:
-        out.append("".join(w))
-    return out
+def _term_frequencies(tokens: List[str]) -> Dict[str, float]:
+    c = Counter(tokens)
+    total = sum(c.values()) or 1
+    return {t: v / total for t, v in c.items()}
+
+
+BACKENDS = ("dict", "csr")
+
+# Process-wide so that two stores never share a version number.
+_VERSIONS = itertools.count(1)
 
 
 class DocumentStore:
-    def __init__(self, chunk_size: int = 600, chunk_overlap: int = 80):
+    """TF-IDF chunk index.
+
+    backend="dict" keeps per-chunk term frequencies plus an inverted index
+    (stdlib only) and supports incremental add/remove/update; IDF is applied
+    at query time and chunk norms are refreshed lazily after a change.
+    backend="csr" keeps L2-normalised weights in NumPy CSR arrays instead.
+
+    Scoring is delegated to `ranker` (rag.rankers; cosine over TF-IDF by
+    default, BM25/BM25+ or a fusion of several on the dict backend).
+
+    Chunks are cut by rag.chunker.iter_spans in `chunk_mode` ("words" windows
+    by default, or "sentence" / "paragraph" / "section" boundaries).
+
+    query(..., filters=...) restricts results by chunk metadata (see
+    rag.metadata): the matching chunk ids come from `meta_index`, built on
+    first use, and only those chunks are scored.
+
+    Queries are timed as "stage.filter", "stage.tokenize", "stage.score" and "stage.topk"
+    spans on `tracer` (a monitoring.metrics_stub.MetricsStub; no-op by default).
+
+    `docs` holds one rag.records.Chunk per chunk (slices of a shared
+    per-document text arena); equal metadata dicts are interned, so chunks
+    of one source share a single dict.
+    """
+
+    # Rebuild postings once this fraction of chunk slots are tombstones.
+    compact_ratio = 0.25
+    tracer = NULL_TRACER
+
+    def __init__(self, chunk_size: int = 600, chunk_overlap: int = 80, backend: str = "dict",
+                 ranker: Ranker = None, chunk_mode: str = "words"):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown backend {backend!r}; expected one of {BACKENDS}")
+        if chunk_mode not in CHUNK_MODES:
+            raise ValueError(f"unknown chunk mode {chunk_mode!r}; expected one of {CHUNK_MODES}")
+        if backend == "csr" and csr_backend.np is None:
+            raise ImportError("backend='csr' requires numpy (pip install numpy)")
+        self.backend = backend
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.docs: List[Dict] = []
+        self.chunk_mode = chunk_mode
+        self.ranker = ranker or CosineRanker()
+        self._reset()
+
+    def _reset(self):
+        self.docs: List[Chunk] = []
         self.vocab_df = defaultdict(int)
         self.num_docs = 0
-        self.vectors: List[Dict[str, float]] = []  # sparse tf-idf
+        self.vectors: List[Dict[str, float]] = []  # sparse tf per chunk
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}  # term -> [(chunk id, tf)]
+        self.norms: List[float] = []  # tf-idf L2 norm per chunk
+        self.lengths: List[int] = []  # token count per chunk (0 once deleted)
+        self.csr = None
+        self._by_source: Dict[str, List[int]] = defaultdict(list)
+        self._metas: Dict[Tuple, Dict] = {}
+        self._meta_index: Optional[MetaIndex] = None
+        self._deleted: Set[int] = set()
+        self._norms_stale = False
+        self._bump_version()
+
+    def _bump_version(self):
+        """Give the index a new `version`; caches keyed on it treat older entries as stale."""
+        self.version = next(_VERSIONS)
 
     def _tf(self, tokens: List[str]) -> Dict[str, float]:
-        c = Counter(tokens)
-        total = sum(c.values()) or 1
-        return {t: v / total for t, v in c.items()}
+        return _term_frequencies(tokens)
 
     def _idf(self, term: str) -> float:
         # smoothed idf
         df = self.vocab_df.get(term, 0) + 1
         return math.log((self.num_docs + 1) / df) + 1.0
 
+    @property
+    def avgdl(self) -> float:
+        """Mean token count of the live chunks (BM25's length normaliser)."""
+        return sum(self.lengths) / self.num_docs if self.num_docs else 1.0
+
     def _tfidf(self, tokens: List[str]) -> Dict[str, float]:
         tf = self._tf(tokens)
         return {t: tf_v * self._idf(t) for t, tf_v in tf.items()}
 
-    def fit(self, documents: List[str], meta: List[Dict] = None):
-        self.docs = []
-        self.vectors = []
-        self.vocab_df = defaultdict(int)
-        self.num_docs = 0
+    def _intern_meta(self, meta: Dict) -> Dict:
+        """One shared dict per distinct metadata value; metadata with unhashable
+        values (or unorderable keys) is kept as given."""
+        try:
+            # The value's type is part of the key, so 1, 1.0 and True stay distinct.
+            key = tuple(sorted((k, type(v), v) for k, v in meta.items()))
+            return self._metas.setdefault(key, meta)
+        except TypeError:
+            return meta
 
+    def _ingest(self, documents: List[str], meta: List[Dict] = None) -> Iterator[List[str]]:
+        """Chunk documents, append chunk records, update df and yield each chunk's tokens."""
         meta = meta or [{} for _ in documents]
-        for i, (doc, m) in enumerate(zip(documents, meta)):
-            chunks = make_chunks(doc, self.chunk_size, self.chunk_overlap)
-            for ch in chunks:
-                tokens = _tokenize(ch["text"]) 
-                # update df
+        for doc, m in zip(documents, meta):
+            chunks = list(chunk_document(doc, self.chunk_size, self.chunk_overlap, self._intern_meta(m),
+                                         self.chunk_mode))
+            for ch, tokens in zip(chunks, tokenize_many(ch.text for ch in chunks)):
                 for t in set(tokens):
                     self.vocab_df[t] += 1
                 self.num_docs += 1
-                self.docs.append({"text": ch["text"], "meta": m})
-                self.vectors.append({"__tokens__": tokens})  # placeholder for now
+                self.docs.append(ch)
+                self.lengths.append(len(tokens))
+                yield tokens
+
+    def fit(self, documents: List[str], meta: List[Dict] = None):
+        self._reset()
+        if self.backend == "csr":
+            tokens_per_chunk = list(self._ingest(documents, meta))
+            self.csr = csr_backend.CsrMatrix.from_vectors(self._tfidf(t) for t in tokens_per_chunk)
+            return
+        self.add_documents(documents, meta)
 
-        # finalize tf-idf using df
+    def _require_mutable(self):
+        if self.csr is not None:
+            raise NotImplementedError("incremental updates need backend='dict'; refit the csr store instead")
+        if not isinstance(self.postings, dict):
+            self._materialize()
+
+    def _materialize(self):
+        """Turn a memory-mapped store into in-memory structures before mutating it."""
+        docs = list(self.docs)
+        vocab_df = defaultdict(int)
+        vectors: List[Dict[str, float]] = [{} for _ in docs]
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for t, plist in self.postings.items():
+            vocab_df[t] = self.vocab_df[t]
+            postings[t] = plist
+            for i, tf in plist:
+                vectors[i][t] = tf
+        num_docs, lengths = self.num_docs, list(self.lengths)
+        self._reset()
+        self.docs, self.vectors, self.postings = docs, vectors, postings
+        self.vocab_df, self.num_docs, self.lengths = vocab_df, num_docs, lengths
+        for i, d in enumerate(docs):
+            self._by_source[d["meta"].get("source")].append(i)
+            self._intern_meta(d["meta"])
+        self._norms_stale = True
+
+    def add_documents(self, documents: List[str], meta: List[Dict] = None) -> int:
+        """Index more documents without touching existing chunk weights. Returns chunks added."""
+        self._require_mutable()
+        added = 0
+        for tokens in self._ingest(documents, meta):
+            self._index_chunk(len(self.docs) - 1, self._tf(tokens))
+            added += 1
+        if added:
+            self._norms_stale = True
+            self._bump_version()
+        return added
+
+    def add_chunks(self, chunks: Iterable[Tuple[Chunk, Dict[str, float], int]], df: Dict[str, int]) -> int:
+        """Index chunks that were chunked and tokenized elsewhere (see rag.ingest).
+
+        `chunks` yields (chunk, tf, token count) and `df` is their merged
+        document frequencies. Returns chunks added.
+        """
+        self._require_mutable()
+        for t, n in df.items():
+            self.vocab_df[t] += n
+        added = 0
+        last = interned = None
+        for ch, tf, length in chunks:
+            if ch.meta is not last:
+                last, interned = ch.meta, self._intern_meta(ch.meta)
+            ch.meta = interned
+            self.docs.append(ch)
+            self.lengths.append(length)
+            self._index_chunk(len(self.docs) - 1, tf)
+            added += 1
+        self.num_docs += added
+        if added:
+            self._norms_stale = True
+            self._bump_version()
+        return added
+
+    def _index_chunk(self, i: int, tf: Dict[str, float]):
+        self.vectors.append(tf)
+        for t, w in tf.items():
+            self.postings.setdefault(t, []).append((i, w))
+        meta = self.docs[i]["meta"]
+        self._by_source[meta.get("source")].append(i)
+        if self._meta_index is not None:
+            self._meta_index.add(i, meta)
+
+    @property
+    def meta_index(self) -> MetaIndex:
+        """Chunk ids per metadata value; built on first use, then kept up to date."""
+        if self._meta_index is None:
+            docs = self.docs
+            if isinstance(docs, index_file.DocsView):
+                metas = ((i, docs.metas[m]) for i, m in enumerate(docs.chunk_meta))
+            else:
+                metas = ((i, d["meta"]) for i, d in enumerate(docs) if d is not None)
+            self._meta_index = MetaIndex.build(metas)
+        return self._meta_index
+
+    def _allowed(self, filters: Dict) -> List[int]:
+        """Sorted ids of the live chunks matching `filters`."""
+        ids = self.meta_index.select(filters)
+        deleted = self._deleted
+        return [i for i in ids if i not in deleted] if deleted else ids
+
+    def _restricted(self, tokens: List[str], allowed: List[int]) -> Dict[str, List[Tuple[int, float]]]:
+        """Postings of `tokens` cut down to the `allowed` chunk ids, for a ranker to
+        score only those. Postings lists are sorted by chunk id, so a few allowed
+        ids are found by binary search instead of reading the whole list."""
+        postings = self.postings
+        keep = None
+        out = {}
+        for t in set(tokens):
+            if not isinstance(postings, dict):  # memory-mapped
+                plist = postings.restrict(t, allowed)
+                if plist is not None:
+                    out[t] = plist
+                continue
+            plist = postings.get(t)
+            if plist is None:
+                continue
+            if len(allowed) * 8 < len(plist):
+                hits = []
+                for i in allowed:
+                    j = bisect.bisect_left(plist, (i,))
+                    if j < len(plist) and plist[j][0] == i:
+                        hits.append(plist[j])
+            else:
+                keep = keep or set(allowed)
+                hits = [p for p in plist if p[0] in keep]
+            out[t] = hits
+        return out
+
+    def remove_documents(self, source: str) -> int:
+        """Drop every chunk whose meta["source"] equals `source`. Returns chunks removed."""
+        self._require_mutable()
+        ids = self._by_source.pop(source, [])
+        for i in ids:
+            for t in self.vectors[i]:
+                self.vocab_df[t] -= 1
+                if self.vocab_df[t] <= 0:
+                    del self.vocab_df[t]
+            self.num_docs -= 1
+            self.docs[i] = None
+            self.vectors[i] = {}
+            self.lengths[i] = 0
+            self._deleted.add(i)
+        if ids:
+            self._norms_stale = True
+            self._bump_version()
+            if len(self._deleted) > self.compact_ratio * len(self.docs):
+                self.compact()
+        return len(ids)
+
+    def update_document(self, source: str, text: str, meta: Dict = None) -> int:
+        """Replace the chunks of `source` with a re-chunked `text`. Returns chunks added."""
+        self.remove_documents(source)
+        return self.add_documents([text], [meta or {"source": source}])
+
+    def compact(self):
+        """Drop tombstoned chunks and renumber the postings (the "merge" step)."""
+        self._require_mutable()
+        if not self._deleted:
+            return
+        keep = [i for i in range(len(self.docs)) if i not in self._deleted]
+        docs = [self.docs[i] for i in keep]
+        vectors = [self.vectors[i] for i in keep]
+        lengths = [self.lengths[i] for i in keep]
+        vocab_df, num_docs = self.vocab_df, self.num_docs
+        self._reset()
+        self.docs, self.vectors, self.lengths = docs, vectors, lengths
+        self.vocab_df, self.num_docs = vocab_df, num_docs
+        for i, (d, v) in enumerate(zip(docs, vectors)):
+            for t, w in v.items():
+                self.postings.setdefault(t, []).append((i, w))
+            self._by_source[d["meta"].get("source")].append(i)
+            self._intern_meta(d["meta"])
+        self._norms_stale = True
+
+    def _refresh_norms(self):
+        # Lazy IDF refresh: df changes only invalidate the norms, which are
+        # rebuilt once here instead of rewriting chunk weights on every change.
+        idf = {t: self._idf(t) for t in self.vocab_df}
+        norms = []
         for v in self.vectors:
-            tokens = v.pop("__tokens__")
-            tfidf = self._tfidf(tokens)
-            v.update(tfidf)
+            norms.append(math.sqrt(sum(w * w for w in (tf * idf[t] for t, tf in v.items()))) or 1e-12)
+        self.norms = norms
+        self._norms_stale = False
 
     def _sim(self, v1: Dict[str, float], v2: Dict[str, float]) -> float:
         # cosine similarity for sparse dicts
@@ -80,9 +327,111 @@ class DocumentStore:
         n2 = math.sqrt(sum(b * b for b in v2.values())) or 1e-12
         return dot / (n1 * n2)
 
-    def query(self, text: str, top_k: int = 4) -> List[Tuple[float, Dict]]:
-        q_vec = self._tfidf(_tokenize(text))
-        sims = [(self._sim(q_vec, v), d) for v, d in zip(self.vectors, self.docs)]
-        sims.sort(key=lambda x: x[0], reverse=True)
-        return sims[:top_k]
+    def save(self, path) -> None:
+        """Write the fitted index to `path` (see rag.index_file for the format)."""
+        if self.csr is None and isinstance(self.postings, dict):
+            self.compact()
+            if self._norms_stale:
+                self._refresh_norms()
+        index_file.save_store(self, path)
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "DocumentStore":
+        """Open an index written by save(). With mmap=True the arrays stay on disk
+        and are paged in on demand, so open time does not grow with corpus size."""
+        return index_file.load_store(cls(), path, mmap=mmap)
+
+    def _top(self, acc: Dict[int, float], top_k: int, allowed: List[int] = None) -> List[Tuple[float, int]]:
+        deleted = self._deleted
+        scored = ((score, i) for i, score in acc.items() if i not in deleted)
+        # Ties break on chunk order, like the stable sort over all chunks did.
+        top = heapq.nlargest(top_k, scored, key=lambda x: (x[0], -x[1]))
+        if len(top) < top_k:
+            # Pad with non-matching (allowed) chunks, score 0, in corpus order.
+            for i in range(len(self.docs)) if allowed is None else allowed:
+                if len(top) >= top_k:
+                    break
+                if i not in acc and i not in deleted:
+                    top.append((0.0, i))
+        return top
+
+    def vectorize(self, text: str) -> Dict[str, float]:
+        """TF-IDF weights of `text` under the current vocabulary (as used for queries)."""
+        return self._tfidf(_tokenize(text))
 
+    def query(self, text: str, top_k: int = 4, ranker: Ranker = None,
+              filters: Dict = None) -> List[Tuple[float, Dict]]:
+        """Top `top_k` (score, chunk) pairs, scored by `ranker` or the store's default,
+        among the chunks whose metadata matches `filters` (see rag.metadata)."""
+        if filters:
+            return self.query_many([text], top_k, ranker, filters)[0]
+        ranker = ranker or self.ranker
+        span = self.tracer.span
+        if self.csr is not None:
+            if not isinstance(ranker, CosineRanker):
+                raise NotImplementedError(f"the {ranker.name} ranker needs backend='dict'")
+            with span("stage.tokenize"):
+                q_vec = self.vectorize(text)
+            with span("stage.score"):  # scoring and top-k are one NumPy pass
+                hits = self.csr.search(q_vec, top_k)
+        else:
+            with span("stage.tokenize"):
+                tokens = _tokenize(text)
+            # Term-at-a-time: rankers only touch chunks sharing a query term.
+            with span("stage.score"):
+                acc = ranker.scores(self, tokens)
+            with span("stage.topk"):
+                hits = self._top(acc, top_k)
+        return [(score, self.docs[i]) for score, i in hits]
+
+    def query_many(self, texts: List[str], top_k: int = 4, ranker: Ranker = None,
+                   filters: Dict = None) -> List[List[Tuple[float, Dict]]]:
+        """query() for a batch, in order. Queries are tokenized together and scored
+        in one pass: the csr backend multiplies a query matrix by the chunk matrix,
+        the dict backend reads each distinct term's postings once for all queries.
+        `filters` applies to every query."""
+        hits = self._search_many(texts, top_k, ranker or self.ranker, filters)
+        return [[(score, self.docs[i]) for score, i in row] for row in hits]
+
+    def _search_many(self, texts: List[str], top_k: int, ranker: Ranker,
+                     filters: Dict = None) -> List[List[Tuple[float, int]]]:
+        """(score, chunk id) rows behind query_many()."""
+        span = self.tracer.span
+        if filters:
+            if self.csr is not None:
+                raise NotImplementedError("metadata filters need backend='dict'")
+            # Resolve the filter first, then score only the chunks it lets through.
+            with span("stage.filter"):
+                allowed = self._allowed(filters)
+            with span("stage.tokenize"):
+                token_lists = tokenize_many(texts)
+            with span("stage.score"):
+                # Cutting postings down pays off unless most chunks pass; memory-mapped
+                # postings are decoded either way, so there only binary search pays.
+                # Either way the ranker sees the allowed set, so fused ranks match.
+                share = 2 if isinstance(self.postings, dict) else 8
+                keep = set(allowed)
+                if share * len(allowed) > len(self.docs) - len(self._deleted):
+                    accs = (ranker.scores_many(self, token_lists, keep) if len(token_lists) > 1
+                            else [ranker.scores(self, token_lists[0], None, keep)])
+                    accs = [{i: v for i, v in acc.items() if i in keep} for acc in accs]
+                else:
+                    accs = [ranker.scores(self, tokens, self._restricted(tokens, allowed), keep) if allowed else {}
+                            for tokens in token_lists]
+            with span("stage.topk"):
+                hits = [self._top(acc, top_k, allowed) for acc in accs]
+        elif self.csr is not None:
+            if not isinstance(ranker, CosineRanker):
+                raise NotImplementedError(f"the {ranker.name} ranker needs backend='dict'")
+            with span("stage.tokenize"):
+                q_vecs = [self._tfidf(t) for t in tokenize_many(texts)]
+            with span("stage.score"):
+                hits = self.csr.search_many(q_vecs, top_k)
+        else:
+            with span("stage.tokenize"):
+                token_lists = tokenize_many(texts)
+            with span("stage.score"):
+                accs = ranker.scores_many(self, token_lists)
+            with span("stage.topk"):
+                hits = [self._top(acc, top_k) for acc in accs]
+        return hits
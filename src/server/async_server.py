@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+asyncio front-end for the RAG server with pre-forked worker processes.
+
+The parent loads the index (memory-mapped when a saved index is fresh),
+binds one listening socket and then forks N workers. Every worker inherits
+that socket and the already-loaded index, so index pages are shared
+copy-on-write and the kernel spreads accepts across the workers. Each
+worker runs its own event loop; /ask is scored on a small thread pool so
+/health and static files stay responsive while a query is in flight.
+/ask?stream=1 runs rag_server.sse_events on a pool thread and writes each
+event as it arrives.
+
+Stdlib only. Platforms without os.fork run a single in-process worker.
+"""
+import asyncio
+import os
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from typing import Dict
+from urllib.parse import urlparse
+
+sys.path.append(str(Path(__file__).resolve().parent))
+import rag_server  # builds/loads the shared index before any fork
+from rag_server import (CORS_HEADERS, PROMETHEUS_TYPE, ask, ask_batch, json_body, metrics_text,
+                        read_stream_request, sse_events, static_file, wants_stream)
+
+IDLE_TIMEOUT = 15.0
+MAX_BODY = 1 << 20
+
+
+def _stream_head() -> bytes:
+    # No Content-Length on an event stream, so the connection ends with it.
+    lines = ["HTTP/1.1 200 OK"]
+    lines += [f"{name}: {value}" for name, value in CORS_HEADERS]
+    lines += ["Content-Type: text/event-stream", "Cache-Control: no-cache", "Connection: close"]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def _response(code: int, ctype: str, body: bytes, keep_alive: bool) -> bytes:
+    lines = [f"HTTP/1.1 {code} {HTTPStatus(code).phrase}"]
+    lines += [f"{name}: {value}" for name, value in CORS_HEADERS]
+    if code != 204:
+        lines.append(f"Content-Type: {ctype}")
+    lines.append(f"Content-Length: {len(body)}")
+    lines.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+class Worker:
+    """One event loop serving HTTP/1.1 keep-alive connections on a shared socket."""
+
+    def __init__(self, sock: socket.socket, threads: int = 4):
+        self.sock = sock
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="rag-ask")
+
+    async def _route(self, method: str, path: str, body: bytes):
+        if method == "OPTIONS":
+            return 204, "", b""
+        if method == "GET":
+            if path == "/health":
+                return 200, "application/json", json_body({"ok": True})
+            if path == "/metrics":
+                return 200, PROMETHEUS_TYPE, metrics_text()
+            return static_file(path)
+        if method == "POST" and path == "/ask":
+            loop = asyncio.get_running_loop()
+            code, obj = await loop.run_in_executor(self.pool, ask, body)
+            return code, "application/json", json_body(obj)
+        if method == "POST" and path == "/ask_batch":
+            loop = asyncio.get_running_loop()
+            code, obj = await loop.run_in_executor(self.pool, ask_batch, body)
+            return code, "application/json", json_body(obj)
+        return 404, "application/json", json_body({"error": "not found"})
+
+    async def _stream(self, writer: asyncio.StreamWriter, query: str, filters):
+        """Write sse_events() as they are produced. The generator runs on one pool
+        thread (it blocks on the answerer) and hands each event to the loop."""
+        loop = asyncio.get_running_loop()
+        events: "asyncio.Queue[bytes]" = asyncio.Queue()
+        gone = threading.Event()
+
+        def pump():
+            gen = sse_events(query, filters)
+            try:
+                for chunk in gen:
+                    loop.call_soon_threadsafe(events.put_nowait, chunk)
+                    if gone.is_set():
+                        break
+            finally:
+                gen.close()
+                loop.call_soon_threadsafe(events.put_nowait, b"")
+
+        writer.write(_stream_head())
+        done = loop.run_in_executor(self.pool, pump)
+        try:
+            while True:
+                chunk = await events.get()
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            gone.set()  # the client went away: stop generating
+            await done
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    writer.write(_response(400, "application/json", json_body({"error": "bad request"}), False))
+                    break
+                headers: Dict[str, str] = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = h.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    writer.write(_response(400, "application/json", json_body({"error": "bad content-length"}),
+                                           False))
+                    break
+                if length > MAX_BODY:
+                    writer.write(_response(413, "application/json", json_body({"error": "body too large"}), False))
+                    break
+                body = await reader.readexactly(length) if length else b""
+                conn = headers.get("connection", "").lower()
+                keep_alive = conn == "keep-alive" if version == "HTTP/1.0" else conn != "close"
+                url = urlparse(target)
+                if url.path == "/ask" and method.upper() in ("GET", "POST") and wants_stream(url):
+                    query, filters, err = read_stream_request(method.upper(), url, body)
+                    if err is None:
+                        await self._stream(writer, query, filters)
+                        break
+                    writer.write(_response(400, "application/json", json_body(err), keep_alive))
+                    await writer.drain()
+                    continue
+                code, ctype, payload = await self._route(method.upper(), url.path, body)
+                writer.write(_response(code, ctype, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle, sock=self.sock)
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+
+def listen(host: str, port: int, backlog: int = 1024) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def _spawn(sock: socket.socket, threads: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            Worker(sock, threads).run()
+        finally:
+            os._exit(0)
+    return pid
+
+
+def run(port: int = 4000, host: str = "0.0.0.0", processes: int = None, threads: int = 4):
+    processes = processes or os.cpu_count() or 1
+    sock = listen(host, port)
+    print(f"Finance RAG async server listening on {host}:{sock.getsockname()[1]} ({processes} processes)")
+    if processes == 1 or not hasattr(os, "fork"):
+        return Worker(sock, threads).run()
+
+    children = {_spawn(sock, threads) for _ in range(processes)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            children.discard(pid)
+            if not stopping:
+                # Replace a crashed worker so capacity stays at `processes`.
+                children.add(_spawn(sock, threads))
+    finally:
+        sock.close()
+        print("\n[info] Shutting down server.")
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=int(os.environ.get("PORT", 4000)))
+    ap.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    ap.add_argument("--processes", type=int, default=int(os.environ.get("PROCESSES", 0)) or None,
+                    help="worker processes (default: one per CPU)")
+    ap.add_argument("--threads", type=int, default=4, help="/ask scoring threads per process")
+    args = ap.parse_args()
+    run(args.port, args.host, args.processes, args.threads)
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 import json
 import os
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from urllib.parse import urlparse
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
 
 ROOT = Path(__file__).resolve().parents[2]
 
@@ -14,105 +20,554 @@ from data.loader import load_and_clean
 from rag.vector_store import DocumentStore
 from rag.pipeline import RagPipeline
 from llm.local import LocalAnswerComposer
-from eval.metrics import evaluate_answer
+from llm.ollama_client import OllamaAnswerer
+from llm.response_cache import ResponseCache
+from eval.metrics import AsyncEvaluator, GroundingEvaluator
+from monitoring.metrics_stub import MetricsStub
+from rag.cache import QueryCache
+from rag.metadata import validate_filters
+from rag.rankers import make_ranker
+
+
+INDEX_PATH = ROOT / "data" / "index" / "docstore.idx"
+LLM_CACHE_PATH = ROOT / "data" / "cache" / "llm_responses.sqlite3"
+EVAL_LOG_PATH = ROOT / "data" / "logs" / "responses.jsonl"
+# Most queries accepted by one POST /ask_batch.
+MAX_BATCH = 256
+
+
+def _index_is_fresh(index_path: Path, raw_dir: Path) -> bool:
+    """True when the saved index is newer than every source file (and the folder
+    listing), or when there are no sources to rebuild it from."""
+    if not index_path.exists():
+        return False
+    if not raw_dir.is_dir():
+        return True
+    built = index_path.stat().st_mtime
+    try:
+        return all(p.stat().st_mtime < built for p in [raw_dir, *raw_dir.glob("**/*.txt")])
+    except FileNotFoundError:  # a source went away mid-scan: rebuild
+        return False
+
+
+def default_answerer(vectorize=None, metrics=None):
+    """LocalAnswerComposer unless RAG_ANSWERER=ollama (model from OLLAMA_MODEL).
+
+    Ollama answers are cached on disk at RAG_LLM_CACHE (default
+    data/cache/llm_responses.sqlite3, "off" disables); RAG_LLM_CACHE_NEAR=<cosine>
+    also reuses answers for near-duplicate questions over the same contexts.
+    """
+    if os.environ.get("RAG_ANSWERER", "local").lower() != "ollama":
+        return LocalAnswerComposer()
+    cache = None
+    path = os.environ.get("RAG_LLM_CACHE", str(LLM_CACHE_PATH))
+    if path.lower() != "off":
+        near = os.environ.get("RAG_LLM_CACHE_NEAR")
+        cache = ResponseCache(path, near_threshold=float(near) if near else None,
+                              vectorize=vectorize, metrics=metrics)
+    return OllamaAnswerer(cache=cache)
+
+
+def default_evaluator(metrics=None):
+    """Grounding metrics per answer, chosen by RAG_EVAL: "inline" (default; in the
+    response), "async" (computed on a background thread and logged with the
+    answer to RAG_EVAL_LOG, default data/logs/responses.jsonl; the response only
+    carries the eval_id) or "off"."""
+    mode = os.environ.get("RAG_EVAL", "inline").lower()
+    if mode == "off":
+        return None
+    if mode == "async":
+        return AsyncEvaluator(os.environ.get("RAG_EVAL_LOG", str(EVAL_LOG_PATH)), metrics=metrics)
+    return GroundingEvaluator()
 
 
 class RagApp:
-    def __init__(self):
-        raw_dir = ROOT / "data" / "raw"
-        clean_dir = ROOT / "data" / "clean"
-        os.makedirs(clean_dir, exist_ok=True)
-        self.docs = load_and_clean(raw_dir, clean_dir)
-        self.store = DocumentStore(chunk_size=600, chunk_overlap=80)
-        self.store.fit([d["content"] for d in self.docs], meta=[{"source": d["path"]} for d in self.docs])
-        self.rag = RagPipeline(store=self.store, answerer=LocalAnswerComposer())
-
-    def answer(self, query: str) -> dict:
-        out = self.rag.answer(query, top_k=4)
-        metrics = evaluate_answer(out["answer"], [c["text"] for c in out["contexts"]])
-        out["metrics"] = metrics
+    """Shared, read-only serving state.
+
+    Request threads only read `self.rag` (and the store behind it); refresh()
+    builds a complete new store off to the side and swaps it in with a single
+    attribute assignment, so in-flight requests finish on the old index.
+    """
+
+    def __init__(self, index_path: Path = INDEX_PATH, answerer=None, evaluator=None):
+        self.index_path = index_path
+        self.raw_dir = ROOT / "data" / "raw"
+        self.clean_dir = ROOT / "data" / "clean"
+        self.docs = []
+        self._refresh_lock = threading.Lock()
+        self.metrics = MetricsStub()
+        answerer = answerer or default_answerer(lambda q: self.store.vectorize(q), self.metrics)
+        evaluator = evaluator or default_evaluator(self.metrics)
+        # Batches compose on threads only when the answerer waits on an LLM server.
+        workers = 8 if isinstance(answerer, OllamaAnswerer) else 0
+        self.rag = RagPipeline(store=self._open_store(), answerer=answerer, evaluator=evaluator,
+                               tracer=self.metrics, workers=workers)
+        self.cache = QueryCache(maxsize=256, ttl=300.0, metrics=self.metrics)
+
+    @property
+    def store(self) -> DocumentStore:
+        return self.rag.store
+
+    def _open_store(self) -> DocumentStore:
+        """Load or build the index; RAG_RANKER picks the scorer (see rag.rankers.make_ranker)
+        and RAG_CHUNK_MODE the chunk boundaries (see rag.chunker.iter_spans)."""
+        ranker = make_ranker(os.environ.get("RAG_RANKER", "cosine"))
+        chunk_mode = os.environ.get("RAG_CHUNK_MODE", "words").lower()
+        if _index_is_fresh(self.index_path, self.raw_dir):
+            try:
+                store = DocumentStore.load(self.index_path, mmap=True)
+                if store.chunk_mode != chunk_mode:
+                    raise ValueError(f"it was chunked in {store.chunk_mode!r} mode")
+                store.ranker = ranker
+                store.tracer = self.metrics
+                return store
+            except ValueError as exc:
+                print(f"[warn] Ignoring saved index ({exc}); rebuilding.")
+        os.makedirs(self.clean_dir, exist_ok=True)
+        self.docs = load_and_clean(self.raw_dir, self.clean_dir)
+        store = DocumentStore(chunk_size=600, chunk_overlap=80, ranker=ranker, chunk_mode=chunk_mode)
+        store.fit([d["content"] for d in self.docs], meta=[{"source": d["path"]} for d in self.docs])
+        store.save(self.index_path)
+        store.tracer = self.metrics
+        return store
+
+    def refresh(self):
+        """Rebuild (or reload) the index and swap it in copy-on-write."""
+        with self._refresh_lock:
+            self.rag = RagPipeline(store=self._open_store(), answerer=self.rag.answerer,
+                                   evaluator=self.rag.evaluator, tracer=self.metrics,
+                                   workers=self.rag.workers)
+
+    @staticmethod
+    def _key(query: str, top_k: int, filters: Optional[Dict]) -> Tuple:
+        # Whitespace only: an answerer may echo the question's case back.
+        return " ".join(query.split()), top_k, json.dumps(filters, sort_keys=True) if filters else None
+
+    @staticmethod
+    def _from_cache(rag: RagPipeline, cached: str, query: str) -> dict:
+        """A cached response for `query`. An async eval id names one request's log
+        line, so a hit queues its own evaluation rather than repeat the first id."""
+        out = json.loads(cached)
+        out["query"] = query
+        if isinstance(rag.evaluator, AsyncEvaluator):
+            out["metrics"] = rag.evaluator(query, out["answer"], out["contexts"])
         return out
 
+    def answer(self, query: str, top_k: int = 4, filters: Optional[Dict] = None) -> dict:
+        rag = self.rag  # one snapshot per request; refresh() may swap self.rag meanwhile
+        version = rag.store.version
+        key = self._key(query, top_k, filters)
+        # Cached as JSON so a hit rebuilds exactly what the first call returned.
+        hit = self.cache.get(key, version)
+        if hit is not None:
+            return self._from_cache(rag, hit, query)
+        out = rag.answer(query, top_k=top_k, filters=filters)
+        self.cache.put(key, version, json.dumps(out))
+        return out
+
+    def answer_many(self, queries: List[str], top_k: int = 4, filters: Optional[Dict] = None) -> List[dict]:
+        """answer() for a batch, in order; cache misses go through RagPipeline.answer_many."""
+        rag = self.rag
+        version = rag.store.version
+        out: List[Optional[dict]] = [None] * len(queries)
+        misses: Dict[Tuple, List[int]] = {}
+        for i, query in enumerate(queries):
+            key = self._key(query, top_k, filters)
+            hit = self.cache.get(key, version)
+            if hit is not None:
+                out[i] = self._from_cache(rag, hit, query)
+            else:
+                misses.setdefault(key, []).append(i)  # duplicates in a batch are answered once
+        keys = list(misses)
+        for key, res in zip(keys, rag.answer_many([queries[misses[k][0]] for k in keys], top_k=top_k,
+                                                       filters=filters)):
+            cached = json.dumps(res)
+            self.cache.put(key, version, cached)
+            for n, i in enumerate(misses[key]):
+                out[i] = res if n == 0 else self._from_cache(rag, cached, queries[i])
+        return out
+
+    def answer_stream(self, query: str, top_k: int = 4, filters: Optional[Dict] = None) -> Iterator[Tuple[str, Dict]]:
+        """Streaming variant of answer(); the final "done" event carries the metrics.
+        Streams are not cached."""
+        return self.rag.answer_stream(query, top_k=top_k, filters=filters)
+
 
 APP = RagApp()
 
 
+CORS_HEADERS = [
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Headers", "Content-Type"),
+    ("Access-Control-Allow-Methods", "GET,POST,OPTIONS"),
+]
+
+
+def json_body(obj) -> bytes:
+    with APP.metrics.span("stage.serialize"):
+        return json.dumps(obj).encode("utf-8")
+
+
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_text() -> bytes:
+    """GET /metrics: counters and latency histograms of this process, Prometheus text format."""
+    return APP.metrics.prometheus().encode("utf-8")
+
+
+def static_file(url_path: str) -> Tuple[int, str, bytes]:
+    """(status, content type, body) for a dashboard/static GET."""
+    if url_path == "/":
+        rel_path = "index.html"
+    elif url_path.startswith("/public/"):
+        rel_path = url_path[len("/public/"):]
+    else:
+        # Fallback to serving root public path
+        rel_path = url_path
+    # prevent path traversal
+    safe = Path("public") / rel_path.strip("/")
+    safe = safe.resolve()
+    if not str(safe).startswith(str((ROOT / "public").resolve())):
+        return 403, "application/json", json_body({"error": "forbidden"})
+    if safe.is_dir():
+        safe = safe / "index.html"
+    if not safe.exists():
+        return 404, "application/json", json_body({"error": "not found"})
+    ctype = "text/html" if safe.suffix == ".html" else "text/css" if safe.suffix == ".css" else "application/javascript" if safe.suffix == ".js" else "text/plain"
+    return 200, ctype, safe.read_bytes()
+
+
+def read_filters(raw) -> Tuple[Optional[Dict], Optional[dict]]:
+    """(filters or None, None), or (None, error object) for a request's "filters"
+    (see rag.metadata), e.g. {"doc_type": "10-K", "date": {"gte": "2023-01-01"}}."""
+    if not raw:
+        return None, None
+    try:
+        return validate_filters(raw), None
+    except ValueError as exc:
+        return None, {"error": f"invalid filters: {exc}"}
+
+
+def read_query(body: bytes) -> Tuple[Optional[str], Optional[Dict], Optional[dict]]:
+    """(query, filters, None), or (None, None, error object) for a bad POST /ask body:
+    {"query": string, "filters"?: object}."""
+    try:
+        obj = json.loads(body.decode("utf-8"))
+        query = obj.get("query", "").strip()
+    except Exception:
+        return None, None, {"error": "invalid json"}
+    if not query:
+        return None, None, {"error": "empty query"}
+    filters, err = read_filters(obj.get("filters"))
+    if err:
+        return None, None, err
+    return query, filters, None
+
+
+def ask(body: bytes) -> Tuple[int, dict]:
+    """(status, JSON object) for a POST /ask body."""
+    with APP.metrics.span("request.ask"):
+        query, filters, err = read_query(body)
+        if err:
+            return 400, err
+        return 200, APP.answer(query, filters=filters)
+
+
+def ask_batch(body: bytes) -> Tuple[int, dict]:
+    """(status, JSON object) for a POST /ask_batch body:
+    {"queries": [...], "top_k"?: int, "filters"?: object}; the filters apply to every query."""
+    with APP.metrics.span("request.ask_batch"):
+        return _ask_batch(body)
+
+
+def _ask_batch(body: bytes) -> Tuple[int, dict]:
+    try:
+        obj = json.loads(body.decode("utf-8"))
+        queries = obj["queries"]
+        top_k = int(obj.get("top_k", 4))
+    except Exception:
+        return 400, {"error": "expected {\"queries\": [string, ...]}"}
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) for q in queries):
+        return 400, {"error": "queries must be a non-empty list of strings"}
+    queries = [q.strip() for q in queries]
+    filters, err = read_filters(obj.get("filters"))
+    if err:
+        return 400, err
+    if not all(queries):
+        return 400, {"error": "empty query"}
+    if len(queries) > MAX_BATCH:
+        return 413, {"error": f"at most {MAX_BATCH} queries per batch"}
+    if not 1 <= top_k <= 50:
+        return 400, {"error": "top_k must be between 1 and 50"}
+    return 200, {"results": APP.answer_many(queries, top_k=top_k, filters=filters)}
+
+
+def sse_events(query: str, filters: Optional[Dict] = None) -> Iterator[bytes]:
+    """Server-Sent Events for /ask?stream=1: contexts, then token/citation events, then done."""
+    try:
+        with APP.metrics.span("request.stream"):
+            for event, data in APP.answer_stream(query, filters=filters):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+    except RuntimeError as exc:
+        yield f"event: error\ndata: {json.dumps({'error': str(exc)})}\n\n".encode("utf-8")
+
+
+def wants_stream(url) -> bool:
+    return parse_qs(url.query).get("stream", ["0"])[0] not in ("", "0", "false")
+
+
+def read_stream_request(method: str, url, body: bytes) -> Tuple[Optional[str], Optional[Dict], Optional[dict]]:
+    """read_query() for /ask?stream=1: the POST body, or for GET (EventSource
+    clients) the query string ?stream=1&query=...[&filters=<json>]."""
+    if method == "POST":
+        return read_query(body)
+    params = parse_qs(url.query)
+    query = params.get("query", [""])[0].strip()
+    if not query:
+        return None, None, {"error": "empty query"}
+    try:
+        filters, err = read_filters(json.loads(params.get("filters", ["null"])[0]))
+    except ValueError:
+        filters, err = None, {"error": "invalid filters: not JSON"}
+    if err:
+        return None, None, err
+    return query, filters, None
+
+
 class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive; every response must carry Content-Length.
+    protocol_version = "HTTP/1.1"
+    # Longest wait for the rest of a request once it has started arriving.
+    timeout = 15
+    # Set when a kept-alive connection is handed back to PooledHTTPServer to
+    # wait for its next request without holding a worker.
+    parked = False
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if isinstance(self.server, PooledHTTPServer) and not self._buffered():
+                self.parked = True
+                return
+            self.handle_one_request()
+
+    def _buffered(self) -> bool:
+        """True if the next (pipelined) request has already arrived."""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def finish(self):
+        if not self.parked:
+            super().finish()
+
     def _set_cors(self):
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.send_header("Access-Control-Allow-Methods", "GET,POST,OPTIONS")
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
 
     def do_OPTIONS(self):
         self.send_response(204)
         self._set_cors()
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
-    def _json(self, code, obj):
+    def _send(self, code: int, ctype: str, body: bytes):
         self.send_response(code)
         self._set_cors()
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(obj).encode("utf-8"))
-
-    def _serve_static(self, rel_path: str):
-        # prevent path traversal
-        safe = Path("public") / rel_path.strip("/")
-        safe = safe.resolve()
-        if not str(safe).startswith(str((ROOT / "public").resolve())):
-            return self._json(403, {"error": "forbidden"})
-        if safe.is_dir():
-            safe = safe / "index.html"
-        if not safe.exists():
-            return self._json(404, {"error": "not found"})
-        ctype = "text/html" if safe.suffix == ".html" else "text/css" if safe.suffix == ".css" else "application/javascript" if safe.suffix == ".js" else "text/plain"
+        self.wfile.write(body)
+
+    def _json(self, code, obj):
+        self._send(code, "application/json", json_body(obj))
+
+    def _stream(self, query: str, filters: Optional[Dict] = None):
+        # No Content-Length on an event stream, so this connection ends with it.
+        self.close_connection = True
         self.send_response(200)
         self._set_cors()
-        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
         self.end_headers()
-        self.wfile.write(safe.read_bytes())
+        for chunk in sse_events(query, filters):
+            self.wfile.write(chunk)
+            self.wfile.flush()
 
     def do_GET(self):
-        path = urlparse(self.path).path
+        url = urlparse(self.path)
+        path = url.path
         if path == "/health":
             return self._json(200, {"ok": True})
-        # Serve dashboard/static
-        if path == "/":
-            return self._serve_static("index.html")
-        if path.startswith("/public/"):
-            return self._serve_static(path[len("/public/"):])
-        # Fallback to serving root public path
-        return self._serve_static(path)
+        if path == "/metrics":
+            return self._send(200, PROMETHEUS_TYPE, metrics_text())
+        if path == "/ask" and wants_stream(url):
+            query, filters, err = read_stream_request("GET", url, b"")
+            if err:
+                return self._json(400, err)
+            return self._stream(query, filters)
+        return self._send(*static_file(path))
 
     def do_POST(self):
-        path = urlparse(self.path).path
-        if path == "/ask":
+        url = urlparse(self.path)
+        if url.path == "/ask":
             ln = int(self.headers.get("Content-Length", 0))
             body = self.rfile.read(ln)
-            try:
-                obj = json.loads(body.decode("utf-8"))
-                query = obj.get("query", "").strip()
-            except Exception:
-                return self._json(400, {"error": "invalid json"})
-            if not query:
-                return self._json(400, {"error": "empty query"})
-            out = APP.answer(query)
-            return self._json(200, out)
+            if wants_stream(url):
+                query, filters, err = read_stream_request("POST", url, body)
+                if err:
+                    return self._json(400, err)
+                return self._stream(query, filters)
+            return self._json(*ask(body))
+        if url.path == "/ask_batch":
+            ln = int(self.headers.get("Content-Length", 0))
+            return self._json(*ask_batch(self.rfile.read(ln)))
         return self._json(404, {"error": "not found"})
 
 
-def run(port: int = 4000, host: str = "0.0.0.0"):
+class PooledHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer with a bounded worker pool instead of a thread per connection.
+
+    A worker serves one request at a time. Between requests a keep-alive
+    connection is parked on a selector (one thread for all of them) and only
+    goes back to the pool once its next request arrives, so idle clients
+    hold no worker; they are closed after `idle_timeout` seconds. At most
+    `workers` requests run at once and `queue_limit` more may wait for a
+    worker; beyond that a request gets an immediate 503.
+    """
+
+    daemon_threads = True
+    idle_timeout = 15.0
+
+    def __init__(self, server_address, handler, workers: int = 8, queue_limit: int = 64):
+        super().__init__(server_address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-http")
+        self.slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._idle = selectors.DefaultSelector()
+        self._parking: List[Handler] = []
+        self._parking_lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._idle.register(self._wake_r, selectors.EVENT_READ)
+        self._closing = False
+        self._watcher = threading.Thread(target=self._watch_idle, name="rag-http-idle", daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            return self._shed(request)
+        self.pool.submit(self._process, request, client_address)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _process(self, request, client_address):
+        handler = None
+        try:
+            handler = self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self._done(request, handler)
+
+    def _resume(self, handler: Handler):
+        handler.parked = False
+        try:
+            handler.handle()
+        except Exception:
+            handler.parked = False
+            self.handle_error(handler.request, handler.client_address)
+        finally:
+            if not handler.parked:
+                try:
+                    handler.finish()
+                except OSError:
+                    pass
+            self._done(handler.request, handler)
+
+    def _done(self, request, handler: Optional[Handler]):
+        self.slots.release()
+        if handler is not None and handler.parked:
+            with self._parking_lock:
+                self._parking.append(handler)
+            self._wake_w.send(b"\0")
+        else:
+            self.shutdown_request(request)
+
+    def _watch_idle(self):
+        deadlines: Dict[Handler, float] = {}
+        while not self._closing:
+            now = time.monotonic()
+            timeout = min(deadlines.values(), default=now + 1.0) - now
+            for key, _ in self._idle.select(max(0.0, min(timeout, 1.0))):
+                if key.fileobj is self._wake_r:
+                    self._wake_r.recv(4096)
+                    with self._parking_lock:
+                        parked, self._parking = self._parking, []
+                    for handler in parked:
+                        self._idle.register(handler.request, selectors.EVENT_READ, handler)
+                        deadlines[handler] = time.monotonic() + self.idle_timeout
+                    continue
+                handler = key.data
+                self._idle.unregister(handler.request)
+                del deadlines[handler]
+                if self.slots.acquire(blocking=False):
+                    self.pool.submit(self._resume, handler)
+                else:
+                    self._shed(handler.request)
+            now = time.monotonic()
+            for handler in [h for h, t in deadlines.items() if t <= now]:
+                self._idle.unregister(handler.request)
+                del deadlines[handler]
+                self.shutdown_request(handler.request)
+        for key in list(self._idle.get_map().values()):
+            if key.data is not None:
+                self.shutdown_request(key.fileobj)
+        self._idle.close()
+
+    def _shed(self, request):
+        body = b'{"error": "server busy"}'
+        head = (
+            "HTTP/1.1 503 Service Unavailable\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Retry-After: 1\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        try:
+            request.sendall(head.encode("ascii") + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._closing = True
+        self._wake_w.send(b"\0")
+        self._watcher.join()
+        self._wake_r.close()
+        self._wake_w.close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run(port: int = 4000, host: str = "0.0.0.0", workers: int = 8, queue_limit: int = 64):
     try:
-        server = HTTPServer((host, port), Handler)
+        server = PooledHTTPServer((host, port), Handler, workers, queue_limit)
     except OSError as exc:
         if port != 0:
             print(f"[warn] Port {port} unavailable ({exc}); retrying with an ephemeral port.")
-            server = HTTPServer((host, 0), Handler)
+            server = PooledHTTPServer((host, 0), Handler, workers, queue_limit)
         else:
             raise
 
     bound_port = server.server_port
-    print(f"Finance RAG server listening on {host}:{bound_port}")
+    print(f"Finance RAG server listening on {host}:{bound_port} ({workers} workers)")
 
     try:
         server.serve_forever()
@@ -127,5 +582,9 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--port", type=int, default=int(os.environ.get("PORT", 4000)))
     ap.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", 8)),
+                    help="request worker threads")
+    ap.add_argument("--queue-limit", type=int, default=int(os.environ.get("QUEUE_LIMIT", 64)),
+                    help="connections allowed to wait for a worker before answering 503")
     args = ap.parse_args()
-    run(args.port, args.host)
+    run(args.port, args.host, args.workers, args.queue_limit)
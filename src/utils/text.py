@@ -1,5 +1,14 @@
 import re
-from typing import List
+import sys
+from typing import Iterable, List
+
+# Runs of str.isalnum() characters: \w minus the underscore.
+_WORD_RE = re.compile(r"[^\W_]+")
+# ASCII fast path: lowercase alphanumerics, map everything else to a space.
+_ASCII_TABLE = bytes(c if chr(c).isalnum() else 32 for c in range(128)).lower() + b" " * 128
+# Typographic punctuation common in filings; none of it is alphanumeric, so
+# blanking it keeps otherwise-ASCII text on the fast path.
+_TYPO_PUNCT_RE = re.compile("[\u00a0\u2013\u2014\u2018\u2019\u201c\u201d\u2022\u2026]")
 
 
 def normalize_whitespace(s: str) -> str:
@@ -16,3 +25,21 @@ def split_sentences(text: str) -> List[str]:
     parts = re.split(r"(?<=[.!?])\s+(?=[A-Z(\[])", text)
     return [p.strip() for p in parts if p.strip()]
 
+
+def _words(text: str) -> List[str]:
+    if not text.isascii():
+        text = _TYPO_PUNCT_RE.sub(" ", text)
+    if text.isascii():
+        return text.encode("ascii").translate(_ASCII_TABLE).decode("ascii").split()
+    return _WORD_RE.findall(text.lower())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric runs; repeated tokens share one interned string."""
+    return list(map(sys.intern, _words(text)))
+
+
+def tokenize_many(texts: Iterable[str]) -> List[List[str]]:
+    """Batch form of tokenize()."""
+    intern = sys.intern
+    return [list(map(intern, _words(t))) for t in texts]
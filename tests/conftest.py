@@ -0,0 +1,81 @@
+import json
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# src/ holds top-level packages (rag, llm, utils, ...), imported as the server does.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+class _OllamaStub(BaseHTTPRequestHandler):
+    """POST /api/generate like Ollama: NDJSON over chunked encoding when streaming,
+    otherwise {"response": "echo: <prompt>"} after `server.delay` seconds (or
+    `server.delay(prompt)` when it is callable)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Like Ollama (Go sets TCP_NODELAY): headers and body go out as separate writes.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        srv = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with srv.lock:
+            srv.requests += 1
+            reset = srv.resets > 0
+            srv.resets -= reset
+            srv.inflight += 1
+            srv.max_inflight = max(srv.max_inflight, srv.inflight)
+        try:
+            if reset:  # drop the connection without answering
+                self.close_connection = True
+                return
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                lines = [{"response": piece, "done": False} for piece in srv.pieces] + [{"response": "", "done": True}]
+                for obj in lines:
+                    data = (json.dumps(obj) + "\n").encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            time.sleep(srv.delay(body["prompt"]) if callable(srv.delay) else srv.delay)
+            data = json.dumps({"response": "echo: " + body["prompt"], "done": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with srv.lock:
+                srv.inflight -= 1
+
+
+@pytest.fixture
+def ollama_stub():
+    """A local fake Ollama daemon; tune .pieces, .delay and .resets, read the counters."""
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _OllamaStub)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.pieces, srv.delay, srv.resets = [], 0.0, 0
+    srv.connections = srv.requests = srv.inflight = srv.max_inflight = 0
+    srv.url = f"http://127.0.0.1:{srv.server_port}"
+    threading.Thread(target=srv.serve_forever, args=(0.05,), daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
@@ -0,0 +1,39 @@
+import json
+
+from eval.metrics import AsyncEvaluator
+from monitoring.metrics_stub import MetricsStub
+
+CONTEXTS = [{"text": "Revenue grew 12% in 2023."}]
+
+
+def test_failed_evaluation_does_not_stop_the_worker(tmp_path):
+    metrics = MetricsStub()
+    log = tmp_path / "responses.jsonl"
+    evaluator = AsyncEvaluator(log, metrics=metrics)
+    bad = evaluator("q", None, CONTEXTS)  # grounding() cannot split a missing answer
+    good = evaluator("q", "Revenue grew 12%.", CONTEXTS)
+    evaluator.flush()
+    assert metrics.counters["eval.failed"] == 1
+    assert metrics.counters["eval.completed"] == 1
+    assert [json.loads(line)["eval_id"] for line in log.read_text().splitlines()] == [good["eval_id"]]
+    assert evaluator._thread.is_alive()
+    assert bad["pending"]
+    evaluator.close()
+
+
+def test_failing_callback_is_counted_and_skipped(tmp_path):
+    metrics = MetricsStub()
+    seen = []
+
+    def on_result(record):
+        seen.append(record["answer"])
+        if len(seen) == 1:
+            raise ValueError("sink down")
+
+    evaluator = AsyncEvaluator(tmp_path / "responses.jsonl", metrics=metrics, on_result=on_result)
+    for answer in ("one", "two"):
+        evaluator("q", answer, CONTEXTS)
+    evaluator.close()
+    assert seen == ["one", "two"]
+    assert metrics.counters["eval.failed"] == 1
+    assert metrics.counters["eval.completed"] == 1
@@ -0,0 +1,37 @@
+import socket
+import threading
+
+import pytest
+
+async_server = pytest.importorskip("server.async_server")
+
+
+@pytest.fixture
+def port():
+    sock = async_server.listen("127.0.0.1", 0)
+    threading.Thread(target=async_server.Worker(sock, threads=1).run, daemon=True).start()
+    yield sock.getsockname()[1]
+
+
+def _exchange(port, raw: bytes) -> bytes:
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(raw)
+        data = b""
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return data
+            data += chunk
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1e3"])
+def test_bad_content_length_is_a_400(port, length):
+    raw = f"POST /ask HTTP/1.1\r\nHost: x\r\nContent-Length: {length}\r\n\r\n{{}}".encode()
+    resp = _exchange(port, raw)
+    assert resp.startswith(b"HTTP/1.1 400 ")
+    assert resp.endswith(b'{"error": "bad content-length"}')
+
+
+def test_oversized_body_is_a_413(port):
+    raw = f"POST /ask HTTP/1.1\r\nHost: x\r\nContent-Length: {async_server.MAX_BODY + 1}\r\n\r\n".encode()
+    assert _exchange(port, raw).startswith(b"HTTP/1.1 413 ")
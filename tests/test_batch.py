@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from eval.metrics import GroundingEvaluator
+from llm.local import LocalAnswerComposer
+from rag.pipeline import RagPipeline
+from rag.vector_store import DocumentStore
+
+DOCS = [
+    "Revenue grew 12% on strong demand. Margins expanded as input costs eased.",
+    "Credit risk rose as rates climbed. The bank raised its loan loss reserves.",
+    "The board approved a dividend increase and a share buyback program.",
+    "Liquidity stayed strong with ample cash on hand and undrawn credit lines.",
+]
+QUERIES = ["revenue demand", "credit reserves", "dividend buyback", "cash credit lines", "revenue demand"]
+
+
+@pytest.mark.parametrize("workers", [0, 4])
+def test_answer_many_matches_answer(workers):
+    store = DocumentStore(chunk_size=8, chunk_overlap=2)
+    store.fit(DOCS, [{"source": f"d{i}.txt", "kind": "credit" if i % 2 else "other"} for i in range(len(DOCS))])
+    rag = RagPipeline(store, LocalAnswerComposer(), evaluator=GroundingEvaluator(), workers=workers)
+    assert rag.answer_many(QUERIES, top_k=2) == [rag.answer(q, top_k=2) for q in QUERIES]
+    filters = {"kind": "credit"}
+    assert rag.answer_many(QUERIES, top_k=2, filters=filters) == [rag.answer(q, top_k=2, filters=filters)
+                                                                  for q in QUERIES]
+    rag.close()
+
+
+@pytest.fixture
+def rag_server():
+    return pytest.importorskip("server.rag_server")
+
+
+def test_app_batch_answers_duplicates_once_and_keeps_order(rag_server, tmp_path, monkeypatch):
+    app = rag_server.RagApp(index_path=tmp_path / "docstore.idx")
+    seen = []
+    answer_many = app.rag.answer_many
+    monkeypatch.setattr(app.rag, "answer_many", lambda qs, **kw: seen.append(list(qs)) or answer_many(qs, **kw))
+    queries = ["What was revenue growth?", "credit risk", "What  was revenue growth?"]
+    results = app.answer_many(queries)
+    assert seen == [["What was revenue growth?", "credit risk"]]
+    assert [r["query"] for r in results] == queries
+    assert results[2]["answer"] == results[0]["answer"] and results[2] is not results[0]
+    assert app.answer_many(queries) == results  # now all cache hits
+
+
+@pytest.mark.parametrize("body, status", [
+    ({"queries": []}, 400),
+    ({"queries": ["ok", 3]}, 400),
+    ({"queries": ["ok", "  "]}, 400),
+    ({"queries": ["ok"], "top_k": 0}, 400),
+    ({"queries": ["ok"] * 257}, 413),
+])
+def test_ask_batch_rejects_bad_bodies(rag_server, body, status):
+    assert rag_server.ask_batch(json.dumps(body).encode())[0] == status
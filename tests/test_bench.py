@@ -0,0 +1,31 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BENCH = Path(__file__).resolve().parents[1] / "scripts" / "bench.py"
+
+BASELINE = {"results": {"10k": {"query_p50_ms": 2.0, "qps": 500.0, "index_bytes": 1000, "chunks": 10000,
+                                "generate_s": 1.0}}}
+
+
+def _compare(tmp_path, current, threshold="0.10"):
+    (tmp_path / "old.json").write_text(json.dumps(BASELINE))
+    (tmp_path / "new.json").write_text(json.dumps({"results": current}))
+    return subprocess.run([sys.executable, str(BENCH), "compare", str(tmp_path / "old.json"),
+                           str(tmp_path / "new.json"), "--threshold", threshold],
+                          capture_output=True, text=True)
+
+
+def test_compare_passes_within_threshold(tmp_path):
+    # Within 10% on timings and QPS; counts and harness figures are not compared.
+    done = _compare(tmp_path, {"10k": {"query_p50_ms": 2.1, "qps": 460.0, "index_bytes": 1000, "chunks": 1,
+                                       "generate_s": 9.0}})
+    assert done.returncode == 0, done.stderr
+
+
+def test_compare_flags_slower_timings_and_lower_qps(tmp_path):
+    done = _compare(tmp_path, {"10k": {"query_p50_ms": 2.5, "qps": 400.0, "index_bytes": 1000}})
+    assert done.returncode == 1
+    assert "10k.query_p50_ms" in done.stderr and "10k.qps" in done.stderr
+    assert "index_bytes" not in done.stderr
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from rag.chunker import iter_spans, make_chunks
+from utils.text import split_sentences
+
+
+def _reference_windows(text, size, overlap):
+    # The original split/join chunker.
+    tokens = text.split()
+    out, start = [], 0
+    while start < len(tokens):
+        end = min(len(tokens), start + size)
+        out.append(" ".join(tokens[start:end]))
+        if end == len(tokens):
+            break
+        start = max(0, end - overlap)
+    return out
+
+
+def _text(seed, n=300):
+    rng = random.Random(seed)
+    words = "revenue grew margins eased credit risk rose rates climbed cash".split()
+    seps = [" ", " ", "  ", "\n", "\t", " \n\n "]
+    return "".join(rng.choice(words) + rng.choice(seps) for _ in range(n))
+
+
+@pytest.mark.parametrize("size, overlap", [(50, 10), (7, 0), (16, 15), (400, 80)])
+def test_word_spans_match_the_split_join_chunker(size, overlap):
+    for seed in range(5):
+        text = "  " + _text(seed)
+        spans = [" ".join(text[a:b].split()) for a, b in iter_spans(text, size, overlap)]
+        assert spans == _reference_windows(text, size, overlap)
+        assert [c["text"] for c in make_chunks(text, size, overlap)] == spans
+
+
+def test_sentence_chunks_hold_whole_sentences():
+    sentences = [f"Sentence {i} has {'some ' * (i % 5)}words." for i in range(40)]
+    text = " ".join(sentences)
+    for a, b in iter_spans(text, 20, 6, mode="sentence"):
+        chunk = text[a:b]
+        assert len(chunk.split()) <= 20
+        assert all(s in sentences for s in split_sentences(chunk))
+
+
+def test_chunks_end_on_section_headers():
+    text = "Item 1. Business\nWe sell widgets.\nItem 1A. Risk Factors\nDemand may fall.\nPART II\nMarket data."
+    # Sections of 6, 7 and 4 tokens: no two neighbours fit in 7.
+    chunks = [text[a:b] for a, b in iter_spans(text, 7, 0, mode="section")]
+    assert chunks == ["Item 1. Business\nWe sell widgets.", "Item 1A. Risk Factors\nDemand may fall.",
+                      "PART II\nMarket data."]
+
+
+def test_bad_arguments_are_rejected():
+    with pytest.raises(ValueError):
+        list(iter_spans("a b c", 10, 2, mode="pages"))
+    with pytest.raises(ValueError):
+        list(iter_spans("a b c", 10, 10))
@@ -0,0 +1,53 @@
+from llm.context_packer import estimate_tokens, pack_contexts
+
+
+def words(text):
+    return len(text.split())
+
+
+def _cost(packed):
+    # The packer also charges a token per sentence join, so its count may be higher.
+    return sum(words(f"[{n}] ({c['source']})\n") + words(c["text"]) for n, c in enumerate(packed, 1))
+
+
+def test_best_contexts_first_and_budget_respected():
+    contexts = [
+        {"source": "a.txt", "score": 0.2, "text": "Margins eased in the third quarter."},
+        {"source": "b.txt", "score": 0.9, "text": "Revenue grew twelve percent. Demand stayed strong."},
+        {"source": "c.txt", "score": 0.5, "text": "Credit risk rose as rates climbed."},
+    ]
+    packed, stats = pack_contexts(contexts, budget=20, count_tokens=words)
+    assert [c["source"] for c in packed] == ["b.txt", "c.txt"]
+    assert _cost(packed) <= stats["context_tokens"] <= 20
+    assert stats["over_budget_chunks"] == 1  # a.txt: 2 header tokens leave no room
+    assert packed[0]["score"] == 0.9  # other fields are kept
+
+
+def test_overlapping_chunks_of_one_source_are_not_repeated():
+    contexts = [
+        {"source": "a.txt", "score": 0.9, "text": "Revenue grew. Margins eased. Costs fell."},
+        {"source": "a.txt", "score": 0.8, "text": "Costs fell. Cash rose."},
+        {"source": "b.txt", "score": 0.7, "text": "Revenue grew. Margins eased."},
+    ]
+    packed, stats = pack_contexts(contexts, budget=100, count_tokens=words)
+    assert [c["text"] for c in packed] == ["Revenue grew. Margins eased. Costs fell.", "Cash rose."]
+    assert stats["duplicate_sentences"] == 3
+    assert stats["duplicate_chunks"] == 1
+
+
+def test_chunks_keep_whole_sentences_unless_the_first_does_not_fit():
+    contexts = [
+        {"source": "a.txt", "score": 0.9, "text": "Revenue grew on demand. Margins eased a lot this year."},
+        {"source": "b.txt", "score": 0.8, "text": "Credit risk rose sharply as rates climbed across markets."},
+    ]
+    packed, stats = pack_contexts(contexts, budget=10, count_tokens=words)
+    assert packed[0]["text"] == "Revenue grew on demand."
+    assert packed[1]["text"] == "Credit risk…"  # 2 tokens left after its header
+    assert stats["truncated_chunks"] == 2
+    assert stats["context_tokens"] == 10
+
+
+def test_estimate_tokens_rounds_up():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
@@ -0,0 +1,39 @@
+import pytest
+
+from rag.vector_store import DocumentStore
+
+pytest.importorskip("numpy")
+
+DOCS = [
+    "Revenue grew 12% on strong demand. Margins expanded as input costs eased.",
+    "Credit risk rose as rates climbed. The bank raised its loan loss reserves.",
+    "The board approved a dividend increase and a share buyback program.",
+    "Liquidity stayed strong with ample cash on hand and undrawn credit lines.",
+    "Guidance for next year assumes moderate demand growth and stable margins.",
+]
+QUERIES = ["revenue demand", "credit rates reserves", "cash dividend buyback", "margins", "no such words"]
+
+
+def _ranked(hits):
+    return [(round(score, 9), doc["text"]) for score, doc in hits]
+
+
+def _stores():
+    stores = []
+    for backend in ("dict", "csr"):
+        store = DocumentStore(chunk_size=8, chunk_overlap=2, backend=backend)
+        store.fit(DOCS, [{"source": f"d{i}"} for i in range(len(DOCS))])
+        stores.append(store)
+    return stores
+
+
+def test_csr_backend_ranks_like_the_dict_backend():
+    plain, csr = _stores()
+    for q in QUERIES:
+        assert _ranked(csr.query(q, top_k=6)) == _ranked(plain.query(q, top_k=6))
+
+
+def test_csr_query_many_matches_single_queries():
+    plain, csr = _stores()
+    batch = csr.query_many(QUERIES, top_k=3)
+    assert [_ranked(hits) for hits in batch] == [_ranked(plain.query(q, top_k=3)) for q in QUERIES]
@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from rag.dense import DenseIndex, HashingEmbedder  # noqa: E402
+
+TOPICS = ["revenue grew on demand", "credit risk and loan reserves", "dividend and share buyback",
+          "cash and liquidity lines", "guidance for margins", "rates and bond yields"]
+DOCS = [f"Report {i}: {TOPICS[i % len(TOPICS)]} in quarter {i % 4 + 1} of {2018 + i % 5}." for i in range(60)]
+METAS = [{"source": f"r{i}.txt", "year": 2018 + i % 5} for i in range(60)]
+QUERIES = ["credit reserves", "buyback dividend", "bond yields rates", "quarter 3 revenue"]
+
+
+def _index(**kwargs):
+    index = DenseIndex(chunk_size=40, chunk_overlap=0, use_faiss=False, **kwargs)
+    index.fit(DOCS, METAS)
+    return index
+
+
+def _brute(index, query, k, ids=None):
+    ids = np.arange(len(index.docs)) if ids is None else np.asarray(ids)
+    scores = index.vectors[ids] @ index.embedder.embed([query])[0]
+    order = sorted(range(len(ids)), key=lambda j: (-scores[j], ids[j]))[:k]
+    return [int(ids[j]) for j in order]
+
+
+def test_embeddings_are_unit_rows_and_deterministic():
+    a = HashingEmbedder(dim=64).embed(DOCS[:5])
+    b = HashingEmbedder(dim=64).embed(DOCS[:5])
+    assert a.dtype == np.float32 and a.shape == (5, 64)
+    assert np.array_equal(a, b)
+    assert np.allclose(np.linalg.norm(a, axis=1), 1.0, atol=1e-5)
+
+
+def test_flat_search_is_brute_force():
+    index = _index(method="flat")
+    for q in QUERIES:
+        assert [i for _, i in index.search([q], top_k=5)[0]] == _brute(index, q, 5)
+
+
+def test_ivf_probing_every_list_is_exact():
+    index = _index(method="ivf", nlist=6, nprobe=6)
+    assert index.centroids is not None
+    for q in QUERIES:
+        approx = index.search([q], top_k=5)[0]
+        exact = index.search([q], top_k=5, exact=True)[0]
+        assert [i for _, i in approx] == [i for _, i in exact] == _brute(index, q, 5)
+
+
+def test_filtered_search_matches_post_filtered_brute_force():
+    index = _index(method="ivf", nlist=6, nprobe=1)
+    allowed = [i for i, d in enumerate(index.docs) if d["meta"]["year"] == 2020]
+    for q in QUERIES:
+        hits = index.query(q, top_k=4, filters={"year": 2020})
+        assert all(doc["meta"]["year"] == 2020 for _, doc in hits)
+        assert [index.docs.index(doc) for _, doc in hits] == _brute(index, q, 4, allowed)
+
+
+def test_saved_index_answers_the_same(tmp_path):
+    index = _index(method="ivf", nlist=6, nprobe=2)
+    index.save(tmp_path / "dense")
+    loaded = DenseIndex.load(tmp_path / "dense", use_faiss=False)
+    assert isinstance(loaded.vectors, np.memmap)
+    for q in QUERIES:
+        assert loaded.search([q], top_k=5) == index.search([q], top_k=5)
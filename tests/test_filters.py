@@ -0,0 +1,68 @@
+import random
+
+from rag.rankers import BM25Ranker, make_ranker
+from rag.vector_store import DocumentStore
+
+WORDS = ("revenue margin growth dividend risk rate credit equity bond cash flow "
+         "liquidity guidance outlook segment inflation demand supply").split()
+QUERIES = ["revenue growth", "credit risk rate", "dividend cash flow", "inflation demand outlook"]
+
+
+def corpus(n=30, seed=5):
+    rng = random.Random(seed)
+    docs = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 200))) for _ in range(n)]
+    metas = [{"source": f"doc{i}.txt", "doc_type": ["10-K", "10-Q", "8-K"][i % 3], "year": 2020 + i % 5}
+             for i in range(n)]
+    return docs, metas
+
+
+def matches(meta, filters):
+    for field, cond in filters.items():
+        value = meta.get(field)
+        if isinstance(cond, dict):
+            if value is None or not all({"gt": value > b, "gte": value >= b, "lt": value < b,
+                                         "lte": value <= b}[op] for op, b in cond.items()):
+                return False
+        elif value not in (cond if isinstance(cond, list) else [cond]):
+            return False
+    return True
+
+
+FILTERS = [{"doc_type": "10-K"}, {"doc_type": ["10-Q", "8-K"], "year": {"gte": 2022}},
+           {"source": "doc4.txt"}, {"year": {"gt": 2021, "lt": 2024}}, {"doc_type": "nope"}]
+
+
+def test_filtered_query_matches_post_filter():
+    docs, metas = corpus()
+    store = DocumentStore(chunk_size=30, chunk_overlap=5)
+    store.fit(docs, metas)
+    n = len(store.docs)
+    for ranker in (None, BM25Ranker()):
+        for filters in FILTERS:
+            for q in QUERIES:
+                got = store.query(q, 5, ranker, filters=filters)
+                # Rank the whole corpus, then keep matching chunks.
+                full = [(s, d) for s, d in store.query(q, n, ranker) if matches(d["meta"], filters)][:5]
+                assert [(round(s, 9), d["text"]) for s, d in got] == \
+                       [(round(s, 9), d["text"]) for s, d in full]
+
+
+def test_filtered_fusion_same_on_incremental_and_fresh_store():
+    docs, metas = corpus()
+    incremental = DocumentStore(chunk_size=30, chunk_overlap=5)
+    incremental.compact_ratio = 1.0  # keep the tombstones
+    incremental.fit(docs[:20], metas[:20])
+    incremental.add_documents(docs[20:], metas[20:])
+    kept = [i for i, m in enumerate(metas) if m["doc_type"] != "8-K"]
+    for i, m in enumerate(metas):
+        if i not in kept:
+            incremental.remove_documents(m["source"])
+    fresh = DocumentStore(chunk_size=30, chunk_overlap=5)
+    fresh.fit([docs[i] for i in kept], [metas[i] for i in kept])
+    for spec in ("rrf:bm25,cosine", "weighted:bm25=0.7,cosine=0.3"):
+        ranker = make_ranker(spec)
+        for filters in ({"doc_type": "10-Q"}, {"year": {"gte": 2022}}, {"doc_type": "10-K"}):
+            for q in QUERIES:
+                a = incremental.query(q, 5, ranker, filters=filters)
+                b = fresh.query(q, 5, ranker, filters=filters)
+                assert [(round(s, 9), d["text"]) for s, d in a] == [(round(s, 9), d["text"]) for s, d in b]
@@ -0,0 +1,54 @@
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+rag_server = pytest.importorskip("server.rag_server")
+
+
+@pytest.fixture
+def server():
+    # 4 slots in all, fewer than the idle connections below; a little queue absorbs
+    # a worker that has answered but not yet released its slot.
+    srv = rag_server.PooledHTTPServer(("127.0.0.1", 0), rag_server.Handler, workers=2, queue_limit=2)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _get(conn, path="/health"):
+    conn.request("GET", path)
+    resp = conn.getresponse()
+    return resp.status, resp.read()
+
+
+def test_idle_keep_alive_connections_hold_no_worker(server):
+    port = server.server_port
+    idle = [http.client.HTTPConnection("127.0.0.1", port, timeout=5) for _ in range(6)]
+    for conn in idle:
+        assert _get(conn)[0] == 200  # now idle, kept alive
+    t0 = time.monotonic()
+    fresh = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    assert _get(fresh) == (200, b'{"ok": true}')
+    assert time.monotonic() - t0 < 1.0
+    # A parked connection is served again once its next request arrives.
+    for conn in idle:
+        assert _get(conn)[0] == 200
+        conn.close()
+    fresh.close()
+
+
+def test_pipelined_requests_are_both_answered(server):
+    sock = socket.create_connection(("127.0.0.1", server.server_port), timeout=5)
+    req = b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n"
+    sock.sendall(req + req)
+    data = b""
+    while data.count(b'{"ok": true}') < 2:
+        chunk = sock.recv(4096)
+        assert chunk
+        data += chunk
+    sock.close()
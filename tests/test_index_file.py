@@ -0,0 +1,61 @@
+import pytest
+
+from rag.index_file import MAGIC
+from rag.rankers import BM25Ranker
+from rag.vector_store import DocumentStore
+
+DOCS = [
+    "Revenue grew 12% on strong demand. Margins expanded as input costs eased.",
+    "Credit risk rose as rates climbed. The bank raised its loan loss reserves.",
+    "The board approved a dividend increase and a share buyback program.",
+    "Liquidity stayed strong with ample cash on hand. Café sales in Zürich rose.",
+]
+QUERIES = ["revenue demand", "credit rates reserves", "cash dividend", "zürich café"]
+
+
+def _fitted():
+    store = DocumentStore(chunk_size=8, chunk_overlap=2)
+    store.fit(DOCS, [{"source": f"d{i}", "year": 2020 + i} for i in range(len(DOCS))])
+    return store
+
+
+def _ranked(store, q, ranker=None):
+    return [(round(score, 9), doc["text"], doc["meta"]) for score, doc in store.query(q, 5, ranker)]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_saved_index_reads_back_like_the_fitted_store(tmp_path, mmap):
+    store = _fitted()
+    store.save(tmp_path / "docstore.idx")
+    loaded = DocumentStore.load(tmp_path / "docstore.idx", mmap=mmap)
+    assert len(loaded.docs) == len(store.docs)
+    for a, b in zip(loaded.docs, store.docs):
+        assert (a["text"], a["meta"]) == (b["text"], b["meta"])
+        assert list(a.sentences.lines) == list(b.sentences.lines)
+    for q in QUERIES:
+        assert _ranked(loaded, q) == _ranked(store, q)
+        assert _ranked(loaded, q, BM25Ranker()) == _ranked(store, q, BM25Ranker())
+
+
+def test_loaded_store_takes_incremental_updates(tmp_path):
+    store = _fitted()
+    store.save(tmp_path / "docstore.idx")
+    loaded = DocumentStore.load(tmp_path / "docstore.idx")
+    for s in (store, loaded):
+        s.remove_documents("d1")
+        s.add_documents(["Rates climbed again and credit spreads widened."], [{"source": "d9"}])
+    for q in QUERIES + ["credit spreads"]:
+        assert _ranked(loaded, q) == _ranked(store, q)
+
+
+def test_foreign_or_outdated_files_are_rejected(tmp_path):
+    path = tmp_path / "docstore.idx"
+    path.write_bytes(b"not an index at all, just some bytes")
+    with pytest.raises(ValueError, match="not a DocumentStore index"):
+        DocumentStore.load(path)
+    _fitted().save(path)
+    data = bytearray(path.read_bytes())
+    data[len(MAGIC):len(MAGIC) + 4] = (0).to_bytes(4, "little")
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="unsupported index version"):
+        DocumentStore.load(path)
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+rag_server = pytest.importorskip("server.rag_server")
+
+
+def test_index_without_raw_dir_is_fresh(tmp_path):
+    index = tmp_path / "docstore.idx"
+    assert not rag_server._index_is_fresh(index, tmp_path / "raw")
+    index.write_bytes(b"")
+    assert rag_server._index_is_fresh(index, tmp_path / "raw")
+
+
+def test_newer_source_makes_index_stale(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    doc = raw / "a.txt"
+    doc.write_text("Revenue grew.")
+    index = tmp_path / "docstore.idx"
+    index.write_bytes(b"")
+    built = index.stat().st_mtime
+    os.utime(raw, (built - 10, built - 10))
+    os.utime(doc, (built - 10, built - 10))
+    assert rag_server._index_is_fresh(index, raw)
+    os.utime(doc, (built + 10, built + 10))
+    assert not rag_server._index_is_fresh(index, raw)
@@ -0,0 +1,38 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from data.loader import clean_text
+from rag.ingest import ingest_files
+from rag.vector_store import DocumentStore
+
+WORDS = "revenue margin growth dividend risk rate credit equity bond cash flow liquidity".split()
+QUERIES = ["revenue growth", "credit risk", "dividend cash flow"]
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    rng = random.Random(7)
+    (tmp_path / "clean").mkdir()
+    jobs = []
+    for i in range(9):
+        raw = tmp_path / f"doc{i}.txt"
+        raw.write_bytes("\r\n".join(" ".join(rng.choice(WORDS) for _ in range(30)) for _ in range(4)).encode())
+        jobs.append((str(raw), str(tmp_path / "clean" / raw.name)))
+    return jobs
+
+
+def _ranked(store):
+    return [[(round(s, 9), d["text"], d["meta"]["source"]) for s, d in store.query(q, 5)] for q in QUERIES]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_streamed_ingest_matches_fit(jobs, workers):
+    fitted = DocumentStore(chunk_size=25, chunk_overlap=5)
+    fitted.fit([clean_text(Path(raw).read_bytes()) for raw, _ in jobs], [{"source": out} for _, out in jobs])
+    streamed = DocumentStore(chunk_size=25, chunk_overlap=5)
+    assert ingest_files(streamed, jobs, workers=workers, batch_size=2) == len(fitted.docs)
+    assert _ranked(streamed) == _ranked(fitted)
+    # Clean copies are written on the way.
+    assert all(Path(out).read_text(encoding="utf-8") == clean_text(Path(raw).read_bytes()) for raw, out in jobs)
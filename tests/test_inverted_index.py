@@ -0,0 +1,23 @@
+import random
+
+from rag.vector_store import DocumentStore
+from utils.text import tokenize
+
+WORDS = ("revenue margin growth dividend risk rate credit equity bond cash flow "
+         "liquidity guidance outlook segment inflation demand supply").split()
+QUERIES = ["revenue growth", "credit risk rate", "dividend cash flow", "inflation", "nothing here"]
+
+
+def test_query_matches_brute_force_cosine_over_all_chunks():
+    rng = random.Random(11)
+    docs = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 120))) for _ in range(12)]
+    store = DocumentStore(chunk_size=30, chunk_overlap=5)
+    store.fit(docs)
+    vectors = [store._tfidf(tokenize(d["text"])) for d in store.docs]
+    for q in QUERIES:
+        q_vec = store.vectorize(q)
+        sims = [store._sim(q_vec, v) for v in vectors]
+        best = sorted(range(len(sims)), key=lambda i: (-sims[i], i))[:5]
+        hits = store.query(q, top_k=5)
+        assert [round(s, 9) for s, _ in hits] == [round(sims[i], 9) for i in best]
+        assert [d["text"] for _, d in hits] == [store.docs[i]["text"] for i in best]
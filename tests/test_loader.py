@@ -0,0 +1,60 @@
+import json
+import os
+from pathlib import Path
+
+from data.loader import clean_text, load_and_clean, load_changes, manifest_path
+
+
+def _setup(tmp_path):
+    raw, clean = tmp_path / "raw", tmp_path / "clean"
+    raw.mkdir()
+    clean.mkdir()
+    (raw / "a.txt").write_bytes(b"Revenue  grew.\r\nMargins eased.\n")
+    (raw / "b.txt").write_bytes(b"Credit risk rose.\n")
+    return raw, clean
+
+
+def _names(docs):
+    return sorted(Path(d if isinstance(d, str) else d["path"]).name for d in docs)
+
+
+def test_second_run_skips_unchanged_files(tmp_path, monkeypatch):
+    raw, clean = _setup(tmp_path)
+    first = load_changes(raw, clean)
+    assert _names(first["added"]) == ["a.txt", "b.txt"]
+    assert (clean / "a.txt").read_text(encoding="utf-8") == clean_text((raw / "a.txt").read_bytes())
+
+    def no_reads(self):
+        raise AssertionError(f"{self} was read")
+
+    monkeypatch.setattr(Path, "read_bytes", no_reads)
+    again = load_changes(raw, clean)
+    assert _names(again["unchanged"]) == ["a.txt", "b.txt"]
+    assert again["added"] == again["changed"] == again["removed"] == []
+
+
+def test_touched_file_with_same_content_is_only_restamped(tmp_path):
+    raw, clean = _setup(tmp_path)
+    load_changes(raw, clean)
+    st = (raw / "a.txt").stat()
+    os.utime(raw / "a.txt", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    delta = load_changes(raw, clean)
+    assert _names(delta["unchanged"]) == ["a.txt", "b.txt"] and delta["changed"] == []
+    manifest = json.loads(manifest_path(clean).read_text(encoding="utf-8"))
+    assert manifest["a.txt"]["mtime_ns"] == st.st_mtime_ns + 10**9
+
+
+def test_changed_and_removed_files_are_reported(tmp_path):
+    raw, clean = _setup(tmp_path)
+    load_changes(raw, clean)
+    (raw / "a.txt").write_bytes(b"Revenue fell sharply.\n")
+    (raw / "b.txt").unlink()
+    (raw / "c.txt").write_bytes(b"New filing.\n")
+    delta = load_changes(raw, clean)
+    assert [d["content"] for d in delta["changed"]] == ["Revenue fell sharply."]
+    assert _names(delta["added"]) == ["c.txt"]
+    assert _names(delta["removed"]) == ["b.txt"]
+    assert not (clean / "b.txt").exists()
+    docs = load_and_clean(raw, clean)
+    assert [(Path(d["path"]).name, d["content"]) for d in docs] == [
+        ("a.txt", "Revenue fell sharply."), ("c.txt", "New filing.")]
@@ -0,0 +1,48 @@
+from llm.local import LocalAnswerComposer
+from rag.pipeline import RagPipeline
+from rag.sentences import MIN_TERM_LEN
+from rag.vector_store import DocumentStore
+from utils.text import split_sentences, tokenize
+
+DOCS = [
+    "Quarterly report.\nRevenue grew twelve percent on strong demand. Margins eased.\n"
+    "Demand for credit products also grew.",
+    "Credit risk rose as rates climbed.\nThe bank raised reserves. Revenue from lending fell.",
+]
+QUERY = "How did revenue and demand grow?"
+
+
+def _reference(query, contexts):
+    # The original composer: overlap with the query terms, a tiny bonus for longer
+    # sentences (so any sentence with terms qualifies), ties in reading order.
+    q_terms = {w for w in tokenize(query) if len(w) >= MIN_TERM_LEN}
+    scored = []
+    for ctx in contexts:
+        for sent in split_sentences(ctx["text"]):
+            terms = {w for w in tokenize(sent) if len(w) >= MIN_TERM_LEN}
+            score = len(q_terms & terms) + 1e-6 * len(terms)
+            if score > 0:
+                scored.append((score, " ".join(sent.split())))
+    return [s for _, s in sorted(scored, key=lambda x: -x[0])[:4]]
+
+
+def _store():
+    store = DocumentStore(chunk_size=40, chunk_overlap=0)
+    store.fit(DOCS, [{"source": "a.txt"}, {"source": "b.txt"}])
+    return store
+
+
+def test_picks_the_best_overlapping_sentences():
+    contexts = [{"text": " ".join(d.split()), "source": s} for d, s in zip(DOCS, ("a.txt", "b.txt"))]
+    out = LocalAnswerComposer().compose(QUERY, contexts)
+    assert out["answer"].split("\n", 1)[1] == " ".join(_reference(QUERY, contexts))
+
+
+def test_indexed_sentences_compose_the_same_answer_and_cite_source_lines():
+    contexts = RagPipeline(_store(), LocalAnswerComposer()).retrieve(QUERY, top_k=2)
+    assert all(c.get("sentences") is not None for c in contexts)
+    plain = [{"text": c["text"], "source": c["source"]} for c in contexts]
+    indexed = LocalAnswerComposer().compose(QUERY, contexts)
+    assert indexed["answer"] == LocalAnswerComposer().compose(QUERY, plain)["answer"]
+    cited = {(c["source"], c["line"]) for c in indexed["citations"]}
+    assert ("a.txt", 2) in cited and ("a.txt", 3) in cited  # "Revenue grew ..." and "Demand for credit ..."
@@ -0,0 +1,35 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from monitoring.metrics_stub import MetricsStub
+
+
+def test_exited_threads_fold_into_base_shard():
+    metrics = MetricsStub()
+
+    def work(_):
+        metrics.inc("query.total")
+        with metrics.span("stage.score"):
+            pass
+
+    for _ in range(1000):
+        with ThreadPoolExecutor(max_workers=2) as pool:  # a fresh pool per call
+            list(pool.map(work, range(4)))
+    metrics.inc("query.total")  # registers the main thread, folding the exited ones
+    assert len(metrics._shards) <= threading.active_count()
+    assert metrics.counters["query.total"] == 4001
+    assert metrics.snapshot()["histograms"]["stage.score"]["count"] == 4000
+
+
+def test_nested_spans_on_one_key_are_timed_separately():
+    metrics = MetricsStub()
+    with metrics.span("stage.score") as outer:
+        with metrics.span("stage.score") as inner:
+            assert inner is not outer
+        time.sleep(0.002)
+    with metrics.span("stage.score") as again:
+        assert again is outer  # the idle span is reused
+    h = metrics.snapshot()["histograms"]["stage.score"]
+    assert h["count"] == 3
+    assert h["sum"] >= 0.002
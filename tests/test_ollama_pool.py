@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+from llm.ollama_client import OllamaClient
+
+
+def test_sequential_requests_reuse_one_connection(ollama_stub):
+    client = OllamaClient(host=ollama_stub.url)
+    assert [client.generate("stub", f"q{i}") for i in range(5)] == [f"echo: q{i}" for i in range(5)]
+    assert ollama_stub.connections == 1
+    assert ollama_stub.requests == 5
+
+
+def test_in_flight_requests_are_capped(ollama_stub):
+    ollama_stub.delay = 0.05
+    client = OllamaClient(host=ollama_stub.url, max_connections=2)
+    threads = [threading.Thread(target=client.generate, args=("stub", f"q{i}")) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ollama_stub.requests == 8
+    assert ollama_stub.max_inflight == 2
+    assert ollama_stub.connections == 2
+
+
+def test_reset_is_retried_with_backoff(ollama_stub):
+    ollama_stub.resets = 2
+    client = OllamaClient(host=ollama_stub.url, retries=3, backoff=0.05)
+    t0 = time.monotonic()
+    assert client.generate("stub", "q") == "echo: q"
+    assert time.monotonic() - t0 >= 0.05 + 0.1  # slept backoff * 2**attempt before each retry
+    assert ollama_stub.requests == 3
+    assert ollama_stub.connections == 3
+
+
+def test_resets_past_the_retry_budget_raise(ollama_stub):
+    ollama_stub.resets = 3
+    client = OllamaClient(host=ollama_stub.url, retries=1, backoff=0.0)
+    with pytest.raises(RuntimeError, match="Failed to reach Ollama"):
+        client.generate("stub", "q")
+    assert ollama_stub.requests == 2
+    assert client.generate("stub", "q") == "echo: q"  # the slot was handed back
+
+
+def test_generate_many_keeps_input_order(ollama_stub):
+    prompts = [f"q{i}" for i in range(12)]
+    ollama_stub.delay = lambda prompt: 0.06 - 0.005 * int(prompt[1:])  # later prompts finish first
+    client = OllamaClient(host=ollama_stub.url, max_connections=4)
+    assert client.generate_many("stub", prompts) == [f"echo: {p}" for p in prompts]
+    assert ollama_stub.max_inflight <= 4
+    assert ollama_stub.connections <= 4
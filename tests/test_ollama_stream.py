@@ -0,0 +1,75 @@
+import json
+import socket
+
+import pytest
+
+from llm.ollama_client import OllamaAnswerer, OllamaClient
+
+CONTEXTS = [{"text": "Revenue grew 12%.", "source": "a.txt", "line": 3},
+            {"text": "Margins fell.", "source": "b.txt", "line": 7}]
+PIECES = ["Revenue ", "grew [", "1", "] while margins fell [2", "]."]
+
+
+def _answerer(url):
+    answerer = OllamaAnswerer(model="stub")
+    answerer.client = OllamaClient(host=url, retries=0)
+    return answerer
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_generate_stream_yields_fragments_in_order(ollama_stub):
+    ollama_stub.pieces = PIECES
+    client = OllamaClient(host=ollama_stub.url)
+    assert list(client.generate_stream("stub", "q")) == PIECES
+    assert list(client.generate_stream("stub", "q")) == PIECES
+    assert ollama_stub.connections == 1  # the drained stream's connection is reused
+
+
+def test_compose_stream_reports_citations_split_across_fragments(ollama_stub):
+    ollama_stub.pieces = PIECES
+    events = list(_answerer(ollama_stub.url).compose_stream("How did revenue do?", CONTEXTS))
+    kinds = [e for e, _ in events]
+    assert "".join(d["text"] for e, d in events if e == "token") == "".join(PIECES)
+    # "[1]" completes with the 4th fragment and "[2]" with the 5th; each is reported right after it.
+    assert kinds == ["token", "token", "token", "token", "citation", "token", "citation", "done"]
+    cites = [d for e, d in events if e == "citation"]
+    assert cites == [{"source": "a.txt", "line": 3}, {"source": "b.txt", "line": 7}]
+    assert events[-1][1]["answer"] == "".join(PIECES) and events[-1][1]["citations"] == cites
+
+
+def _sse(chunks):
+    out = []
+    for chunk in chunks:
+        head, data = chunk.decode().strip().split("\n")
+        out.append((head[len("event: "):], json.loads(data[len("data: "):])))
+    return out
+
+
+@pytest.fixture
+def rag_server(monkeypatch):
+    rag_server = pytest.importorskip("server.rag_server")
+    monkeypatch.setattr(rag_server.APP.rag, "evaluator", None)
+    return rag_server
+
+
+def test_sse_event_order_with_ollama(ollama_stub, rag_server, monkeypatch):
+    ollama_stub.pieces = PIECES
+    monkeypatch.setattr(rag_server.APP.rag, "answerer", _answerer(ollama_stub.url))
+    events = _sse(rag_server.sse_events("How did revenue do?"))
+    kinds = [e for e, _ in events]
+    assert kinds[0] == "contexts" and kinds[-1] == "done"
+    assert kinds.index("token") < kinds.index("citation")
+    assert set(kinds[1:-1]) <= {"token", "citation"}
+    assert "".join(d["text"] for e, d in events if e == "token") == "".join(PIECES)
+
+
+def test_sse_error_event_when_ollama_is_down(rag_server, monkeypatch):
+    monkeypatch.setattr(rag_server.APP.rag, "answerer", _answerer(f"http://127.0.0.1:{_free_port()}"))
+    events = _sse(rag_server.sse_events("How did revenue do?"))
+    assert [e for e, _ in events] == ["contexts", "error"]
+    assert "Failed to reach Ollama" in events[-1][1]["error"]
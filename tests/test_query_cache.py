@@ -0,0 +1,61 @@
+import json
+import time
+
+import pytest
+
+from eval.metrics import AsyncEvaluator
+from monitoring.metrics_stub import MetricsStub
+from rag.cache import QueryCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    metrics = MetricsStub()
+    cache = QueryCache(maxsize=2, metrics=metrics)
+    cache.put("a", 1, "A")
+    cache.put("b", 1, "B")
+    assert cache.get("a", 1) == "A"  # "b" is now the oldest
+    cache.put("c", 1, "C")
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "A" and cache.get("c", 1) == "C"
+    assert metrics.counters["query_cache.eviction"] == 1
+
+
+def test_entries_miss_on_another_version_or_after_ttl():
+    metrics = MetricsStub()
+    cache = QueryCache(ttl=0.05, metrics=metrics)
+    cache.put("a", 1, "A")
+    assert cache.get("a", 2) is None
+    assert len(cache) == 0
+    cache.put("a", 2, "A")
+    time.sleep(0.06)
+    assert cache.get("a", 2) is None
+    assert metrics.counters["query_cache.invalidation"] == 1
+    assert metrics.counters["query_cache.expired"] == 1
+
+
+@pytest.fixture
+def rag_server():
+    return pytest.importorskip("server.rag_server")
+
+
+def test_app_cache_key_ignores_whitespace_but_not_case(rag_server):
+    key = rag_server.RagApp._key
+    assert key("What  was\trevenue? ", 4, None) == key("What was revenue?", 4, None)
+    assert key("What was revenue?", 4, None) != key("what was revenue?", 4, None)
+
+
+def test_async_cache_hits_get_their_own_eval_id(rag_server, tmp_path):
+    log = tmp_path / "responses.jsonl"
+    evaluator = AsyncEvaluator(log)
+    app = rag_server.RagApp(index_path=tmp_path / "docstore.idx", evaluator=evaluator)
+    first = app.answer("What was revenue growth?")
+    again, = app.answer_many(["What was  revenue growth?"])
+    assert app.metrics.counters["query_cache.hit"] == 1
+    assert again["answer"] == first["answer"]
+    ids = [first["metrics"]["eval_id"], again["metrics"]["eval_id"]]
+    assert ids[0] != ids[1]
+    evaluator.flush()
+    logged = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [r["eval_id"] for r in logged] == ids
+    assert logged[0]["metrics"] == logged[1]["metrics"]
+    evaluator.close()
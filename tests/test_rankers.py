@@ -0,0 +1,90 @@
+import math
+from collections import Counter
+
+import pytest
+
+from rag.rankers import BM25PlusRanker, BM25Ranker, CosineRanker, FusionRanker, make_ranker
+from rag.vector_store import DocumentStore
+from utils.text import tokenize
+
+DOCS = [
+    "Revenue grew 12% on strong demand. Margins expanded as input costs eased.",
+    "Credit risk rose as rates climbed. The bank raised its loan loss reserves.",
+    "The board approved a dividend increase and a share buyback program.",
+    "Liquidity stayed strong with ample cash on hand and undrawn credit lines.",
+    "Demand for credit grew as rates fell; revenue from lending rose with demand.",
+]
+QUERY = "credit demand revenue"
+
+
+@pytest.fixture
+def store():
+    store = DocumentStore(chunk_size=10, chunk_overlap=2)
+    store.fit(DOCS)
+    return store
+
+
+def _bm25_reference(store, query, k1=1.2, b=0.75, delta=0.0):
+    chunks = [Counter(tokenize(d["text"])) for d in store.docs]
+    avgdl = sum(sum(c.values()) for c in chunks) / len(chunks)
+    out = {}
+    for i, counts in enumerate(chunks):
+        dl = sum(counts.values())
+        score = 0.0
+        for t, qtf in Counter(tokenize(query)).items():
+            if not counts[t]:
+                continue
+            df = sum(1 for c in chunks if c[t])
+            idf = math.log(1.0 + (len(chunks) - df + 0.5) / (df + 0.5))
+            tf = counts[t]
+            score += qtf * idf * (tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)) + delta)
+        if score:
+            out[i] = score
+    return out
+
+
+@pytest.mark.parametrize("ranker, delta", [(BM25Ranker(), 0.0), (BM25PlusRanker(), 1.0)])
+def test_bm25_matches_the_textbook_formula(store, ranker, delta):
+    got = ranker.scores(store, tokenize(QUERY))
+    want = _bm25_reference(store, QUERY, delta=delta)
+    assert got.keys() == want.keys()
+    for i in want:
+        assert got[i] == pytest.approx(want[i])
+
+
+def test_rrf_fusion_sums_reciprocal_ranks(store):
+    tokens = tokenize(QUERY)
+    runs = [r.scores(store, tokens) for r in (BM25Ranker(), CosineRanker())]
+    want = {}
+    for run, weight in zip(runs, (2.0, 1.0)):
+        for rank, i in enumerate(sorted(run, key=lambda i: (-run[i], i)), 1):
+            want[i] = want.get(i, 0.0) + weight / (60 + rank)
+    fused = FusionRanker([BM25Ranker(), CosineRanker()], weights=[2.0, 1.0]).scores(store, tokens)
+    assert fused == pytest.approx(want)
+
+
+def test_weighted_fusion_scales_each_ranker_to_its_best_match(store):
+    tokens = tokenize(QUERY)
+    fused = make_ranker("weighted:bm25=0.7,cosine=0.3").scores(store, tokens)
+    assert max(fused.values()) <= 1.0 + 1e-9
+    bm25 = BM25Ranker().scores(store, tokens)
+    cosine = CosineRanker().scores(store, tokens)
+    i = next(iter(bm25))
+    assert fused[i] == pytest.approx(0.7 * bm25[i] / max(bm25.values()) + 0.3 * cosine[i] / max(cosine.values()))
+
+
+def test_store_query_uses_the_given_ranker(store):
+    hits = store.query(QUERY, top_k=3, ranker=BM25Ranker())
+    scores = _bm25_reference(store, QUERY)
+    best = sorted(scores, key=lambda i: (-scores[i], i))[:3]
+    assert [doc["text"] for _, doc in hits] == [store.docs[i]["text"] for i in best]
+
+
+def test_make_ranker_specs():
+    assert isinstance(make_ranker("bm25+"), BM25PlusRanker)
+    fusion = make_ranker("rrf:bm25,cosine=0.5")
+    assert isinstance(fusion, FusionRanker) and fusion.method == "rrf" and fusion.weights == [1.0, 0.5]
+    with pytest.raises(ValueError):
+        make_ranker("tfidf")
+    with pytest.raises(ValueError):
+        make_ranker("max:bm25,cosine")
@@ -0,0 +1,27 @@
+import gc
+import weakref
+
+from rag.records import chunk_document
+
+
+def test_chunk_text_is_whitespace_normalised_with_source_lines():
+    text = "Alpha beta gamma.\nDelta   eps zeta.\tEta theta.\n\nIota kappa."
+    for mode in ("words", "sentence", "paragraph"):
+        for ch in chunk_document(text, 5, 1, {}, mode):
+            assert ch.text == " ".join(ch.text.split())
+            sents = ch.sentences
+            for n in range(len(sents)):
+                # Sentence spans index the normalised text; lines are source lines.
+                sent = sents.sentence(n)
+                assert sent and sent in ch.text
+                assert sents.lines[n] == next(i for i, line in enumerate(text.split("\n"), 1)
+                                              if sent.split()[0] in line.split())
+
+
+def test_sentence_cache_does_not_keep_chunks_alive():
+    chunks = list(chunk_document("Alpha beta gamma. Delta eps zeta. Eta theta iota.", 4, 1))
+    assert chunks[0].sentences is chunks[0].sentences  # prepared once
+    refs = [weakref.ref(ch) for ch in chunks]
+    del chunks
+    gc.collect()
+    assert all(ref() is None for ref in refs)
@@ -0,0 +1,44 @@
+from llm.ollama_client import OllamaAnswerer, OllamaClient
+from llm.response_cache import ResponseCache
+from monitoring.metrics_stub import MetricsStub
+
+REVENUE = {"source": "a.txt", "text": "Revenue grew twelve percent.", "line": 1}
+CREDIT = {"source": "b.txt", "text": "Credit risk rose as rates climbed.", "line": 4}
+
+
+def test_exact_and_near_hits_stay_within_a_group(tmp_path):
+    metrics = MetricsStub()
+    cache = ResponseCache(tmp_path / "llm.sqlite3", near_threshold=0.5, metrics=metrics)
+    cache.put("k1", "g1", "how did revenue grow", "Twelve percent [1].")
+    assert cache.get("k1") == ("Twelve percent [1].", "exact")
+    assert cache.get("k2", "g1", "how fast did revenue grow") == ("Twelve percent [1].", "near")
+    assert cache.get("k2", "g2", "how fast did revenue grow") is None  # other contexts
+    assert cache.get("k2", "g1", "what about credit risk") is None
+    assert metrics.counters["llm_cache.near_hit"] == 1 and metrics.counters["llm_cache.miss"] == 2
+    # Entries persist in the file.
+    assert ResponseCache(tmp_path / "llm.sqlite3").get("k1") == ("Twelve percent [1].", "exact")
+
+
+def test_least_recently_used_answers_are_evicted_past_max_bytes(tmp_path):
+    cache = ResponseCache(tmp_path / "llm.sqlite3", max_bytes=25)
+    cache.put("k1", "g", "q1", "a" * 10)
+    cache.put("k2", "g", "q2", "b" * 10)
+    assert cache.get("k1") is not None  # k2 is now the least recently used
+    cache.put("k3", "g", "q3", "c" * 10)
+    assert cache.get("k2") is None
+    assert cache.get("k1") is not None and cache.get("k3") is not None
+    assert len(cache) == 2
+
+
+def test_answerer_reuses_answers_across_context_order_and_question_case(ollama_stub, tmp_path):
+    ollama_stub.pieces = ["Revenue grew [1]", " while credit risk rose [2]."]
+    answerer = OllamaAnswerer(model="stub", cache=ResponseCache(tmp_path / "llm.sqlite3"))
+    answerer.client = OllamaClient(host=ollama_stub.url)
+    first = list(answerer.compose_stream("Revenue and credit?", [dict(REVENUE, score=0.9), dict(CREDIT, score=0.5)]))
+    assert first[-1][1]["llm_cache"] == "miss"
+    again = answerer.compose("  revenue AND credit? ", [dict(REVENUE, score=0.4), dict(CREDIT, score=0.8)])
+    assert ollama_stub.requests == 1
+    assert again["llm_cache"] == "hit"
+    # Credit now comes first in the prompt, so the markers are renumbered to match.
+    assert again["answer"] == "Revenue grew [2] while credit risk rose [1]."
+    assert [c["source"] for c in again["citations"]] == ["a.txt", "b.txt"]
@@ -0,0 +1,33 @@
+import random
+
+from rag.rankers import BM25Ranker
+from rag.sharded import ShardedDocumentStore
+from rag.vector_store import DocumentStore
+
+WORDS = ("revenue margin growth dividend risk rate credit equity bond cash flow "
+         "liquidity guidance outlook segment inflation demand supply").split()
+QUERIES = ["revenue growth", "credit risk", "dividend cash flow", "inflation demand outlook"]
+
+
+def corpus(n=16, seed=3):
+    rng = random.Random(seed)
+    docs = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 400))) for _ in range(n)]
+    return docs, [{"source": f"doc{i}.txt"} for i in range(n)]
+
+
+def scores(store, ranker):
+    return [[round(s, 9) for s, _ in store.query(q, 5, ranker)] for q in QUERIES]
+
+
+def test_bm25_matches_single_store_after_compacting_removals():
+    docs, meta = corpus()
+    single = DocumentStore(chunk_size=40, chunk_overlap=5)
+    single.fit(docs, meta)
+    with ShardedDocumentStore(2, chunk_size=40, chunk_overlap=5) as sharded:
+        sharded.fit(docs, meta)
+        # Removing most sources pushes every shard past compact_ratio.
+        for m in meta[:11]:
+            single.remove_documents(m["source"])
+            sharded.remove_documents(m["source"])
+            assert scores(sharded, BM25Ranker()) == scores(single, BM25Ranker())
+        assert sharded.num_docs == single.num_docs
@@ -0,0 +1,24 @@
+import re
+
+from utils.text import tokenize, tokenize_many
+
+SAMPLES = [
+    "Revenue grew 12% YoY; EPS_diluted rose to $3.40 (Q4-2023).",
+    "Net income — “adjusted” – rose sharply… it’s up.",
+    "Café sales in Zürich: €4.2m, ÉTATS-UNIS +3%.",
+    "收入增长 12%, Δ margin = 0.5pp",
+    "",
+    "   \t\n",
+]
+
+
+def test_tokenize_matches_the_regex_definition():
+    for text in SAMPLES:
+        assert tokenize(text) == re.findall(r"[^\W_]+", text.lower()), text
+
+
+def test_tokenize_many_matches_tokenize_and_interns():
+    batch = tokenize_many(SAMPLES)
+    assert batch == [tokenize(t) for t in SAMPLES]
+    a, b = tokenize("revenue"), tokenize("Revenue!")
+    assert a[0] is b[0]
@@ -0,0 +1,49 @@
+import datetime
+
+from rag.vector_store import DocumentStore
+
+DOCS = [
+    "Revenue grew 12% on strong demand. Margins expanded as input costs eased.",
+    "Credit risk rose as rates climbed. The bank raised its loan loss reserves.",
+    "The board approved a dividend increase and a share buyback program.",
+]
+
+
+def test_fit_accepts_metadata_that_is_not_json_serialisable():
+    day = datetime.date(2024, 3, 31)
+    metas = [{"source": "a", "date": day}, {"source": "b", "tags": ["credit", "rates"]},
+             {"source": "a", "date": day}]
+    store = DocumentStore(chunk_size=8, chunk_overlap=2)
+    store.fit(DOCS, metas)
+    by_source = {d["meta"]["source"]: d["meta"] for d in store.docs}
+    assert by_source["a"]["date"] == day and by_source["b"]["tags"] == ["credit", "rates"]
+    # Equal hashable metadata is still shared; 1 and True stay distinct.
+    assert store.docs[0]["meta"] is store.docs[-1]["meta"]
+    store.fit(DOCS[:2], [{"n": 1}, {"n": True}])
+    assert [type(d["meta"]["n"]) for d in store.docs if d is not None][-1] is bool
+
+
+def _ranked(store, query, k=5, ranker=None):
+    return [(round(s, 9), d["text"]) for s, d in store.query(query, k, ranker)]
+
+
+def test_incremental_updates_match_a_fresh_fit():
+    from rag.rankers import BM25Ranker
+    extra = ["Liquidity stayed strong with ample cash on hand and undrawn credit lines.",
+             "Guidance for next year assumes moderate demand growth and stable margins."]
+    queries = ["revenue demand", "credit rates", "cash dividend", "margins growth guidance"]
+    store = DocumentStore(chunk_size=8, chunk_overlap=2)
+    store.fit(DOCS, [{"source": f"d{i}"} for i in range(3)])
+    store.add_documents(extra, [{"source": "e0"}, {"source": "e1"}])
+    store.remove_documents("d1")
+    store.update_document("d2", "The board cut the dividend to preserve cash.")
+    fresh = DocumentStore(chunk_size=8, chunk_overlap=2)
+    fresh.fit([DOCS[0], extra[0], extra[1], "The board cut the dividend to preserve cash."],
+              [{"source": "d0"}, {"source": "e0"}, {"source": "e1"}, {"source": "d2"}])
+    for q in queries:
+        for ranker in (None, BM25Ranker()):
+            assert _ranked(store, q, ranker=ranker) == _ranked(fresh, q, ranker=ranker)
+    store.compact()
+    assert not store._deleted and len(store.docs) == len(fresh.docs)
+    for q in queries:
+        assert _ranked(store, q) == _ranked(fresh, q)